@@ -15,7 +15,12 @@ setuptools.setup(
     python_requires='>=3.8',
     entry_points={
         'console_scripts': [
-            'sinolify-convert = sinolify.tools.convert:main'
+            'sinolify-convert = sinolify.tools.convert:main',
+            'sinolify-batch-convert = sinolify.tools.batch:main',
+            'sinolify-cache = sinolify.tools.cache:main',
+            'sinolify-bench = sinolify.tools.bench:main',
+            'sinolify-matrix = sinolify.tools.matrix:main',
+            'sinolify-daemon = sinolify.tools.daemon:main'
         ]
     },
 )
\ No newline at end of file
@@ -0,0 +1,154 @@
+import os
+import random
+import zipfile
+from typing import Iterable, List
+
+SOLUTION = '''#include <cstdio>
+
+int main() {
+    long long sum = 0, x;
+    while (scanf("%lld", &x) == 1)
+        sum += x;
+    printf("%lld\\n", sum);
+    return 0;
+}
+'''
+""" A trivial solution summing the numbers of an input, run time is linear in input size. """
+
+_CHECKER = '''#include <cstdio>
+#include <cstdlib>
+
+// Checker {k}
+const int LIMIT_{k} = {limit};
+
+int {name}(FILE *out, FILE *ans) {{
+    long long a, b;
+    if (fscanf(out, "%lld", &a) != 1) return {wrong};
+    if (fscanf(ans, "%lld", &b) != 1) return {fail};
+    if (a < -LIMIT_{k} || a > LIMIT_{k}) return {wrong};
+    return a == b ? 0 : {wrong};
+}}
+
+int main(int argc, char **argv) {{
+    FILE *out = fopen(argv[{out}], "r"), *ans = fopen(argv[{ans}], "r");
+    int verdict = {name}(out, ans);
+{extra}    printf(verdict ? "WRONG\\n" : "OK\\n");
+    return verdict;
+}}
+'''
+
+
+def checker_source(rng: random.Random, k: int) -> str:
+    """ Generates source code of a synthetic checker.
+
+    :param rng: Random generator used to vary the code.
+
+    :param k: Number of the checker, making its code unique.
+    """
+    extra = ''.join(f'    if (verdict == {rng.randrange(100)}) fprintf(stderr, "case {i}\\n");\n'
+                    for i in range(rng.randrange(20)))
+    return _CHECKER.format(k=k, limit=rng.randrange(10**9), name=f'check_{rng.randrange(10**6)}',
+                           wrong=rng.randrange(1, 4), fail=rng.randrange(4, 8),
+                           out=rng.randrange(1, 3), ans=rng.randrange(3, 5), extra=extra)
+
+
+def _numbers(rng: random.Random, size: int) -> List[int]:
+    """ Generates random numbers taking about `size` bytes as text. """
+    numbers = []
+    while size > 0:
+        numbers.append(rng.randrange(10**9))
+        size -= len(str(numbers[-1])) + 1
+    return numbers
+
+
+def _random_bytes(rng: random.Random, size: int) -> bytes:
+    """ Generates incompressible contents, e.g. of a PDF statement. """
+    return rng.getrandbits(8 * size).to_bytes(size, 'little')
+
+
+def synthetic_test_names(id: str, tests: int) -> List[str]:
+    """ Returns names of synthetic tests, e.g. `abc1a`, in groups of three. """
+    return [f'{id}{i // 3 + 1}{"abc"[i % 3]}' for i in range(tests)]
+
+
+def generate_package(path: str, *, id: str = 'syn', tests: int = 30, input_size: int = 64 << 10,
+                     solutions: int = 3, docs: int = 2, doc_size: int = 256 << 10,
+                     checker: bool = True, seed: int = 0) -> str:
+    """ Generates a synthetic Sowa package.
+
+    Sizes of the inputs grow linearly with the test number, averaging
+    `input_size`. The outputs are the answers of `SOLUTION`.
+
+    :param path: Path of the .zip file to create.
+
+    :param id: Task ID.
+
+    :param tests: Number of tests.
+
+    :param input_size: Average input size in bytes.
+
+    :param solutions: Number of solutions, including the main one.
+
+    :param docs: Number of extra files in desc/.
+
+    :param doc_size: Size of the statement and the extra files in bytes.
+
+    :param checker: If set, the package contains a checker, see
+        `checker_source` with seed `seed` and number 0.
+
+    :param seed: Seed of the random generator.
+
+    :return: `path`
+    """
+    rng = random.Random(seed)
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        for i, name in enumerate(synthetic_test_names(id, tests)):
+            numbers = _numbers(rng, 2 * input_size * (i + 1) // (tests + 1))
+            z.writestr(f'{id}/in/{name}.in', '\n'.join(map(str, numbers)) + '\n')
+            z.writestr(f'{id}/out/{name}.out', f'{sum(numbers)}\n')
+        z.writestr(f'{id}/sol/{id}.cpp', SOLUTION)
+        for k in range(1, solutions):
+            z.writestr(f'{id}/sol/{id}s{k}.cpp', f'// Solution {k}\n' + SOLUTION)
+        z.writestr(f'{id}/doc/{id}.pdf', _random_bytes(rng, doc_size))
+        z.writestr(f'{id}/desc/{id}.tex', '\\documentclass{article}\n\\title{Synthetic task}\n'
+                                          '\\begin{document}\n\\maketitle\n\\end{document}\n')
+        for k in range(docs):
+            z.writestr(f'{id}/desc/figure{k}.png', _random_bytes(rng, doc_size))
+        if checker:
+            z.writestr(f'{id}/check/{id}chk.cpp', checker_source(random.Random(seed), 0))
+        z.writestr(f'{id}/utils/gen.cpp', '// Test generator\nint main() {}\n')
+        z.writestr(f'{id}/Makefile', 'all:\n\ttrue\n')
+        z.writestr(f'{id}/.sowa-sign', '')
+    return path
+
+
+def generate_mapping(directory: str, *, checkers: int = 1000, seed: int = 0,
+                     include: Iterable[str] = ()) -> str:
+    """ Generates a checker mapping directory with find/ and replace/.
+
+    :param directory: Directory to create the mapping in.
+
+    :param checkers: Number of synthetic checkers.
+
+    :param seed: Seed of the random generator. Checker number 0 is the
+        checker of packages generated with the same seed.
+
+    :param include: Paths of extra checkers to map.
+
+    :return: `directory`
+    """
+    rng = random.Random(seed)
+    find = os.path.join(directory, 'find')
+    replace = os.path.join(directory, 'replace')
+    os.makedirs(find, exist_ok=True)
+    os.makedirs(replace, exist_ok=True)
+    sources = [(f'checker{k}.cpp', checker_source(random.Random(seed) if k == 0 else rng, k))
+               for k in range(checkers)]
+    for path in include:
+        with open(path) as f:
+            sources.append((os.path.basename(path), f.read()))
+    for name, source in sources:
+        for d in (find, replace):
+            with open(os.path.join(d, name), 'w') as f:
+                f.write(source)
+    return directory
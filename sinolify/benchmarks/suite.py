@@ -0,0 +1,249 @@
+import os
+import random
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from sinolify.benchmarks.generator import SOLUTION, checker_source, generate_mapping, generate_package
+from sinolify.converters.mapping import ConversionMapping
+from sinolify.converters.sowa import SowaToSinolConverter
+from sinolify.executors.compilers import CppCompiler
+from sinolify.executors.timer import NativeTimer, TimerPool, default_timer
+from sinolify.utils.package import Package
+from sinolify.utils.system import NotInstalledError, where
+
+_FIND_PATTERNS = [r'in/syn\d+[a-z]*.in', r'out/syn\d+[a-z]*.out', r'sol/syn\.(?:cpp|c|cc|pas)',
+                  r'sol/syn.+\.(?:cpp|c|cc|pas)', r'doc/syn\.pdf', r'desc/syn\.tex', r'desc/.*\.(?:pdf|tex|png)',
+                  r'check/.*\.(?:cpp|c|cc|pas)', r'utils/.*', r'.*(~|\.swp|\.backup|\.bak)', r'(.*/)?Makefile(\.in)?',
+                  r'(sol|check)/.*(\.o|_PAS|_CPP|_C|\.out)', r'[^/]*\.(?:cpp|c|cc|pas)', r'.*']
+""" Patterns looked up by a typical conversion. """
+
+
+class Skipped(Exception):
+    """ Raised by a benchmark which can not run on this machine. """
+
+
+class Comparison(NamedTuple):
+    """ A benchmark result compared with a baseline. """
+    name: str
+    seconds: float
+    baseline: float
+    ratio: float
+    regression: bool
+
+
+class BenchmarkSuite:
+    """ Times sinolify operations on a synthetic Sowa package and mapping.
+
+    Every benchmark is repeated and reports the best wall time in `seconds`,
+    along with benchmark specific metrics. Benchmarks running solutions are
+    skipped if g++ is missing, or if neither an instruction counter nor perf
+    is available.
+    """
+
+    def __init__(self, directory: str, *, tests: int = 30, input_size: int = 64 << 10,
+                 checkers: int = 1000, repeat: int = 3, threads: int = 1):
+        """ Instantiates a suite.
+
+        :param directory: Working directory for generated files.
+
+        :param tests: Number of tests of the package.
+
+        :param input_size: Average input size in bytes.
+
+        :param checkers: Number of checkers in the mapping.
+
+        :param repeat: Number of runs of every benchmark.
+
+        :param threads: Number of threads used to save packages and run solutions.
+        """
+        self.directory = directory
+        self.tests = tests
+        self.input_size = input_size
+        self.checkers = checkers
+        self.repeat = repeat
+        self.threads = threads
+        self.package = os.path.join(directory, 'syn.zip')
+        self.mapping = os.path.join(directory, 'mapping')
+        self.output = os.path.join(directory, 'output.zip')
+        self._generated = False
+
+    def options(self) -> Dict[str, int]:
+        """ Returns the options the results depend on. """
+        return {'tests': self.tests, 'input_size': self.input_size, 'checkers': self.checkers,
+                'repeat': self.repeat, 'threads': self.threads}
+
+    def generate(self) -> None:
+        """ Generates the package and the mapping, unless already done. """
+        if not self._generated:
+            generate_package(self.package, tests=self.tests, input_size=self.input_size)
+            generate_mapping(self.mapping, checkers=self.checkers)
+            self._generated = True
+
+    def _best(self, run: Callable[[], None], setup: Callable[[], None] = (lambda: None)) -> float:
+        """ Returns the best wall time of `run` over repeats, calling `setup` untimed before each. """
+        best = float('inf')
+        for _ in range(self.repeat):
+            setup()
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def _require_timer(self) -> None:
+        """ Raises `Skipped` if solutions can not be compiled or measured. """
+        try:
+            where('g++')
+        except NotInstalledError:
+            raise Skipped('g++ is not installed')
+        if not NativeTimer.available():
+            try:
+                where('perf')
+            except NotInstalledError:
+                raise Skipped('no instruction counter and perf is not installed')
+
+    def bench_package_load(self) -> Dict[str, float]:
+        """ Loads the package without extracting it. """
+        return {'seconds': self._best(lambda: Package(zip=self.package, lazy=True))}
+
+    def bench_package_extract(self) -> Dict[str, float]:
+        """ Loads the package extracting all files. """
+        return {'seconds': self._best(lambda: Package(zip=self.package))}
+
+    def bench_package_find(self) -> Dict[str, float]:
+        """ Looks up the paths a conversion looks up, 100 times. """
+        package = Package(zip=self.package, lazy=True)
+
+        def run():
+            for _ in range(100):
+                for pattern in _FIND_PATTERNS:
+                    for _ in package.find(pattern):
+                        pass
+        return {'seconds': self._best(run), 'lookups': 100 * len(_FIND_PATTERNS)}
+
+    def _copy(self, source: Package) -> Package:
+        target = Package(id=source.id)
+        for p in source.find('.*'):
+            target.add_from(source, p, p)
+        return target
+
+    def bench_package_save_raw(self) -> Dict[str, float]:
+        """ Saves a copy of the lazily loaded package, copying compressed members. """
+        target = self._copy(Package(zip=self.package, lazy=True))
+        seconds = self._best(lambda: target.save(self.output, overwrite=True, threads=self.threads))
+        return {'seconds': seconds, 'mb_per_second': os.path.getsize(self.output) / 2**20 / seconds}
+
+    def bench_package_save(self) -> Dict[str, float]:
+        """ Saves a copy of the extracted package, compressing all files. """
+        target = self._copy(Package(zip=self.package))
+        seconds = self._best(lambda: target.save(self.output, overwrite=True, threads=self.threads))
+        return {'seconds': seconds, 'mb_per_second': os.path.getsize(self.output) / 2**20 / seconds}
+
+    def _convert(self, checkers: ConversionMapping, **kwargs) -> None:
+        source = Package(zip=self.package, lazy=True)
+        target = Package(id=source.id)
+        SowaToSinolConverter(source, target, checkers=checkers, threads=self.threads, **kwargs).convert()
+        target.save(self.output, overwrite=True, threads=self.threads)
+
+    def bench_convert(self) -> Dict[str, float]:
+        """ Converts the package without time limits. """
+        checkers = self._build_mapping()
+        return {'seconds': self._best(lambda: self._convert(checkers, auto_time_limits=False))}
+
+    def bench_convert_time_limits(self) -> Dict[str, float]:
+        """ Converts the package measuring time limits, without caches. """
+        self._require_timer()
+        checkers = self._build_mapping()
+        return {'seconds': self._best(lambda: self._convert(checkers, cache=False))}
+
+    def _remove_index(self) -> None:
+        index = os.path.join(self.mapping, 'find.index.json')
+        if os.path.exists(index):
+            os.remove(index)
+
+    def _build_mapping(self) -> ConversionMapping:
+        return ConversionMapping(os.path.join(self.mapping, 'find'), os.path.join(self.mapping, 'replace'))
+
+    def bench_mapping_build(self) -> Dict[str, float]:
+        """ Builds the mapping without an index. """
+        return {'seconds': self._best(self._build_mapping, self._remove_index), 'checkers': self.checkers}
+
+    def bench_mapping_build_indexed(self) -> Dict[str, float]:
+        """ Builds the mapping with an up to date index. """
+        self._build_mapping()
+        return {'seconds': self._best(self._build_mapping), 'checkers': self.checkers}
+
+    def bench_mapping_lookup(self) -> Dict[str, float]:
+        """ Looks up a mapped checker and 20 unknown ones, with their near duplicates. """
+        mapping = self._build_mapping()
+        rng = random.Random(1)
+        paths = []
+        for k in range(21):
+            paths.append(os.path.join(self.directory, f'lookup{k}.cpp'))
+            with open(paths[-1], 'w') as f:
+                f.write(checker_source(random.Random(0) if k == 0 else rng, -k))
+
+        def run():
+            for path in paths:
+                try:
+                    mapping.find(path)
+                except ConversionMapping.FindError:
+                    mapping.similar(path)
+        return {'seconds': self._best(run), 'lookups': len(paths)}
+
+    def bench_timer_pool(self) -> Dict[str, float]:
+        """ Measures the trivial solution on all inputs. """
+        self._require_timer()
+        source = Package(zip=self.package)
+        inputs = [source.abspath(p) for p in source.find(r'in/.*\.in')]
+        solution = os.path.join(self.directory, 'solution.cpp')
+        with open(solution, 'w') as f:
+            f.write(SOLUTION)
+        c = CppCompiler(solution)
+        if not c.compile():
+            raise Skipped(f'compilation failed: {c.log}')
+        pool = TimerPool(default_timer(c.exe_path), threads=self.threads)
+        seconds = self._best(lambda: pool.run(inputs))
+        return {'seconds': seconds, 'runs_per_second': len(inputs) / seconds}
+
+    def benchmarks(self) -> Dict[str, Callable[[], Dict[str, float]]]:
+        """ Returns all benchmarks by name. """
+        return {name[len('bench_'):]: getattr(self, name) for name in dir(self) if name.startswith('bench_')}
+
+    def run(self, names: Optional[List[str]] = None,
+            progress: Callable[[str, dict], None] = (lambda name, result: None)) -> Dict[str, dict]:
+        """ Runs benchmarks.
+
+        :param names: Names of the benchmarks to run, all by default.
+
+        :param progress: Called with the name and the result of every benchmark.
+
+        :return: Results by benchmark name. Skipped benchmarks have the reason
+            in `skipped`.
+        """
+        self.generate()
+        results = {}
+        for name, benchmark in self.benchmarks().items():
+            if names and name not in names:
+                continue
+            try:
+                results[name] = benchmark()
+            except Skipped as e:
+                results[name] = {'skipped': str(e)}
+            progress(name, results[name])
+        return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = 0.2) -> List[Comparison]:
+    """ Compares results with a baseline.
+
+    :param threshold: Relative slowdown considered a regression.
+
+    :return: Comparisons of benchmarks with times in both results.
+    """
+    comparisons = []
+    for name, result in results.items():
+        if 'seconds' in result and 'seconds' in baseline.get(name, {}):
+            ratio = result['seconds'] / max(baseline[name]['seconds'], 1e-9)
+            comparisons.append(Comparison(name, result['seconds'], baseline[name]['seconds'], ratio,
+                                          ratio > 1 + threshold))
+    return comparisons
@@ -1,8 +1,90 @@
+import json
 import re
-from typing import Set, Generator, Callable, Optional
+import threading
+import zipfile
+from typing import Set, Generator, Callable, Optional, NamedTuple, Union, List, Tuple, Sequence, Dict, Any
 
 from sinolify.utils.log import log
-from sinolify.utils.package import Package
+from sinolify.utils.package import Package, _compile, _literal_prefix
+
+_MANIFEST_PREFIX = b'sinolify-manifest:'
+""" Prefix of a .zip file comment embedding a manifest. """
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """ Reads the manifest embedded in a .zip file by `dump_manifest`.
+
+    :return: The manifest, empty if the file or the manifest is missing or
+        unreadable.
+    """
+    try:
+        with zipfile.ZipFile(path) as zip:
+            comment = zip.comment
+        if comment.startswith(_MANIFEST_PREFIX):
+            return json.loads(comment[len(_MANIFEST_PREFIX):])
+    except (OSError, zipfile.BadZipFile, ValueError):
+        pass
+    return {}
+
+
+def dump_manifest(manifest: Dict[str, Any]) -> bytes:
+    """ Returns a .zip file comment embedding a manifest (see `ConverterBase.manifest`).
+
+    :return: The comment, empty if the manifest does not fit in a comment.
+    """
+    comment = _MANIFEST_PREFIX + json.dumps(manifest, sort_keys=True, separators=(',', ':')).encode()
+    if len(comment) > 0xFFFF:
+        log.warning('Manifest too long to embed in the output, the next conversion will not be incremental')
+        return b''
+    return comment
+
+
+class Rule(NamedTuple):
+    """ An entry of a rule table applied by `ConverterBase.apply`.
+
+    `pattern` is a regex matching local paths in the source package. Matched
+    paths are copied (`COPY`) or marked as processed (`IGNORE`). Copies are
+    renamed using `re.sub` with `rename` if it is a string, or by calling
+    `rename` if it is a function. If `ignore_processed` is set, paths already
+    marked as processed are skipped. `condition` is an extra condition
+    a matched path must satisfy.
+    """
+    pattern: str
+    action: str = 'copy'
+    rename: Union[str, Callable[[str], str], None] = None
+    ignore_processed: bool = False
+    condition: Optional[Callable[[str], bool]] = None
+
+    COPY = 'copy'
+    IGNORE = 'ignore'
+
+
+class _RuleMatcher:
+    """ Matches paths against all patterns of a rule table at once.
+
+    Paths matching none of the patterns are rejected with a single combined
+    regex, the remaining ones are checked against the patterns which literal
+    prefixes they start with.
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = [_compile(p) for p in patterns]
+        self.prefixes = [_literal_prefix(p) for p in patterns]
+        self.combined = patterns[0] if len(patterns) == 1 else '.*'
+        # Groups are renumbered when patterns are combined, so backreferences would break
+        if len(patterns) > 1 and not any(re.search(r'\\\d|\(\?P=', p) for p in patterns):
+            combined = '|'.join(f'(?:{p})' for p in patterns)
+            try:
+                _compile(combined)
+                self.combined = combined
+            except re.error:
+                pass
+
+    def match(self, path: str) -> Generator[int, None, None]:
+        """ Yields indices of the patterns fully matching `path`. """
+        for i, (pattern, prefix) in enumerate(zip(self.patterns, self.prefixes)):
+            if path.startswith(prefix) and pattern.fullmatch(path):
+                yield i
 
 
 class ConverterBase:
@@ -10,22 +92,35 @@ class ConverterBase:
 
     A converter is a utility intended to simplify operations required to build
     one package (target) based on another package (source). The converter keeps
-    track of the processed paths in the source package.
+    track of the processed paths in the source package. Its operations may be
+    called from multiple threads.
+
+    Converters may describe how parts of the target were derived in the
+    `manifest`, e.g. digests of the source files, which is embedded in the
+    output (see `dump_manifest`). The manifest of the previous output is
+    available as `previous`, so that unchanged parts can be reused.
     """
     _source: Package
     _target: Package
     _processed: Set[str]
+    report: List[Tuple[str, Rule, Optional[str]]]
 
-    def __init__(self, source: Package, target: Package):
+    def __init__(self, source: Package, target: Package, *, previous: Optional[Dict[str, Any]] = None):
         """ Instantiates a new converters.
 
         :param source: The source package.
 
         :param target: The target package.
+
+        :param previous: Manifest of the previous output, see `load_manifest`.
         """
         self._source = source
         self._target = target
+        self.previous = previous or {}
+        self.manifest = {}
         self._processed = set()
+        self._processed_lock = threading.Lock()
+        self.report = []
 
     def find(self, regex: str) -> Generator[str, None, None]:
         """ Yields all local paths in the source package matching the regex.
@@ -63,7 +158,59 @@ class ConverterBase:
 
         :param regex: Regular expression to match paths with.
         """
-        self._processed |= set(self.find(regex))
+        self.apply([Rule(regex, Rule.IGNORE)])
+
+    def apply(self, rules: Sequence[Rule]) -> List[int]:
+        """ Applies a rule table in a single pass over the source package.
+
+        The result is the same as of applying the rules one by one (with
+        `copy`, `copy_rename` and `ignore`), since a rule only depends on
+        whether earlier rules marked the same path as processed. Applied
+        rules are appended to `report` as (source path, rule, target path)
+        triples, with no target path for ignored files.
+
+        :param rules: Ordered rule table.
+
+        :return: Numbers of files copied or ignored by each rule.
+        """
+        if not rules:
+            return []
+        matcher = _RuleMatcher([r.pattern for r in rules])
+        with self._processed_lock:
+            processed = set(self._processed)
+        actions = []
+        for path in self._source.find(matcher.combined):
+            done = path in processed
+            for i in matcher.match(path):
+                rule = rules[i]
+                if (rule.condition and not rule.condition(path)) or (done and rule.ignore_processed):
+                    continue
+                actions.append((i, path))
+                done = True
+            if done:
+                processed.add(path)
+
+        counts = [0] * len(rules)
+        report = []
+        for i, path in sorted(actions):
+            rule = rules[i]
+            counts[i] += 1
+            if rule.action == Rule.IGNORE:
+                report.append((path, rule, None))
+                continue
+            if rule.rename is None:
+                target = path
+            elif isinstance(rule.rename, str):
+                target = matcher.patterns[i].sub(rule.rename, path)
+            else:
+                target = rule.rename(path)
+            log.debug('%s -> %s', path, target)
+            self._target.add_from(self._source, path, target)
+            report.append((path, rule, target))
+        with self._processed_lock:
+            self._processed |= {path for _, path in actions}
+            self.report += report
+        return counts
 
     def copy(self, regex: str,
              transform: Callable[[str], str] = (lambda path: path),
@@ -84,14 +231,7 @@ class ConverterBase:
 
         :return: Number of copied files.
         """
-        copied = 0
-        for path in self._source.find(regex):
-            if condition(path) and (path not in self._processed or not ignore_processed):
-                log.debug('%s -> %s', path, transform(path))
-                self._target.add(self._source.abspath(path), transform(path))
-                self._processed.add(path)
-                copied += 1
-        return copied
+        return self.apply([Rule(regex, Rule.COPY, transform, ignore_processed, condition)])[0]
 
     def copy_rename(self, regex: str, repl: str,
                     condition: Callable[[str], bool] = (lambda path: True),
@@ -113,12 +253,13 @@ class ConverterBase:
 
         :return: Number of files copied.
         """
-        transform = (lambda path: re.sub(regex, repl, path))
-        return self.copy(regex, transform, condition, ignore_processed)
+        return self.apply([Rule(regex, Rule.COPY, repl, ignore_processed, condition)])[0]
 
     def not_processed(self) -> Set[str]:
         """ Returns source paths that are not marked as processed.
 
         :return: Set of paths that are not yet processed.
         """
-        return set(self._source.find(rf'.*')) - self._processed
+        paths = set(self._source.find(rf'.*'))
+        with self._processed_lock:
+            return paths - self._processed
@@ -1,13 +1,107 @@
 import hashlib
+import json
 import os
+import random
+import re
 import shutil
-from typing import Dict, Optional
+import tempfile
+from typing import Dict, List, Optional, Set, Tuple
+
+_C_COMMENT_OR_STRING = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.S)
+_PASCAL_COMMENT_OR_STRING = re.compile(r'//[^\n]*|\{.*?\}|\(\*.*?\*\)|\'[^\'\n]*\'', re.S)
+_TOKEN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|\w+|\S|\s+')
+
+_JOINED = {'++', '--', '->', '<<', '>>', '<=', '>=', '==', '!=', '&&', '||', '+=', '-=', '*=', '/=', '%=',
+           '&=', '|=', '^=', '::', '##', '..', ':=', '<>', '//', '/*', '*/', '(*', '*)'}
+""" Pairs of characters which form a single C, C++ or Pascal token when adjacent. """
+
+_INDEX_VERSION = 2
+""" Version of the index file format, bumped when fingerprints change. """
+
+_SHINGLE_SIZE = 3
+_MINHASH_PRIME = (1 << 61) - 1
+_MINHASH_SIZE = 64
+_LSH_BANDS = 16
+_rng = random.Random(0x5171)
+_MINHASH_PERMUTATIONS = [(_rng.randrange(1, _MINHASH_PRIME), _rng.randrange(_MINHASH_PRIME))
+                         for _ in range(_MINHASH_SIZE)]
+del _rng
+
+
+
+
+def tokens(file_path: str) -> List[str]:
+    """ Splits a source file into tokens, dropping comments and whitespace.
+
+    Whitespace between two characters which would otherwise form a single
+    token is kept as a space token, e.g. `a+ +b` is not `a++b`.
+
+    Pascal sources (`.pas`) are recognized by extension and their
+    identifiers and keywords are lowercased.
+    """
+    with open(file_path, 'rb') as f:
+        text = f.read().decode('latin-1')
+    pascal = file_path.endswith('.pas')
+    pattern = _PASCAL_COMMENT_OR_STRING if pascal else _C_COMMENT_OR_STRING
+    text = pattern.sub(lambda m: m.group(0) if m.group(0)[0] in '"\'' else ' ', text)
+    result = []
+    space = False
+    for token in _TOKEN.findall(text):
+        if token.isspace():
+            space = True
+            continue
+        if space and result and result[-1] + token in _JOINED:
+            result.append(' ')
+        space = False
+        result.append(token)
+    if pascal:
+        result = [t if t[0] == "'" else t.lower() for t in result]
+    return result
+
+
+def fingerprint(file_path: str) -> Tuple[str, List[int]]:
+    """ Computes a normalized digest and a MinHash signature of a source file.
+
+    The normalized digest is equal for files differing only in comments
+    and whitespace. The signature is computed over shingles of consecutive
+    tokens and estimates their Jaccard similarity.
+    """
+    toks = tokens(file_path)
+    normalized = hashlib.blake2b('\0'.join(toks).encode('latin-1', 'replace'), digest_size=16).hexdigest()
+    shingles = {int.from_bytes(hashlib.blake2b('\0'.join(toks[i:i + _SHINGLE_SIZE]).encode('latin-1', 'replace'),
+                                               digest_size=8).digest(), 'little')
+                for i in range(max(len(toks) - _SHINGLE_SIZE + 1, 1))}
+    signature = [min((a * s + b) % _MINHASH_PRIME for s in shingles) for a, b in _MINHASH_PERMUTATIONS]
+    return normalized, signature
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    """ Estimates Jaccard similarity of two MinHash signatures. """
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def _bands(signature: List[int]) -> List[Tuple[int, Tuple[int, ...]]]:
+    rows = _MINHASH_SIZE // _LSH_BANDS
+    return [(i, tuple(signature[i * rows:(i + 1) * rows])) for i in range(_LSH_BANDS)]
 
 
 class ConversionMapping:
+    """ Maps files (e.g. checkers) to their replacements by contents.
+
+    Digests of the files in `find_directory` are kept in an index file next
+    to it (`<find_directory>.index.json`), holding size, modification time,
+    digest and token fingerprint of every file, and only changed files are
+    hashed again. Fingerprints match files differing only in comments and
+    whitespace, and a MinHash LSH index over them finds near duplicates.
+    """
     find_directory: str
     replace_directory: str
     map: Dict[str, str]
+    sizes: Set[int]
+    normalized: Dict[str, str]
+    signatures: Dict[str, List[int]]
+    buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]]
+    files: Dict[str, Tuple[int, int]]
 
     class FindError(BaseException):
         pass
@@ -22,19 +116,114 @@ class ConversionMapping:
 
     @staticmethod
     def hash(file_path: str) -> str:
-        return hashlib.md5(open(file_path, 'rb').read()).hexdigest()
+        h = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @property
+    def index_path(self) -> str:
+        """ Returns path of the index file. """
+        return os.path.normpath(self.find_directory) + '.index.json'
+
+    def load_index(self) -> Dict[str, dict]:
+        """ Loads the index, returning an empty one if it is missing or broken. """
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            return index['files'] if index.get('version') == _INDEX_VERSION else {}
+        except (OSError, ValueError, KeyError, AttributeError):
+            return {}
+
+    def save_index(self, index: Dict[str, dict]) -> None:
+        """ Atomically replaces the index file. """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.index_path), prefix='.index')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': _INDEX_VERSION, 'files': index}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """ Returns sizes and modification times of the files in the find directory by name. """
+        result = {}
+        for entry in os.scandir(self.find_directory):
+            if entry.is_file():
+                stat = entry.stat()
+                result[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return result
+
+    def _insert(self, path: str, entry: dict) -> None:
+        """ Adds a file of the find directory with its index entry to the mapping. """
+        self.files[os.path.basename(path)] = (entry['size'], entry['mtime'])
+        self.map[entry['digest']] = path
+        self.sizes.add(entry['size'])
+        self.normalized.setdefault(entry['normalized'], path)
+        self.signatures[path] = entry['minhash']
+        for band in _bands(entry['minhash']):
+            self.buckets.setdefault(band, []).append(path)
 
     def build_mapping(self):
         self.map = dict()
-        for filename in os.listdir(self.find_directory):
-            path = os.path.join(self.find_directory, filename)
-            self.map[self.hash(path)] = path
+        self.sizes = set()
+        self.normalized = dict()
+        self.signatures = dict()
+        self.buckets = dict()
+        self.files = dict()
+        old_index = self.load_index()
+        index = dict()
+        for entry in os.scandir(self.find_directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            cached = old_index.get(entry.name)
+            if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime_ns \
+                    and 'minhash' in cached:
+                index[entry.name] = cached
+            else:
+                normalized, signature = fingerprint(entry.path)
+                index[entry.name] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'digest': self.hash(entry.path),
+                                     'normalized': normalized, 'minhash': signature}
+            self._insert(entry.path, index[entry.name])
+        if index != old_index:
+            try:
+                self.save_index(index)
+            except OSError:
+                pass
+
+    def refresh(self) -> bool:
+        """ Rebuilds the mapping if files of the find directory were added,
+        removed or modified since it was built, judging by their sizes and
+        modification times. Replacements are looked up by `find`, so they
+        are always up to date.
+
+        :return: True if the mapping was rebuilt.
+        """
+        if self._scan() == self.files:
+            return False
+        self.build_mapping()
+        return True
 
     def find(self, file_path: str) -> Optional[str]:
-        h = self.hash(file_path)
-        if h not in self.map:
+        """ Finds a replacement of a file with identical contents.
+
+        Files differing only in comments and whitespace are matched if
+        there is no byte-identical one.
+
+        :return: Path of the replacement or None if the file is ignored.
+
+        :raises FindError: If no matching file is found.
+
+        :raises ReplaceError: If the matching file has no replacement.
+        """
+        match = None
+        # Files of other sizes can not be identical, so there is no need to hash them
+        if os.path.getsize(file_path) in self.sizes:
+            match = self.map.get(self.hash(file_path))
+        if not match:
+            match = self.normalized.get(fingerprint(file_path)[0])
+        if not match:
             raise self.FindError()
-        filename = os.path.basename(self.map[h])
+        filename = os.path.basename(match)
         if filename.endswith('.ignore'):
             return None
         replace = os.path.join(self.replace_directory, filename)
@@ -42,10 +231,44 @@ class ConversionMapping:
             raise self.ReplaceError()
         return replace
 
+    def similar(self, file_path: str, k: int = 5, threshold: float = 0.5) -> List[Tuple[str, float]]:
+        """ Finds files in the mapping similar to the given one.
+
+        Only files sharing an LSH band with the file are compared, so the
+        lookup does not scan the whole mapping.
+
+        :param k: Maximal number of files returned.
+
+        :param threshold: Minimal estimated similarity of returned files.
+
+        :return: Paths and similarity estimates, most similar first. An exact
+            normalized match has similarity 1.
+        """
+        normalized, signature = fingerprint(file_path)
+        if normalized in self.normalized:
+            return [(self.normalized[normalized], 1.0)]
+        candidates = {path for band in _bands(signature) for path in self.buckets.get(band, [])}
+        scored = [(path, similarity(signature, self.signatures[path])) for path in candidates]
+        scored = [(path, score) for path, score in scored if score >= threshold]
+        return sorted(scored, key=lambda c: (-c[1], c[0]))[:k]
+
     def todo(self, file_path: str) -> str:
+        """ Puts a file without a replacement in the mapping, with a copy of
+        it to be fixed in the replace directory (`<digest>.<ext>.todo`).
+
+        The file is added to the mapping at once, so looking it up again
+        raises ReplaceError instead of overwriting the copy being fixed.
+
+        :return: File name of the file in the find directory.
+        """
         h = self.hash(file_path)
         assert h not in self.map
         filename = h + os.path.splitext(file_path)[1]
-        shutil.copy(file_path, os.path.join(self.find_directory, filename))
+        path = os.path.join(self.find_directory, filename)
+        shutil.copy(file_path, path)
         shutil.copy(file_path, os.path.join(self.replace_directory, filename + '.todo'))
+        normalized, signature = fingerprint(path)
+        stat = os.stat(path)
+        self._insert(path, {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'digest': h,
+                            'normalized': normalized, 'minhash': signature})
         return filename
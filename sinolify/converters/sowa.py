@@ -1,11 +1,18 @@
+import functools
+import hashlib
+import json
 import os
 import re
-import shutil
+from typing import List, Optional, TYPE_CHECKING
 
-from sinolify.converters.base import ConverterBase
+from sinolify.converters.base import ConverterBase, Rule
 from sinolify.converters.mapping import ConversionMapping
 from sinolify.utils.log import log, warning_assert, error_assert, die
-from sinolify.heuristics.limits import pick_time_limits
+from sinolify.utils.stages import Stage, run_stages
+
+# Executors and heuristics are imported only when time limits are adjusted, keeping start-up fast otherwise
+if TYPE_CHECKING:
+    from sinolify.executors.timer import InputSource
 
 
 class SowaToSinolConverter(ConverterBase):
@@ -17,16 +24,48 @@ class SowaToSinolConverter(ConverterBase):
 
     _prog_ext = '(?:cpp|c|cc|pas)'
 
-    def __init__(self, *args, auto_time_limits=True, threads=1, checkers=None, **kwargs):
+    def __init__(self, *args, auto_time_limits=True, threads=1, checkers=None, budget=None,
+                 cache=True, pin=False, reserve=0, engine='threads', adaptive=False,
+                 parallel_stages=True, verify=False, **kwargs):
         """ Instantiates new SowaToSinolConverter.
 
         :param auto_time_limits: If true, automatically sets time limits.
         :param threads: Number of threads for parallel execution.
+        :param checkers: A (find, replace) pair of checker mapping directories
+            or an already built `ConversionMapping`.
+        :param budget: Optional semaphore limiting parallel runs of solutions
+            shared with other converters.
+        :param cache: If true, persistent caches of compiled solutions and
+            measurement results are used.
+        :param pin: If true, runs of solutions are pinned to dedicated CPUs.
+        :param reserve: Number of CPUs left free when pinning.
+        :param engine: Measurement engine, `threads` or `async`.
+        :param adaptive: If true, runs which can not change time limits are skipped.
+        :param parallel_stages: If true, independent conversion stages run in
+            parallel, e.g. time limits are measured while files are copied.
+        :param verify: If true, outputs of the main solution are compared
+            with out/ files while time limits are measured.
         """
         super().__init__(*args, **kwargs)
         self.auto_time_limits = auto_time_limits
         self.threads = threads
-        if checkers:
+        self.budget = budget
+        self.pin = pin
+        self.reserve = reserve
+        self.engine = engine
+        self.adaptive = adaptive
+        self.parallel_stages = parallel_stages
+        self.verify = verify
+        self.stage_times = {}
+        self.compile_cache = self.measurement_cache = None
+        if cache and auto_time_limits:
+            from sinolify.executors.compilers import CompileCache
+            from sinolify.executors.timer import MeasurementCache
+            self.compile_cache = CompileCache()
+            self.measurement_cache = MeasurementCache()
+        if isinstance(checkers, ConversionMapping):
+            self.checkers_mapper = checkers
+        elif checkers:
             checkers_find, checkers_replace = checkers
             log.info(f"Setting up checker mapping {checkers_find} -> {checkers_replace}")
             self.checkers_mapper = ConversionMapping(checkers_find, checkers_replace)
@@ -40,10 +79,12 @@ class SowaToSinolConverter(ConverterBase):
 
     def make_tests(self) -> None:
         """ Copies tests. """
-        error_assert(self.copy(rf'in/{self._id}\d+[a-z]*.in') > 0,
-                     'No input files')
-        warning_assert(self.copy(rf'out/{self._id}\d+[a-z]*.out') > 0,
-                       'No output files')
+        inputs, outputs = self.apply([
+            Rule(rf'in/{self._id}\d+[a-z]*.in'),
+            Rule(rf'out/{self._id}\d+[a-z]*.out'),
+        ])
+        error_assert(inputs > 0, 'No input files')
+        warning_assert(outputs > 0, 'No output files')
 
     def make_doc(self):
         """ Copies documents.
@@ -51,15 +92,14 @@ class SowaToSinolConverter(ConverterBase):
         Extracts the statement and its source to doc, along with anything
         that might be some sort of dependency.
         """
-        error_assert(self.copy_rename(rf'doc/{self._id}\.pdf',
-                                      f'doc/{self._id}zad.pdf') > 0,
-                     'No problem statement')
-        warning_assert(self.copy_rename(rf'desc/{self._id}\.tex',
-                                        f'doc/{self._id}zad.tex'),
-                       'No statement source')
-        self.ignore(f'desc/{self._id}_opr.tex')
-        self.copy_rename(rf'desc/(.*\.(?:pdf|tex|cls|png|jpg|JPG|sty|odg))', rf'doc/\1',
-                         ignore_processed=True)
+        statement, source, _, _ = self.apply([
+            Rule(rf'doc/{self._id}\.pdf', rename=f'doc/{self._id}zad.pdf'),
+            Rule(rf'desc/{self._id}\.tex', rename=f'doc/{self._id}zad.tex'),
+            Rule(f'desc/{self._id}_opr.tex', Rule.IGNORE),
+            Rule(rf'desc/(.*\.(?:pdf|tex|cls|png|jpg|JPG|sty|odg))', rename=rf'doc/\1', ignore_processed=True),
+        ])
+        error_assert(statement > 0, 'No problem statement')
+        warning_assert(source, 'No statement source')
 
     def make_solutions(self) -> None:
         """ Copies solutions.
@@ -70,16 +110,16 @@ class SowaToSinolConverter(ConverterBase):
         """
         log.debug('Making solutions')
 
-        error_assert(self.copy_rename(rf'sol/{self._id}\.({self._prog_ext})',
-                                      rf'prog/{self._id}1.\1'),
-                     'No main model solution')
-
-        for i, p in enumerate(self.find(rf'sol/{self._id}.+\.{self._prog_ext}')):
-            self.copy(p, lambda p: re.sub(rf'.*\.({self._prog_ext})',
-                                          rf'prog/{self._id}{i + 2}.\1', p))
-
-        self.copy(rf'utils/.*\.({self._prog_ext}|sh)', lambda p: f'prog/{p}')
-        self.copy_rename(rf'sol/(.*{self._prog_ext})', r'prog/other/\1', ignore_processed=True)
+        others = [Rule(p, rename=lambda p, i=i: re.sub(rf'.*\.({self._prog_ext})',
+                                                       rf'prog/{self._id}{i + 2}.\1', p))
+                  for i, p in enumerate(self.find(rf'sol/{self._id}.+\.{self._prog_ext}'))]
+        main, *_ = self.apply([
+            Rule(rf'sol/{self._id}\.({self._prog_ext})', rename=rf'prog/{self._id}1.\1'),
+            *others,
+            Rule(rf'utils/.*\.({self._prog_ext}|sh)', rename=lambda p: f'prog/{p}'),
+            Rule(rf'sol/(.*{self._prog_ext})', rename=r'prog/other/\1', ignore_processed=True),
+        ])
+        error_assert(main, 'No main model solution')
 
     def make_checker(self) -> None:
         """ Converts a checker.
@@ -104,26 +144,86 @@ class SowaToSinolConverter(ConverterBase):
                 log.info('Ignoring the checker.')
                 return
             log.info(f'Copying the checker from mapper: {replacement}')
-            shutil.copy(replacement, self._target.abspath(f'prog/{self._id}chk{os.path.splitext(replacement)[1]}'))
+            self._target.add(replacement, f'prog/{self._id}chk{os.path.splitext(replacement)[1]}')
         except ConversionMapping.FindError:
+            for path, score in self.checkers_mapper.similar(original_checker):
+                log.warning('Similar checker in mapper (%d%%): %s', round(score * 100), path)
             todo_filename = self.checkers_mapper.todo(original_checker)
             die(f'Putting the checker in mapper as {todo_filename}. Please fix it.')
         except ConversionMapping.ReplaceError:
             die('Unable to find a replacement for the checker in checker mapper.')
         self.ignore('check/[^.]*')
 
+    def _digest(self, local_paths: List[str], settings: Optional[dict] = None) -> str:
+        """ Returns a digest of the names and contents (CRC-32 and size) of
+        source files, and of `settings`. """
+        h = hashlib.sha256()
+        if settings:
+            h.update(json.dumps(settings, sort_keys=True).encode() + b'\n')
+        for p in local_paths:
+            crc, size = self._source.crc(p)
+            h.update(f'{p}:{crc:08x}:{size}\n'.encode())
+        return h.hexdigest()
+
+    def _source_input(self, local_path: str) -> 'InputSource':
+        """ Returns a source of a file streamed from the source package. """
+        from sinolify.executors.timer import InputSource
+        return InputSource(local_path, self._source.size(local_path),
+                           functools.partial(self._source.open, local_path))
+
     def make_time_limits_config(self) -> str:
-        """ Heuristically chooses time limit and returns config entry setting it """
+        """ Heuristically chooses time limit and returns config entry setting it,
+        followed by a memory limit entry if peak memory of the same runs is
+        measured.
+
+        The entries of the previous output are reused if the main solution,
+        the inputs (and the outputs, if verified) and the measurement
+        settings (the timer, adaptive runs, the engine and pinning) are
+        unchanged.
+        """
 
         main_solution = self.one(rf'sol/{self._id}\.{self._prog_ext}')
         error_assert(main_solution, 'No main solution found')
-        main_solution = self._source.abspath(main_solution)
-        inputs = [self._source.abspath(p) for p in self.find(rf'in/{self._id}\d+[a-z]*.in')]
-        limit = int(pick_time_limits(main_solution, inputs, threads=self.threads) * 1000)
+        input_paths = list(self.find(rf'in/{self._id}\d+[a-z]*.in'))
+        output_paths = {}
+        if self.verify:
+            for p in input_paths:
+                output = re.sub(r'^in/(.*)\.in$', r'out/\1.out', p)
+                if self.exists(re.escape(output)):
+                    output_paths[p] = output
+                else:
+                    log.warning('No output %s, the output on %s is not verified', output, p)
+        from sinolify.executors.timer import default_timer
+        settings = dict(timer=default_timer(main_solution).kind(), adaptive=self.adaptive, engine=self.engine,
+                        pin=self.pin, verify=self.verify)
+        digest = self._digest([main_solution] + input_paths + list(output_paths.values()), settings)
+        previous = self.previous.get('time_limits', {})
+        if previous.get('digest') == digest:
+            log.info('Main solution, inputs and settings unchanged, reusing time limits of the previous output')
+            self.manifest['time_limits'] = previous
+            return previous['config']
+
+        from sinolify.heuristics.limits import pick_limits
+
+        # Inputs are streamed to the solution from the source package, without extracting them
+        inputs = {p: self._source_input(p) for p in input_paths}
+        limits = pick_limits(self._source.abspath(main_solution), list(inputs.values()),
+                             threads=self.threads, budget=self.budget,
+                             compile_cache=self.compile_cache,
+                             measurement_cache=self.measurement_cache,
+                             pin=self.pin, reserve=self.reserve, engine=self.engine,
+                             adaptive=self.adaptive,
+                             expected_outputs={inputs[i]: self._source_input(o)
+                                               for i, o in output_paths.items()})
+        limit = int(limits.time * 1000)
 
         config = 'time_limits:\n'
-        tests = [os.path.basename(i).lstrip(self._id).rstrip('.in') for i in inputs]
+        tests = [os.path.basename(p).lstrip(self._id).rstrip('.in') for p in input_paths]
         config += '\n'.join([f'    {test}: {limit}' for test in sorted(tests)])
+        if limits.memory is not None:
+            config += '\nmemory_limits:\n'
+            config += '\n'.join([f'    {test}: {limits.memory}' for test in sorted(tests)])
+        self.manifest['time_limits'] = {'digest': digest, 'config': config}
         return config
 
     def make_title_config(self):
@@ -137,45 +237,69 @@ class SowaToSinolConverter(ConverterBase):
             title = re.search(r'\\title{(?:\\mbox{)?([^}]*)}', latex).group(1).replace('~', ' ').replace('$', '')
             return f'title: {title}\n'
 
+    def write_config(self, *entries: str) -> None:
+        """ Writes Sinol config consisting of the entries. """
+        with open(self._target.abspath('config.yml'), 'w') as config:
+            config.write(''.join(entries))
+
     def make_config(self):
         """ Generates Sinol config. """
-        config = open(self._target.abspath('config.yml'), 'w')
-        config.write(self.make_title_config())
+        entries = [self.make_title_config()]
         if self.auto_time_limits:
-            config.write(self.make_time_limits_config())
+            entries.append(self.make_time_limits_config())
+        self.write_config(*entries)
+
+    def stages(self) -> List[Stage]:
+        """ Returns the stages of a conversion.
+
+        Stages only copying files touch disjoint paths, so they are
+        independent of each other and of the config stages. Time limits are
+        measured after the checker is found, as a missing checker fails the
+        conversion.
+        """
+        return [
+            Stage('time_limits', self.make_time_limits_config if self.auto_time_limits else (lambda: ''),
+                  after=('checker',)),
+            Stage('tests', self.make_tests),
+            Stage('solutions', self.make_solutions),
+            Stage('doc', self.make_doc),
+            Stage('checker', self.make_checker),
+            Stage('title', self.make_title_config),
+            Stage('config', self.write_config, inputs=('title', 'time_limits')),
+        ]
 
     def convert(self) -> None:
         """ Executes a conversion from Sowa to Sinol.
 
         Emits a warning if some unexpected files are not processed.
         """
-        self.make_tests()
-        self.make_solutions()
-        self.make_doc()
-        self.make_checker()
-        self.make_config()
+        stages = self.stages()
+        _, self.stage_times = run_stages(stages, threads=None if self.parallel_stages else 1)
+        log.info('Stage times: %s', ', '.join(f'{s.name} {self.stage_times[s.name]:.2f}s' for s in stages))
 
-        # Ignore editor backup files
-        self.ignore(r'.*(~|\.swp|\.backup|\.bak)')
+        self.apply([
+            # Ignore editor backup files
+            Rule(r'.*(~|\.swp|\.backup|\.bak)', Rule.IGNORE),
 
-        # Ignore package creation system files
-        self.ignore(r'.sowa-sign')
-        self.ignore(r'(.*/)?Makefile(\.in)?')
+            # Ignore package creation system files
+            Rule(r'.sowa-sign', Rule.IGNORE),
+            Rule(r'(.*/)?Makefile(\.in)?', Rule.IGNORE),
 
-        # Ignore utils
-        self.ignore(r'utils/.*')
+            # Ignore utils
+            Rule(r'utils/.*', Rule.IGNORE),
 
-        # Ignore LaTeX's leftovers
-        self.ignore(r'desc/.*\.(aux|log|synctex)')
+            # Ignore LaTeX's leftovers
+            Rule(r'desc/.*\.(aux|log|synctex)', Rule.IGNORE),
 
-        # Ignore solution description
-        self.ignore(f'info/{self._id}_opr.pdf')
+            # Ignore solution description
+            Rule(f'info/{self._id}_opr.pdf', Rule.IGNORE),
 
-        # Ignore some common temporary files left by authors
-        self.ignore(r'tmpdesc/.*')
-        self.ignore(r'(sol|check)/.*(\.o|_PAS|_CPP|_C|\.out)')
-        self.ignore(rf'[^/]*\.{self._prog_ext}')
+            # Ignore some common temporary files left by authors
+            Rule(r'tmpdesc/.*', Rule.IGNORE),
+            Rule(r'(sol|check)/.*(\.o|_PAS|_CPP|_C|\.out)', Rule.IGNORE),
+            Rule(rf'[^/]*\.{self._prog_ext}', Rule.IGNORE),
+        ])
 
-        if self.not_processed():
-            log.warning('%d file(s) not processed: %s', len(self.not_processed()),
-                        ', '.join(self.not_processed()))
+        not_processed = self.not_processed()
+        if not_processed:
+            log.warning('%d file(s) not processed: %s', len(not_processed), ', '.join(sorted(not_processed)))
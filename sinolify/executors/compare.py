@@ -0,0 +1,161 @@
+import mmap
+from typing import BinaryIO, List, Optional
+
+_CHUNK = 1 << 16
+""" Size of chunks of the expected output tokenized at once. """
+
+
+class _Tokenizer:
+    """ Splits a stream fed in chunks into whitespace separated tokens. """
+
+    def __init__(self):
+        self.partial = b''
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """ Returns the tokens completed by a chunk. A token at the end of
+        the chunk is held back, as it may continue in the next one. """
+        if not chunk:
+            return []
+        tokens = chunk.split()
+        if self.partial:
+            if chunk[:1].isspace():
+                tokens.insert(0, self.partial)
+            else:
+                tokens[0] = self.partial + tokens[0]
+            self.partial = b''
+        if tokens and not chunk[-1:].isspace():
+            self.partial = tokens.pop()
+        return tokens
+
+    def flush(self) -> List[bytes]:
+        """ Returns the token held back at the end of the stream. """
+        partial, self.partial = self.partial, b''
+        return [partial] if partial else []
+
+
+def _short(token: bytes) -> str:
+    """ Formats a token for a message. """
+    return repr(token if len(token) <= 20 else token[:20] + b'...')
+
+
+class TokenComparator:
+    """ Compares an output fed in chunks with an expected one, token by token.
+
+    Tokens are separated by any whitespace, so the amount and kind of
+    whitespace does not matter. The expected output is read in chunks as the
+    output is fed, so neither of them is held in memory as a whole. Once
+    they differ, further chunks are not compared.
+
+    As long as the output is identical to the expected one byte by byte,
+    chunks are compared as they are, which is much faster than splitting
+    them into tokens. Tokens are compared from the first differing chunk.
+    """
+
+    def __init__(self, expected: BinaryIO):
+        """ Instantiates a comparator.
+
+        :param expected: Expected output, e.g. opened with `open_expected`.
+        """
+        self._expected = expected
+        self._expected_tokens = _Tokenizer()
+        self._output_tokens = _Tokenizer()
+        self._pending: List[bytes] = []
+        self._position = 0
+        self._end = False
+        self._identical = True
+        self._tail = b''
+        self.mismatch: Optional[str] = None
+
+    def _next_expected(self, n: int) -> List[bytes]:
+        """ Returns at most `n` next expected tokens. """
+        while len(self._pending) - self._position < n and not self._end:
+            chunk = self._expected.read(_CHUNK)
+            if chunk:
+                tokens = self._expected_tokens.feed(chunk)
+            else:
+                self._end = True
+                tokens = self._expected_tokens.flush()
+            self._pending = self._pending[self._position:] + tokens
+            self._position = 0
+        tokens = self._pending[self._position:self._position + n]
+        self._position += len(tokens)
+        return tokens
+
+    def _compare(self, tokens: List[bytes]) -> bool:
+        if self.mismatch is not None:
+            return False
+        expected = self._next_expected(len(tokens))
+        if tokens != expected:
+            for token, expected_token in zip(tokens, expected):
+                if token != expected_token:
+                    self.mismatch = f'expected {_short(expected_token)}, got {_short(token)}'
+                    break
+            else:
+                self.mismatch = f'output longer than expected, got {_short(tokens[len(expected)])}'
+            return False
+        return True
+
+    def _diverge(self, expected: bytes) -> None:
+        """ Switches from comparing bytes to comparing tokens.
+
+        :param expected: Expected bytes read for the first differing chunk.
+        """
+        self._identical = False
+        # The last token of the identical part may continue differently
+        self._output_tokens.partial = self._expected_tokens.partial = self._tail
+        self._pending = self._expected_tokens.feed(expected)
+
+    def feed(self, chunk: bytes) -> bool:
+        """ Compares the next chunk of the output.
+
+        :return: False if the output differs from the expected one so far.
+        """
+        if self.mismatch is not None:
+            return False
+        if self._identical:
+            expected = self._expected.read(len(chunk))
+            if expected != chunk:
+                self._diverge(expected)
+            elif chunk:
+                if chunk[-1:].isspace():
+                    self._tail = b''
+                else:
+                    parts = chunk.rsplit(None, 1)
+                    self._tail = parts[-1] if len(parts) == 2 or chunk[:1].isspace() else self._tail + chunk
+                return True
+        return self._compare(self._output_tokens.feed(chunk))
+
+    def finish(self) -> bool:
+        """ Compares the end of the output.
+
+        :return: True if the whole output matches, otherwise `mismatch`
+            describes the first difference.
+        """
+        if self._identical:
+            self._diverge(b'')
+        if not self._compare(self._output_tokens.flush()):
+            return False
+        if self._next_expected(1):
+            self.mismatch = 'output shorter than expected'
+            return False
+        return True
+
+
+def open_expected(expected: BinaryIO) -> BinaryIO:
+    """ Memory-maps an expected output if it is a file on disk.
+
+    Pages of a mapped file are read from the page cache as the comparison
+    proceeds, without copying the whole file.
+
+    :param expected: Expected output opened for binary reading. It is closed
+        if mapped.
+
+    :return: The mapped file, or `expected` if it can not be mapped.
+    """
+    try:
+        mapped = mmap.mmap(expected.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, AttributeError):
+        # Not a file on disk (e.g. a .zip member) or an empty file
+        return expected
+    expected.close()
+    return mapped
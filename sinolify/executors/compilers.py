@@ -1,16 +1,116 @@
+import functools
+import hashlib
 import os
+import shutil
 import subprocess
-from typing import Optional, List
+import tempfile
+from typing import Optional, List, Generator, Tuple
+
+from sinolify.utils import stats
+from sinolify.utils.log import log
+from sinolify.utils.system import cache_dir
+
+
+@functools.lru_cache(maxsize=None)
+def _identity(version_cmd: tuple) -> str:
+    """ Returns the output of a compiler version command, or its name if it fails. """
+    try:
+        return subprocess.check_output(list(version_cmd), stderr=subprocess.STDOUT, timeout=10).decode('utf-8')
+    except (OSError, subprocess.SubprocessError):
+        return ' '.join(version_cmd)
+
+
+class CompileCache:
+    """ A persistent cache of compiled executables.
+
+    Executables are keyed by a hash of the source, the compiler identity
+    (its version output) and flags. The cache size is bounded, the least
+    recently used executables are evicted first.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_size: int = 1 << 30):
+        """ Opens a cache.
+
+        :param directory: Cache directory, defaults to `compile` cache
+            directory (see `sinolify.utils.system.cache_dir`).
+
+        :param max_size: Maximum total size of cached executables in bytes.
+        """
+        self.directory = directory or cache_dir('compile')
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, compiler: 'CompilerBase') -> str:
+        """ Computes a cache key of the compilation done by `compiler`. """
+        h = hashlib.sha256()
+        with open(compiler.src_path, 'rb') as src:
+            for chunk in iter(lambda: src.read(1 << 20), b''):
+                h.update(chunk)
+        h.update(b'\0' + compiler.identity().encode('utf-8'))
+        h.update(b'\0' + '\0'.join(compiler.flags).encode('utf-8'))
+        h.update(b'\0' + os.path.splitext(compiler.src_path)[1].encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str, exe_path: str) -> bool:
+        """ Copies a cached executable to `exe_path`.
+
+        :return: True on cache hit.
+        """
+        try:
+            shutil.copy2(self._path(key), exe_path)
+            os.utime(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, key: str, exe_path: str) -> None:
+        """ Stores an executable in the cache and evicts old entries if needed. """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        os.close(fd)
+        shutil.copy2(exe_path, tmp_path)
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+
+    def entries(self) -> Generator[Tuple[float, int, str], None, None]:
+        """ Yields last use time, size and path of each cached executable. """
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                yield stat.st_mtime, stat.st_size, entry.path
+
+    def evict(self) -> None:
+        """ Removes the least recently used executables over the size limit. """
+        entries = list(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        """ Removes all cached executables. """
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                os.remove(entry.path)
 
 
 class CompilerBase(object):
     """ Base class for a compiler. """
 
+    executable: str = ''
     supported_extensions: List[str] = []
     default_flags: List[str] = []
 
     def __init__(self, src_path: str, *, output_ext: str = '.e',
-                 flags: Optional[str] = None, timeout: int = 10):
+                 flags: Optional[str] = None, timeout: int = 10,
+                 cache: Optional[CompileCache] = None):
         """ Instantiates a new compiler.
 
         :param src_path: Source file to compile.
@@ -20,6 +120,9 @@ class CompilerBase(object):
         :param flags: Overrides default compiler flags.
 
         :param timeout: Timeout for compilation to complete.
+
+        :param cache: If set, compiled executables are looked up in and stored
+            to the cache.
         """
         src_path = os.path.abspath(src_path)
         src_path_without_ext, src_ext = os.path.splitext(src_path)
@@ -27,6 +130,7 @@ class CompilerBase(object):
         self.src_path = src_path
         self.flags = self.default_flags if flags is None else flags
         self.timeout = timeout
+        self.cache = cache
         self.exe_path = src_path_without_ext + output_ext
         self.log = ''
 
@@ -34,34 +138,58 @@ class CompilerBase(object):
         """ Returns command to compile the code. """
         raise NotImplementedError
 
+    def version_cmd(self) -> List[str]:
+        """ Returns command printing the compiler version. """
+        return [self.executable, '--version']
+
+    def identity(self) -> str:
+        """ Returns a string identifying the compiler and its version. """
+        return _identity(tuple(self.version_cmd()))
+
     def compile(self) -> bool:
         """ Runs compile command (`cmd()`) and sets `log`.
 
+        With a cache set, compilation is skipped on a cache hit.
+
         :return: True on success
         """
-        try:
-            self.log = subprocess.check_output(self.cmd(), stderr=subprocess.STDOUT,
-                                               timeout=self.timeout).decode('utf-8')
+        with stats.span('compile', source=os.path.basename(self.src_path)) as span:
+            key = self.cache.key(self) if self.cache else None
+            span['cached'] = bool(key and self.cache.get(key, self.exe_path))
+            if span['cached']:
+                log.debug(f'Using cached executable for {self.src_path}')
+                self.log = ''
+                return True
+            try:
+                self.log = subprocess.check_output(self.cmd(), stderr=subprocess.STDOUT,
+                                                   timeout=self.timeout).decode('utf-8')
+            except subprocess.CalledProcessError as e:
+                self.log = e.output.decode('utf-8')
+                return False
+            if key:
+                self.cache.put(key, self.exe_path)
             return True
-        except subprocess.CalledProcessError as e:
-            self.log = e.output.decode('utf-8')
-            return False
 
 
 class CppCompiler(CompilerBase):
+    executable = 'g++'
     supported_extensions = ['.cc', '.cpp']
     default_flags = ['-O3', '--static', '--std=c++17']
 
     def cmd(self) -> bool:
-        return ['g++'] + self.flags + [f'-o{self.exe_path}', f'{self.src_path}']
+        return [self.executable] + self.flags + [f'-o{self.exe_path}', f'{self.src_path}']
 
 
 class PascalCompiler(CompilerBase):
+    executable = 'pc'
     supported_extensions = ['.pas']
     default_flags = ['-O3']
 
     def cmd(self) -> bool:
-        return ['pc'] + self.flags + [f'-o{self.exe_path}', f'{self.src_path}']
+        return [self.executable] + self.flags + [f'-o{self.exe_path}', f'{self.src_path}']
+
+    def version_cmd(self) -> List[str]:
+        return [self.executable, '-iV']
 
 
 def compiler(path, **kwargs):
@@ -70,4 +198,4 @@ def compiler(path, **kwargs):
     for c in CompilerBase.__subclasses__():
         if ext in c.supported_extensions:
             return c(path, **kwargs)
-    raise LookupError(f'Unknown source code extension {ext}')
\ No newline at end of file
+    raise LookupError(f'Unknown source code extension {ext}')
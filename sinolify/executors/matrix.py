@@ -0,0 +1,159 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures.thread import ThreadPoolExecutor
+from typing import Callable, ContextManager, Dict, List, NamedTuple, Optional, Tuple
+
+from sinolify.executors.compilers import CompileCache, compiler
+from sinolify.executors.timer import Input, Measurement, TimerBase, default_timer, input_source
+from sinolify.utils import stats
+from sinolify.utils.log import log
+
+
+class Cell(NamedTuple):
+    """ Result of a solution on a test. """
+    verdict: str
+    time: float = 0
+    instructions: Optional[int] = None
+
+    OK = Measurement.OK
+    WRONG_ANSWER = Measurement.WRONG_ANSWER
+    RUNTIME_ERROR = Measurement.RUNTIME_ERROR
+    TIME_LIMIT_EXCEEDED = Measurement.TIME_LIMIT_EXCEEDED
+    COMPILATION_ERROR = 'CE'
+
+
+def _count(n: float) -> str:
+    """ Formats a count with a metric suffix and 3 significant digits. """
+    for suffix, scale in (('G', 1e9), ('M', 1e6), ('K', 1e3)):
+        if n >= scale:
+            return f'{n / scale:.3g}{suffix}'
+    return str(int(n))
+
+
+class Matrix:
+    """ Results of `run_matrix`, by solution and test name. """
+
+    def __init__(self, solutions: List[str], tests: List[str], limits: Dict[str, float]):
+        self.solutions = solutions
+        self.tests = tests
+        self.limits = limits
+        self.cells: Dict[Tuple[str, str], Cell] = {}
+
+    def verdicts(self, solution: str) -> Dict[str, int]:
+        """ Returns the numbers of tests of a solution by verdict. """
+        counts = {}
+        for test in self.tests:
+            verdict = self.cells[solution, test].verdict
+            counts[verdict] = counts.get(verdict, 0) + 1
+        return counts
+
+    def table(self) -> str:
+        """ Formats the results as a table with a row per test and a column
+        per solution. Cells show instruction counts (or times if the timer
+        does not count instructions) and verdicts other than OK. """
+
+        def cell(c: Cell) -> str:
+            if c.verdict != Cell.OK and not c.time:
+                # Not compiled, failed or killed by the timeout
+                return c.verdict
+            value = _count(c.instructions) if c.instructions is not None else f'{c.time:.2f}s'
+            return value if c.verdict == Cell.OK else f'{value} {c.verdict}'
+
+        rows = [['test', 'limit'] + self.solutions]
+        for test in self.tests:
+            rows.append([test, f'{self.limits[test]:g}s'] + [cell(self.cells[s, test]) for s in self.solutions])
+        rows.append(['', ''] + [' '.join(f'{n} {v}' for v, n in sorted(self.verdicts(s).items()))
+                                for s in self.solutions])
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return '\n'.join('  '.join(value.rjust(width) if i else value.ljust(width)
+                                   for i, (value, width) in enumerate(zip(row, widths))).rstrip()
+                         for row in rows)
+
+
+def run_matrix(solutions: Dict[str, str], inputs: Dict[str, Input], limits: Dict[str, float], *,
+               outputs: Optional[Dict[str, Input]] = None, threads: int = 1, timeout_factor: float = 2,
+               budget: Optional[ContextManager] = None, compile_cache: Optional[CompileCache] = None,
+               timer: Callable[..., TimerBase] = default_timer) -> Matrix:
+    """ Runs every solution on every test.
+
+    Solutions are compiled in parallel. Then all (solution, test) cells are
+    run on one thread pool, largest inputs first, so that threads pick up
+    the next cell of any solution as soon as they are free. Runs are killed
+    after `timeout_factor` times the time limit of the test (wall time),
+    and a run using more than the limit is TLE even if it finishes.
+
+    :param solutions: Source files of the solutions by name.
+
+    :param inputs: Input files or sources by test name.
+
+    :param limits: Time limits in seconds by test name.
+
+    :param outputs: Optional expected outputs by test name. Runs with other
+        outputs (ignoring whitespace) are wrong answers.
+
+    :param threads: Number of parallel compilations and runs.
+
+    :param timeout_factor: Wall time timeout of a run relative to the limit.
+
+    :param budget: Optional semaphore acquired for every run, shared with
+        other pools (see `TimerPool`).
+
+    :param compile_cache: Optional cache of compiled solutions.
+
+    :param timer: Instantiates a timer of an executable, with the timeout
+        as `timeout` keyword argument.
+
+    :return: The results.
+    """
+    matrix = Matrix(list(solutions), list(inputs), limits)
+    sizes = {test: input_source(i).size for test, i in inputs.items()}
+    with tempfile.TemporaryDirectory() as sandbox, ThreadPoolExecutor(max_workers=threads) as executor, \
+            stats.span('matrix', solutions=len(solutions), tests=len(inputs), threads=threads):
+
+        def build(i: int, name: str) -> Optional[str]:
+            # Solutions are compiled in separate directories, as their names may clash with executables
+            directory = os.path.join(sandbox, str(i))
+            os.mkdir(directory)
+            src = os.path.join(directory, f'{name}{os.path.splitext(solutions[name])[1]}')
+            shutil.copy(solutions[name], src)
+            c = compiler(src, output_ext='.e', cache=compile_cache)
+            if not c.compile():
+                log.warning('Failed to compile %s:\n%s', name, c.log)
+                return None
+            return c.exe_path
+
+        executables = dict(zip(solutions, executor.map(build, range(len(solutions)), solutions)))
+        # Timers are created before the runs, so that concurrent runs do not instantiate them twice
+        timeouts = {timeout_factor * limits[test] for test in inputs}
+        timers = {(solution, timeout): timer(exe, timeout=timeout)
+                  for solution, exe in executables.items() if exe is not None for timeout in timeouts}
+
+        def run(solution: str, test: str) -> Cell:
+            t = timers[solution, timeout_factor * limits[test]]
+            args = (inputs[test], outputs[test]) if outputs and test in outputs else (inputs[test],)
+            if budget is None:
+                measurement = t.run(*args)
+            else:
+                with budget:
+                    measurement = t.run(*args)
+            if measurement.status not in (Measurement.OK, Measurement.WRONG_ANSWER):
+                return Cell(measurement.status)
+            ghz = getattr(t, 'ghz', None)
+            instructions = round(measurement.time * ghz * 10**9) if ghz else None
+            if measurement.time > limits[test]:
+                verdict = Cell.TIME_LIMIT_EXCEEDED
+            else:
+                verdict = measurement.status
+            return Cell(verdict, measurement.time, instructions)
+
+        futures = {}
+        for test in sorted(inputs, key=lambda t: -sizes[t]):
+            for solution in solutions:
+                if executables[solution] is None:
+                    matrix.cells[solution, test] = Cell(Cell.COMPILATION_ERROR)
+                else:
+                    futures[solution, test] = executor.submit(run, solution, test)
+        for key, future in futures.items():
+            matrix.cells[key] = future.result()
+    return matrix
@@ -0,0 +1,116 @@
+import ctypes
+import functools
+import os
+import platform
+import struct
+
+PERF_TYPE_HARDWARE = 0
+PERF_TYPE_SOFTWARE = 1
+PERF_COUNT_HW_INSTRUCTIONS = 1
+PERF_COUNT_SW_TASK_CLOCK = 1
+
+_PERF_FORMAT_TOTAL_TIME_ENABLED = 1 << 0
+_PERF_FORMAT_TOTAL_TIME_RUNNING = 1 << 1
+
+_FLAG_DISABLED = 1 << 0
+_FLAG_INHERIT = 1 << 1
+_FLAG_EXCLUDE_KERNEL = 1 << 5
+_FLAG_EXCLUDE_HV = 1 << 6
+_FLAG_ENABLE_ON_EXEC = 1 << 12
+
+_SYSCALL_NUMBERS = {
+    'x86_64': 298,
+    'amd64': 298,
+    'i386': 336,
+    'i686': 336,
+    'aarch64': 241,
+    'arm64': 241,
+    'riscv64': 241,
+    'armv7l': 364,
+    'ppc64le': 319,
+    's390x': 331,
+}
+
+
+class _PerfEventAttr(ctypes.Structure):
+    """ `struct perf_event_attr` up to `config2` (PERF_ATTR_SIZE_VER1). """
+    _fields_ = [
+        ('type', ctypes.c_uint32),
+        ('size', ctypes.c_uint32),
+        ('config', ctypes.c_uint64),
+        ('sample_period', ctypes.c_uint64),
+        ('sample_type', ctypes.c_uint64),
+        ('read_format', ctypes.c_uint64),
+        ('flags', ctypes.c_uint64),
+        ('wakeup_events', ctypes.c_uint32),
+        ('bp_type', ctypes.c_uint32),
+        ('config1', ctypes.c_uint64),
+        ('config2', ctypes.c_uint64),
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def _libc() -> ctypes.CDLL:
+    return ctypes.CDLL(None, use_errno=True)
+
+
+class ChildCounter:
+    """ A performance counter of the child processes spawned by the calling thread.
+
+    The counter is opened on the calling thread with `inherit` and
+    `enable_on_exec` set, so it only counts user space events of processes
+    the thread spawns (e.g. with `os.posix_spawn`) after they call `exec`.
+    Counts of the children are added to the counter once they exit.
+    """
+
+    def __init__(self, type: int = PERF_TYPE_HARDWARE, config: int = PERF_COUNT_HW_INSTRUCTIONS):
+        """ Opens a counter.
+
+        :param type: Event type, e.g. `PERF_TYPE_HARDWARE`.
+
+        :param config: Event, e.g. `PERF_COUNT_HW_INSTRUCTIONS`.
+
+        :raises OSError: If the counter can not be opened.
+        """
+        number = _SYSCALL_NUMBERS.get(platform.machine())
+        if platform.system() != 'Linux' or number is None:
+            raise OSError(f'perf_event_open is not supported on {platform.system()} {platform.machine()}')
+        attr = _PerfEventAttr()
+        attr.type = type
+        attr.size = ctypes.sizeof(_PerfEventAttr)
+        attr.config = config
+        attr.read_format = _PERF_FORMAT_TOTAL_TIME_ENABLED | _PERF_FORMAT_TOTAL_TIME_RUNNING
+        attr.flags = _FLAG_DISABLED | _FLAG_INHERIT | _FLAG_EXCLUDE_KERNEL | _FLAG_EXCLUDE_HV | _FLAG_ENABLE_ON_EXEC
+        self.fd = _libc().syscall(ctypes.c_long(number), ctypes.byref(attr), ctypes.c_int(0),
+                                  ctypes.c_int(-1), ctypes.c_int(-1), ctypes.c_ulong(0))
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f'perf_event_open: {os.strerror(errno)}')
+
+    def read(self) -> int:
+        """ Returns the counter value, scaled if the counter was multiplexed. """
+        value, enabled, running = struct.unpack('QQQ', os.read(self.fd, 24))
+        if running and running < enabled:
+            value = value * enabled // running
+        return value
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self) -> 'ChildCounter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+@functools.lru_cache(maxsize=None)
+def available(type: int = PERF_TYPE_HARDWARE, config: int = PERF_COUNT_HW_INSTRUCTIONS) -> bool:
+    """ Checks if a counter of the event can be opened. """
+    try:
+        ChildCounter(type, config).close()
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,75 @@
+import functools
+import hashlib
+import os
+import subprocess
+import tempfile
+from typing import Optional
+
+from sinolify.executors.compilers import compiler
+from sinolify.utils.log import log
+from sinolify.utils.system import cache_dir
+
+_SOURCE = r'''
+// Runs a program in a child process and writes its peak resident set size in
+// KiB to descriptor 3, exiting with its exit code (or 128 + signal number).
+#include <cerrno>
+#include <cstdio>
+#include <sys/resource.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+int main(int argc, char **argv) {
+    if (argc < 2)
+        return 126;
+    pid_t pid = fork();
+    if (pid < 0)
+        return 126;
+    if (pid == 0) {
+        close(3);
+        execv(argv[1], argv + 1);
+        _exit(127);
+    }
+    int status;
+    struct rusage usage;
+    while (wait4(pid, &status, 0, &usage) < 0)
+        if (errno != EINTR)
+            return 126;
+    dprintf(3, "%ld\n", usage.ru_maxrss);
+    return WIFEXITED(status) ? WEXITSTATUS(status) : 128 + WTERMSIG(status);
+}
+'''
+""" Source of the spawn helper, see `spawn_helper`. """
+
+
+@functools.lru_cache(maxsize=None)
+def spawn_helper() -> Optional[str]:
+    """ Returns the path of a small static executable which runs a program
+    and reports its peak memory, compiling it at first use.
+
+    A process spawned directly by sinolify (with `posix_spawn` or `fork`)
+    starts with the memory of sinolify mapped, and the kernel counts the
+    peak memory of sinolify towards the peak memory of the process. A child
+    of the helper starts with the few pages of the helper only, so its peak
+    memory (`ru_maxrss` from `wait4`) is the one of the program.
+
+    :return: Path of the helper, or None if it can not be compiled.
+    """
+    directory = cache_dir('spawn')
+    path = os.path.join(directory, hashlib.sha256(_SOURCE.encode()).hexdigest()[:16] + '.e')
+    if os.path.exists(path):
+        return path
+    # Compiled aside and moved into place, as other processes may be compiling it too
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        src = os.path.join(tmp, 'spawn.cpp')
+        with open(src, 'w') as f:
+            f.write(_SOURCE)
+        c = compiler(src)
+        try:
+            compiled = c.compile()
+        except (OSError, subprocess.SubprocessError) as e:
+            compiled, c.log = False, str(e)
+        if not compiled:
+            log.warning('Failed to compile the spawn helper, peak memory is not measured:\n%s', c.log)
+            return None
+        os.replace(c.exe_path, path)
+    return path
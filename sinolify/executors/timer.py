@@ -1,11 +1,245 @@
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import queue
+import signal
+import sqlite3
 import subprocess
 import tempfile
+import threading
+import time
 from concurrent.futures.thread import ThreadPoolExecutor
-from typing import Iterable, List
+from typing import Iterable, List, Optional, ContextManager, Dict, Tuple, NamedTuple, Callable, BinaryIO, \
+    Generator, Union
 import re
 
+from sinolify.executors import perf_event
+from sinolify.executors.spawn import spawn_helper
+from sinolify.executors.compare import TokenComparator, open_expected
+from sinolify.utils import stats
 from sinolify.utils.log import die, log
-from sinolify.utils.system import where
+from sinolify.utils.system import where, cache_dir
+
+
+def _stream_hash(f: BinaryIO) -> str:
+    """ Returns a hex digest of the stream contents. """
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """ Returns a hex digest of the file contents. """
+    with open(path, 'rb') as f:
+        return _stream_hash(f)
+
+
+class InputSource:
+    """ An input of a run, passed to the standard input of the solution.
+
+    Sources backed by files on disk are passed as they are. Other ones,
+    e.g. .zip members or byte strings, are written to a pipe by a thread
+    while the solution reads them, so they never have to be stored on disk
+    or in memory as a whole.
+    """
+
+    def __init__(self, name: str, size: int, open: Callable[[], BinaryIO]):
+        """ Instantiates a source.
+
+        :param name: Name of the input used in messages, e.g. a path.
+
+        :param size: Size of the input in bytes.
+
+        :param open: Returns a new binary stream of the input contents.
+        """
+        self.name = name
+        self.size = size
+        self.open = open
+
+    @classmethod
+    def file(cls, path: str) -> 'InputSource':
+        """ Returns a source reading a file. """
+        return cls(path, os.path.getsize(path), lambda: open(path, 'rb'))
+
+    @classmethod
+    def bytes(cls, name: str, data: bytes) -> 'InputSource':
+        """ Returns a source reading a byte string. """
+        return cls(name, len(data), lambda: io.BytesIO(data))
+
+    def hash(self) -> str:
+        """ Returns a hex digest of the input contents, same as `file_hash`. """
+        with self.open() as f:
+            return _stream_hash(f)
+
+    def __str__(self) -> str:
+        return self.name
+
+
+Input = Union[str, InputSource]
+""" An input of a run, a file path or a source. """
+
+
+def input_source(input: Input) -> InputSource:
+    """ Returns the source of an input, reading the file if given a path. """
+    return input if isinstance(input, InputSource) else InputSource.file(input)
+
+
+def _pump(src: BinaryIO, fd: int) -> None:
+    """ Writes a stream to a pipe and closes both.
+
+    Stops early if the reader closes the pipe, e.g. a solution exiting
+    without reading the whole input.
+    """
+    try:
+        with src:
+            for chunk in iter(lambda: src.read(1 << 16), b''):
+                view = memoryview(chunk)
+                while view:
+                    view = view[os.write(fd, view):]
+    except BrokenPipeError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def _stdin(input: Input) -> Generator[int, None, None]:
+    """ Yields a file descriptor to pass as the standard input of a run.
+
+    Inputs which are files on disk are passed directly. Others are pumped
+    through a pipe by a thread. The pipe is closed on exit, so the context
+    must span the whole run.
+    """
+    src = input_source(input).open()
+    try:
+        fd = src.fileno()
+    except (OSError, AttributeError):
+        # Not a file on disk, e.g. a .zip member or a byte string
+        fd = None
+    if fd is not None:
+        with src:
+            yield fd
+        return
+    read, write = os.pipe()
+    pump = threading.Thread(target=_pump, args=(src, write), daemon=True)
+    pump.start()
+    try:
+        yield read
+    finally:
+        # Unblocks the pump if the run did not read the whole input
+        os.close(read)
+        pump.join()
+
+
+class _OutputCheck:
+    """ Compares the standard output of a run with an expected output.
+
+    The output is read from a pipe by a thread and compared by
+    a `TokenComparator`. After a mismatch the output is still read, but
+    not compared, so that the run is not blocked or killed.
+    """
+
+    def __init__(self, expected: Input):
+        self._expected = open_expected(input_source(expected).open())
+        self.comparator = TokenComparator(self._expected)
+        self._read, self.fd = os.pipe()
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def _drain(self) -> None:
+        try:
+            for chunk in iter(lambda: os.read(self._read, 1 << 16), b''):
+                if self.comparator.mismatch is None:
+                    try:
+                        self.comparator.feed(chunk)
+                    except Exception as e:
+                        self.comparator.mismatch = f'unable to read the expected output: {e}'
+        finally:
+            os.close(self._read)
+
+    def spawned(self) -> None:
+        """ Closes the write end of the pipe in this process, so that the
+        output ends when the run exits. Call after spawning the run. """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def wait(self) -> None:
+        """ Waits for the end of the output. """
+        self.spawned()
+        self._thread.join()
+
+    def close(self) -> None:
+        """ Waits for the end of the output and closes the expected one. """
+        self.wait()
+        self._expected.close()
+
+    def matches(self) -> bool:
+        """ Waits for the end of the output and checks if it matches. """
+        self.wait()
+        try:
+            return self.comparator.finish()
+        except Exception as e:
+            self.comparator.mismatch = f'unable to read the expected output: {e}'
+            return False
+
+
+@contextlib.contextmanager
+def _stdout(expected: Optional[Input]) -> Generator[Tuple[int, Optional[_OutputCheck]], None, None]:
+    """ Yields a file descriptor to pass as the standard output of a run and
+    the check of the output, if an expected output is given. Otherwise the
+    output is discarded. """
+    if expected is None:
+        with open(os.devnull, 'wb') as devnull:
+            yield devnull.fileno(), None
+        return
+    check = _OutputCheck(expected)
+    try:
+        yield check.fd, check
+    finally:
+        check.close()
+
+
+class Measurement(NamedTuple):
+    """ Result of a single run of a timer. """
+    status: str
+    time: float = 0
+    memory: Optional[int] = None
+    """ Peak resident set size in KiB, if the timer measures it, see `NativeTimer`. """
+
+    OK = 'OK'
+    WRONG_ANSWER = 'WA'
+    RUNTIME_ERROR = 'RE'
+    TIME_LIMIT_EXCEEDED = 'TLE'
+    CANCELLED = 'CANCELLED'
+
+
+def _verified(input_file: Input, check: Optional[_OutputCheck], measurement: Measurement) -> Measurement:
+    """ Turns a successful measurement into a wrong answer if the output
+    does not match the expected one. """
+    if check is None or measurement.status != Measurement.OK or check.matches():
+        return measurement
+    log.info('Output on %s differs from the expected one: %s', input_file, check.comparator.mismatch)
+    return measurement._replace(status=Measurement.WRONG_ANSWER)
+
+
+def checked_time(input_file: Input, measurement: Measurement) -> float:
+    """ Returns the time of a measurement done by `TimerBase.measure`.
+
+    Dies if the run timed out and warns about runtime errors, returning 0,
+    and wrong answers.
+    """
+    if measurement.status == Measurement.TIME_LIMIT_EXCEEDED:
+        die(f'Model solution execution timed out on {input_file}')
+    if measurement.status == Measurement.RUNTIME_ERROR:
+        log.warning(f'Model solution returned non-zero exit code on {input_file}')
+    if measurement.status == Measurement.WRONG_ANSWER:
+        log.warning(f'Model solution output differs from the expected one on {input_file}')
+    return measurement.time
 
 
 class TimerBase:
@@ -13,15 +247,97 @@ class TimerBase:
     def __init__(self, exe_file):
         self.exe_file = exe_file
 
-    def measure(self, input_file: str) -> float:
-        """ Measures execution time of `exe_file` with input from `input_file` """
+    def measure(self, input_file: Input) -> float:
+        """ Measures execution time of `exe_file` with input from `input_file`,
+        a path or an `InputSource`. """
         raise NotImplementedError
 
+    def run(self, input_file: Input, expected: Optional[Input] = None) -> Measurement:
+        """ Measures execution time of `exe_file` with input from `input_file`,
+        reporting failures in the result instead of terminating.
+
+        :param expected: Optional expected output. If the output differs,
+            ignoring whitespace, the result is a wrong answer. Timers which
+            do not capture the output raise `NotImplementedError`.
+        """
+        if expected is not None:
+            raise NotImplementedError(f'{type(self).__name__} does not verify outputs')
+        return Measurement(Measurement.OK, self.measure(input_file))
 
-class PerfTimer(TimerBase):
+    async def run_async(self, input_file: Input, expected: Optional[Input] = None) -> Measurement:
+        """ Coroutine version of `run`.
+
+        By default `run` is called in the default executor of the loop and
+        cancelling the coroutine does not stop the run, see `kill`.
+        """
+        args = (input_file,) if expected is None else (input_file, expected)
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, *args)
+
+    def kill(self) -> None:
+        """ Kills all processes currently run by `run`, if supported. """
+        pass
+
+    def kind(self) -> str:
+        """ Returns a string identifying the timer and its settings which
+        affect the results, used as a part of measurement cache keys. """
+        return type(self).__name__
+
+
+def _kill_group(pid: int) -> None:
+    """ Kills a process group, ignoring already finished ones. """
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class _GroupTimer(TimerBase):
+    """ Base class for timers running each run in a new process group,
+    which is killed after the timeout or by `kill`. """
+
+    def __init__(self, exe_file: str, timeout: int = 30):
+        super().__init__(exe_file)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._running = set()
+        self._killed = {}
+
+    def _timeout(self, pid: int) -> None:
+        """ Kills a child which timed out, unless it has already exited. """
+        with self._lock:
+            if pid in self._running:
+                self._killed[pid] = Measurement.TIME_LIMIT_EXCEEDED
+                _kill_group(pid)
+
+    def kill(self) -> None:
+        with self._lock:
+            for pid in self._running:
+                self._killed[pid] = Measurement.CANCELLED
+                _kill_group(pid)
+
+    def _wait_group(self, pid: int) -> Optional[str]:
+        """ Waits for a child to exit without reaping it, killing it after
+        the timeout.
+
+        :return: The status of a measurement if the child was killed.
+        """
+        killer = threading.Timer(self.timeout, self._timeout, (pid,))
+        killer.start()
+        # Wait without reaping, so that the pid can not be reused before it stops being killed
+        os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+        with self._lock:
+            self._running.remove(pid)
+            killed = self._killed.pop(pid, None)
+        killer.cancel()
+        return killed
+
+
+class PerfTimer(_GroupTimer):
     """ A timer using `perf` to count instructions.
 
-    Simulates a processor executing 1 instruction per cycle.
+    Simulates a processor executing 1 instruction per cycle. Peak memory is
+    not measured, as the resource usage of the solution can not be told
+    apart from the one of `perf`.
     """
 
     def __init__(self, exe_file: str, timeout: int = 30, ghz: float = 2):
@@ -30,45 +346,523 @@ class PerfTimer(TimerBase):
         Simulates a {ghz}GHz processor. Wall time timeout is set to `timeout`.
         """
 
-        super().__init__(exe_file)
-        self.timeout = timeout
+        super().__init__(exe_file, timeout)
         self.ghz = ghz
 
-    def measure(self, input_file: str) -> float:
-        with tempfile.NamedTemporaryFile(mode='w') as tmp:
+    def kind(self) -> str:
+        return f'{super().kind()}:{self.ghz}'
+
+    def command(self, perf_output: str) -> List[str]:
+        """ Returns command running `exe_file` under `perf`, which writes
+        the instruction count to `perf_output`. """
+        # Wrapping in bash to catch sigsegvs etc
+        return [where('perf'), 'stat', '-einstructions', '-x,', f'-o{perf_output}',
+                where('bash'), '-c', f'{self.exe_file}; exit $?']
+
+    def parse(self, perf_output: str) -> float:
+        """ Converts the instruction count written by `perf` to seconds. """
+        perf_out = open(perf_output, 'r').read()
+        instr = int(re.search(r'(\d+),,instructions', perf_out).group(1))
+        return instr/(self.ghz*10**9)
+
+    def measure(self, input_file: Input) -> float:
+        return checked_time(input_file, self.run(input_file))
+
+    def run(self, input_file: Input, expected: Optional[Input] = None) -> Measurement:
+        with tempfile.NamedTemporaryFile(mode='w') as tmp, _stdin(input_file) as stdin, \
+                _stdout(expected) as (stdout, check):
+            with self._lock:
+                # A new session allows killing the solution along with perf and bash
+                process = subprocess.Popen(self.command(tmp.name), stdin=stdin, stdout=stdout,
+                                           stderr=subprocess.DEVNULL, start_new_session=True)
+                self._running.add(process.pid)
+            if check:
+                check.spawned()
+            killed = self._wait_group(process.pid)
+            code = process.wait()
+            if killed:
+                return Measurement(killed)
+            if code != 0:
+                return Measurement(Measurement.RUNTIME_ERROR)
+            return _verified(input_file, check, Measurement(Measurement.OK, self.parse(tmp.name)))
+
+    async def run_async(self, input_file: Input, expected: Optional[Input] = None) -> Measurement:
+        with tempfile.NamedTemporaryFile(mode='w') as tmp, _stdin(input_file) as stdin, \
+                _stdout(expected) as (stdout, check):
+            process = await asyncio.create_subprocess_exec(*self.command(tmp.name), stdin=stdin,
+                                                           stdout=stdout, stderr=subprocess.DEVNULL,
+                                                           start_new_session=True)
+            with self._lock:
+                self._running.add(process.pid)
+            if check:
+                check.spawned()
             try:
-                # Wrapping in bash to catch sigsegvs etc
-                cmd = [where('perf'), 'stat', '-einstructions', '-x,', f'-o{tmp.name}',
-                       where('bash'), '-c', f'{self.exe_file}; exit $?']
-                subprocess.check_output(cmd, stdin=open(input_file, 'r'),
-                                        stderr=subprocess.DEVNULL, timeout=self.timeout)
-            except subprocess.TimeoutExpired:
-                die('Model solution execution timed out')
-            except subprocess.CalledProcessError:
-                log.warning(f'Model solution returned non-zero exit code on {input_file}')
-                return 0
-            perf_out = open(tmp.name, 'r').read()
-            instr = int(re.search(r'(\d+),,instructions', perf_out).group(1))
-            return instr/(self.ghz*10**9)
+                code = await asyncio.wait_for(process.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                self._timeout(process.pid)
+                code = await process.wait()
+            except asyncio.CancelledError:
+                _kill_group(process.pid)
+                await process.wait()
+                raise
+            finally:
+                # The child is reaped by the event loop, so unlike in `run` its pid is
+                # released a moment before it stops being killed
+                with self._lock:
+                    self._running.discard(process.pid)
+                    killed = self._killed.pop(process.pid, None)
+            if killed:
+                return Measurement(killed)
+            if code != 0:
+                return Measurement(Measurement.RUNTIME_ERROR)
+            measurement = Measurement(Measurement.OK, self.parse(tmp.name))
+            # The output may still be compared after the run exits
+            return await asyncio.get_running_loop().run_in_executor(None, _verified, input_file, check, measurement)
+
+
+class NativeTimer(_GroupTimer):
+    """ A timer counting instructions with `perf_event_open`.
+
+    The executable is spawned without `perf` and a shell, and its
+    instructions are counted by a counter it inherits from the spawning
+    thread (see `perf_event.ChildCounter`). Exit status is taken from
+    `wait4`.
+
+    If the spawn helper can be compiled (see `spawn.spawn_helper`), the
+    executable is run by the helper, which reports its peak memory. The few
+    instructions of the helper are counted too. Otherwise the executable is
+    spawned directly and its peak memory is not measured, as the kernel
+    would count the peak memory of this process towards it.
+
+    As the counter belongs to the spawning thread, `run_async` runs the
+    measurements in threads. Cancelled runs are stopped by `kill`.
+
+    Simulates a processor executing 1 instruction per cycle.
+    """
+
+    event = (perf_event.PERF_TYPE_HARDWARE, perf_event.PERF_COUNT_HW_INSTRUCTIONS)
+
+    def __init__(self, exe_file: str, timeout: int = 30, ghz: float = 2):
+        """ Instantiates  a timer for `exe_file`.
+
+        Simulates a {ghz}GHz processor. Wall time timeout is set to `timeout`.
+        """
+
+        super().__init__(exe_file, timeout)
+        self.ghz = ghz
+
+    @classmethod
+    def available(cls) -> bool:
+        """ Checks if the counter can be used on this system. """
+        return perf_event.available(*cls.event)
+
+    def kind(self) -> str:
+        return f'{super().kind()}:{self.ghz}'
+
+    def _spawn(self, helper: Optional[str], stdin: int, stdout: int, stderr: int) -> Tuple[int, Optional[int]]:
+        """ Spawns the executable in a new process group, by the spawn helper
+        if it is available.
+
+        :param helper: Path of the spawn helper or None.
+
+        :return: Pid of the child and a descriptor the helper reports peak
+            memory to, if it is used.
+        """
+        file_actions = [(os.POSIX_SPAWN_DUP2, stdin, 0),
+                        (os.POSIX_SPAWN_DUP2, stdout, 1),
+                        (os.POSIX_SPAWN_DUP2, stderr, 2)]
+        if helper is None:
+            return os.posix_spawn(self.exe_file, [self.exe_file], os.environ,
+                                  file_actions=file_actions, setpgroup=0), None
+        report, report_w = os.pipe()
+        try:
+            pid = os.posix_spawn(helper, [helper, self.exe_file], os.environ,
+                                 file_actions=file_actions + [(os.POSIX_SPAWN_DUP2, report_w, 3)], setpgroup=0)
+        except BaseException:
+            os.close(report)
+            raise
+        finally:
+            os.close(report_w)
+        return pid, report
+
+    def _wait(self, pid: int, report: Optional[int]) -> Tuple[int, Optional[str], Optional[int]]:
+        """ Waits for a child, killing it after the timeout.
+
+        :param report: Descriptor the spawn helper reports peak memory to,
+            closed after the child exits.
+
+        :return: Wait status, the status of a measurement if the child was
+            killed and its peak resident set size in KiB, if reported.
+        """
+        killed = self._wait_group(pid)
+        _, status, _ = os.wait4(pid, 0)
+        memory = None
+        if report is not None:
+            # The helper has exited, so the report is complete
+            with open(report, 'rb') as f:
+                data = f.read()
+            memory = int(data) if data.strip() else None
+        return status, killed, memory
+
+    def measure(self, input_file: Input) -> float:
+        return checked_time(input_file, self.run(input_file))
+
+    def run(self, input_file: Input, expected: Optional[Input] = None) -> Measurement:
+        helper = spawn_helper()
+        with _stdin(input_file) as stdin, _stdout(expected) as (stdout, check), \
+                open(os.devnull, 'wb') as devnull, perf_event.ChildCounter(*self.event) as counter:
+            with self._lock:
+                pid, report = self._spawn(helper, stdin, stdout, devnull.fileno())
+                self._running.add(pid)
+            if check:
+                check.spawned()
+            status, killed, memory = self._wait(pid, report)
+            if killed:
+                return Measurement(killed)
+            if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+                return Measurement(Measurement.RUNTIME_ERROR)
+            return _verified(input_file, check,
+                             Measurement(Measurement.OK, counter.read()/(self.ghz*10**9), memory))
+
+
+def default_timer(exe_file: str, **kwargs) -> TimerBase:
+    """ Instantiates a `NativeTimer` if available, or a `PerfTimer` otherwise. """
+    if NativeTimer.available():
+        return NativeTimer(exe_file, **kwargs)
+    log.debug('Instruction counter is not available, falling back to perf')
+    return PerfTimer(exe_file, **kwargs)
+
+
+class MeasurementCache:
+    """ A persistent cache of measurement results.
+
+    Results are stored in an SQLite database and keyed by the executable
+    hash, the input hash and the timer kind (see `TimerBase.kind`).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """ Opens a cache.
+
+        :param path: Database file, defaults to a file in `measurements`
+            cache directory (see `sinolify.utils.system.cache_dir`).
+        """
+        self.path = path or os.path.join(cache_dir('measurements'), 'results.sqlite')
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute('''CREATE TABLE IF NOT EXISTS results (
+                                  executable TEXT, input TEXT, timer TEXT, result TEXT, created REAL,
+                                  PRIMARY KEY (executable, input, timer))''')
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, executable: str, input: str, timer: str) -> Optional[float]:
+        """ Returns a cached result or None if not found. """
+        with self._lock:
+            row = self._db.execute('SELECT result FROM results WHERE executable = ? AND input = ? AND timer = ?',
+                                   (executable, input, timer)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, executable: str, input: str, timer: str, result: float) -> None:
+        """ Stores a result. """
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                             (executable, input, timer, json.dumps(result), time.time()))
+
+    def invalidate(self, executable: Optional[str] = None) -> int:
+        """ Removes results of an executable (given by its hash) or all results.
+
+        :return: Number of removed results.
+        """
+        with self._lock, self._db:
+            if executable is None:
+                return self._db.execute('DELETE FROM results').rowcount
+            return self._db.execute('DELETE FROM results WHERE executable = ?', (executable,)).rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """ Returns the numbers of stored results, executables and inputs. """
+        with self._lock:
+            results, executables, inputs = self._db.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT executable), COUNT(DISTINCT input) FROM results').fetchone()
+        return {'results': results, 'executables': executables, 'inputs': inputs,
+                'size': os.path.getsize(self.path)}
 
 
 class TimerPool:
-    """ Measures execution time on multiple inputs using a thread pool. """
+    """ Measures execution time on multiple inputs using a thread pool.
+
+    Inputs are file paths or `InputSource`s, passed to the timer as they
+    are. They are measured longest first (judging by their size), so that
+    a long run does not end up as the tail of the pool.
+    """
     timer: TimerBase
     threads: int
+    budget: Optional[ContextManager]
+    cache: Optional[MeasurementCache]
+    pin: bool
+    reserve: int
+    expected_outputs: Optional[Dict[Input, Input]]
+    peak_memory: Dict[Input, Optional[int]]
+
+    def __init__(self, timer: TimerBase, *, threads: int = 1, budget: Optional[ContextManager] = None,
+                 cache: Optional[MeasurementCache] = None, pin: bool = False, reserve: int = 0,
+                 expected_outputs: Optional[Dict[Input, Input]] = None):
+        """ Setups a pool with specified timer and number of threads.
+
+        :param budget: An optional semaphore (e.g. `multiprocessing.Semaphore`)
+            acquired for every measurement, limiting the number of parallel
+            runs shared by many pools.
+
+        :param cache: If set, results are looked up in and stored to the cache
+            instead of always running the timer.
+
+        :param pin: If set, each run is pinned to a dedicated CPU. The number
+            of threads is then limited to the number of available CPUs.
+
+        :param reserve: Number of CPUs left free for other work when pinning.
+            The lowest numbered CPUs, which usually handle interrupts, are
+            reserved.
 
-    def __init__(self, timer: TimerBase, *, threads: int = 1):
-        """ Setups a pool with specified timer and number of threads. """
+        :param expected_outputs: Optional expected outputs by input. Outputs
+            of runs on these inputs are compared with them (see
+            `TimerBase.run`), and runs with other outputs are wrong answers.
+
+        Peak memory of successful runs (and wrong answers) is collected in
+        `peak_memory` by input, in KiB. It is None for runs which did not
+        measure it, e.g. results found in the cache.
+        """
         self.timer = timer
         self.threads = threads
+        self.budget = budget
+        self.cache = cache
+        self.pin = pin
+        self.reserve = reserve
+        self.expected_outputs = expected_outputs
+        self.peak_memory = {}
+        self._exe_hash = None
+        self._cpus = None
+        self._stop = None
+        self._stopped = threading.Event()
 
-    def measure(self, input_files: Iterable[str]) -> List[float]:
-        """ Runs timer for each input file and returns the results (in seconds).
+    def _expected(self, input_file: Input) -> Optional[Input]:
+        """ Returns the expected output of an input, if any. """
+        return self.expected_outputs.get(input_file) if self.expected_outputs else None
+
+    def _timer_args(self, input_file: Input) -> tuple:
+        """ Returns arguments of a run of the timer on an input. """
+        expected = self._expected(input_file)
+        return (input_file,) if expected is None else (input_file, expected)
+
+    def _run(self, input_file: Input) -> Measurement:
+        """ Runs timer for a single input file, on a dedicated CPU if pinning. """
+        if self._cpus is None:
+            return self.timer.run(*self._timer_args(input_file))
+        cpu = self._cpus.get()
+        try:
+            # Affinity of the calling thread is inherited by the processes it spawns
+            os.sched_setaffinity(0, {cpu})
+            return self.timer.run(*self._timer_args(input_file))
+        finally:
+            self._cpus.put(cpu)
+
+    def _cached(self, input_file: Input) -> Tuple[Optional[Measurement], Optional[str]]:
+        """ Looks up a result in the cache.
+
+        :return: The cached measurement (if found) and the input hash.
+        """
+        if not self.cache:
+            return None, None
+        input_hash = input_source(input_file).hash()
+        expected = self._expected(input_file)
+        if expected is not None:
+            # Only verified runs are cached, so results are not shared with unverified ones
+            input_hash += ':' + input_source(expected).hash()
+        result = self.cache.get(self._exe_hash, input_hash, self.timer.kind())
+        return (Measurement(Measurement.OK, result) if result is not None else None), input_hash
+
+    def _store(self, input_hash: Optional[str], measurement: Measurement) -> None:
+        """ Stores a result in the cache. Failed runs are not cached, so that
+        they are reported again. Peak memory is not cached either. """
+        if self.cache and measurement.status == Measurement.OK:
+            self.cache.put(self._exe_hash, input_hash, self.timer.kind(), measurement.time)
+
+    def _record(self, input_file: Input, measurement: Measurement, wall: float, cached: bool) -> None:
+        """ Records a measurement for the stats report (see `sinolify.utils.stats`)
+        and its peak memory. """
+        if measurement.status in (Measurement.OK, Measurement.WRONG_ANSWER):
+            self.peak_memory[input_file] = measurement.memory
+        ghz = getattr(self.timer, 'ghz', None)
+        stats.record('measurement', input=os.path.basename(str(input_file)), status=measurement.status,
+                     time=measurement.time, wall=wall, cached=cached, memory=measurement.memory,
+                     instructions=round(measurement.time * ghz * 10**9) if ghz else None)
+
+    def _stopping(self, measurement: Measurement) -> bool:
+        """ Checks if a measurement decides the outcome and the remaining
+        runs should be stopped. """
+        return self._stop is not None and self._stop(measurement)
+
+    def _measure(self, input_file: Input) -> Measurement:
+        """ Runs timer for a single input file within the budget. """
+        if self._stopped.is_set():
+            return Measurement(Measurement.CANCELLED)
+        result, input_hash = self._cached(input_file)
+        if result is not None:
+            self._record(input_file, result, 0, True)
+            return result
+        if self.budget is None:
+            start = time.perf_counter()
+            result = self._run(input_file)
+        else:
+            with self.budget:
+                start = time.perf_counter()
+                result = self._run(input_file)
+        self._record(input_file, result, time.perf_counter() - start, False)
+        self._store(input_hash, result)
+        if self._stopping(result):
+            self._stopped.set()
+            self.timer.kill()
+        return result
+
+    def _setup_cpus(self) -> int:
+        """ Prepares the CPUs to pin the runs to.
+
+        :return: Number of threads to use.
+        """
+        self._cpus = None
+        if not self.pin:
+            return self.threads
+        if not hasattr(os, 'sched_setaffinity'):
+            log.warning('Pinning to CPUs is not supported on this system')
+            return self.threads
+        cpus = sorted(os.sched_getaffinity(0))
+        if self.reserve >= len(cpus):
+            log.warning('Unable to reserve %d of %d CPU(s)', self.reserve, len(cpus))
+        else:
+            cpus = cpus[self.reserve:]
+        self._cpus = queue.SimpleQueue()
+        for cpu in cpus:
+            self._cpus.put(cpu)
+        log.debug('Pinning runs to CPU(s) %s', ', '.join(map(str, cpus)))
+        return min(self.threads, len(cpus))
+
+    def _start(self, input_files: List[Input], stop: Optional[Callable[[Measurement], bool]]) -> List[int]:
+        """ Prepares a run of the pool.
+
+        :return: Indices of the input files in order they should be measured.
+        """
+        self._stop = stop
+        self._stopped = threading.Event()
+        if self.cache:
+            self._exe_hash = file_hash(self.timer.exe_file)
+            self._hits, self._misses = self.cache.hits, self.cache.misses
+        sizes = [input_source(f).size for f in input_files]
+        return sorted(range(len(input_files)), key=lambda i: -sizes[i])
+
+    def _finish(self, results: List[Measurement]) -> List[Measurement]:
+        """ Logs a summary of a run of the pool. """
+        if self.cache:
+            log.info('Measurement cache: %d hit(s), %d miss(es)',
+                     self.cache.hits - self._hits, self.cache.misses - self._misses)
+        cancelled = sum(m.status == Measurement.CANCELLED for m in results)
+        if cancelled:
+            log.info('Cancelled %d run(s)', cancelled)
+        return results
+
+    def run(self, input_files: Iterable[Input],
+            stop: Optional[Callable[[Measurement], bool]] = None) -> List[Measurement]:
+        """ Runs timer for each input file and returns the measurements.
 
         The order of results is same as order of input files.
+
+        :param stop: An optional predicate deciding that a measurement settles
+            the outcome. Once it holds, runs in progress are killed (if the
+            timer supports it) and the remaining ones are cancelled.
+        """
+        input_files = list(input_files)
+        order = self._start(input_files, stop)
+        threads = self._setup_cpus()
+        with stats.span('measure', inputs=len(input_files), threads=threads), \
+                ThreadPoolExecutor(max_workers=threads) as executor:
+            futures = {}
+            for i in order:
+                futures[i] = executor.submit(self._measure, input_files[i])
+            results = [futures[i].result() for i in range(len(input_files))]
+        return self._finish(results)
+
+    def measure(self, input_files: Iterable[Input]) -> List[float]:
+        """ Runs timer for each input file and returns the results (in seconds).
+
+        The order of results is same as order of input files. Stops at the
+        first timeout and dies, runtime errors are reported and result in 0.
         """
-        with ThreadPoolExecutor(max_workers=self.threads) as executor:
-            futures = []
-            for input_file in input_files:
-                futures.append(executor.submit(self.timer.measure, input_file))
-            return [f.result() for f in futures]
+        input_files = list(input_files)
+        measurements = self.run(input_files, stop=lambda m: m.status == Measurement.TIME_LIMIT_EXCEEDED)
+        for input_file, measurement in zip(input_files, measurements):
+            if measurement.status == Measurement.TIME_LIMIT_EXCEEDED:
+                checked_time(input_file, measurement)
+        return [checked_time(f, m) for f, m in zip(input_files, measurements)]
+
+
+class AsyncTimerPool(TimerPool):
+    """ Measures execution time on multiple inputs using asyncio.
+
+    Runs are coroutines of the timer (see `TimerBase.run_async`), so many
+    runs can be in progress without a thread each. Pinning to CPUs is not
+    supported.
+    """
+
+    async def _measure_async(self, input_file: Input) -> Measurement:
+        """ Runs timer for a single input file within the budget. """
+        result, input_hash = self._cached(input_file)
+        if result is not None:
+            self._record(input_file, result, 0, True)
+            return result
+        if self.budget is None:
+            start = time.perf_counter()
+            result = await self.timer.run_async(*self._timer_args(input_file))
+        else:
+            # The budget may be shared with other processes, so it is polled
+            # instead of blocking the loop
+            while not self.budget.acquire(False):
+                await asyncio.sleep(0.01)
+            try:
+                start = time.perf_counter()
+                result = await self.timer.run_async(*self._timer_args(input_file))
+            finally:
+                self.budget.release()
+        self._record(input_file, result, time.perf_counter() - start, False)
+        self._store(input_hash, result)
+        return result
+
+    async def _run_all(self, input_files: List[Input], order: List[int]) -> List[Measurement]:
+        results = [Measurement(Measurement.CANCELLED)] * len(input_files)
+        semaphore = asyncio.Semaphore(self.threads)
+        tasks = []
+
+        async def run_one(i: int):
+            async with semaphore:
+                results[i] = await self._measure_async(input_files[i])
+            if self._stopping(results[i]):
+                for task in tasks:
+                    if task is not asyncio.current_task():
+                        task.cancel()
+                self.timer.kill()
+
+        tasks.extend(asyncio.ensure_future(run_one(i)) for i in order)
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def run(self, input_files: Iterable[Input],
+            stop: Optional[Callable[[Measurement], bool]] = None) -> List[Measurement]:
+        input_files = list(input_files)
+        if self.pin:
+            log.warning('Pinning to CPUs is not supported by asyncio pool')
+        order = self._start(input_files, stop)
+        with stats.span('measure', inputs=len(input_files), threads=self.threads):
+            return self._finish(asyncio.run(self._run_all(input_files, order)))
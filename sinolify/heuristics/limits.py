@@ -1,39 +1,205 @@
 import math
+import random
 import shutil
 import tempfile
 import os.path
+from typing import Iterable, List, NamedTuple, Dict, Optional
 
-from sinolify.executors.compilers import compiler
-from sinolify.executors.timer import TimerPool, PerfTimer
+from sinolify.executors.compilers import compiler, CompileCache
+from sinolify.executors.timer import TimerPool, AsyncTimerPool, MeasurementCache, Input, default_timer, \
+    input_source
 from sinolify.utils.log import log, die
 
 
-def pick_time_limits(src_file: str, input_files: str, *, threads: int = 1):
-    """ Heuristically picks time limits based on solution's performance.
+def time_limit(max_time: float) -> float:
+    """ Multiplies maximum time by 3 and rounds it up to a multiply of 0.5s. """
+    limit = 3 * max_time
+    return math.ceil(2*limit)/2
+
+
+def memory_limit(max_memory: int) -> int:
+    """ Doubles maximum memory (in KiB) and rounds it up to a multiply of 16MiB. """
+    return math.ceil(2 * max_memory / 16384) * 16384
+
+
+def pick_memory_limits(peak_memory: Iterable[Optional[int]]) -> Optional[int]:
+    """ Heuristically picks a memory limit based on solution's peak memory,
+    e.g. collected by `TimerPool` while measuring its time.
+
+    Maximum peak memory is doubled and rounded up to a multiply of 16MiB.
+
+    :param peak_memory: Peak resident set sizes of solution's runs in KiB,
+        None for runs which did not measure it.
+
+    :returns: Suggested memory limit in KiB, or None if there are no runs
+        or some of them did not measure peak memory.
+    """
+    peak_memory = list(peak_memory)
+    if not peak_memory or None in peak_memory:
+        return None
+    return memory_limit(max(peak_memory))
+
+
+class Limits(NamedTuple):
+    """ Result of `pick_limits`. """
+    time: float
+    memory: Optional[int]
+
+
+class Estimate(NamedTuple):
+    """ Result of `estimate_max_time`. """
+    max_time: float
+    runs: int
+    skipped: int
+    sampled: int
+    violation_bound: float
+
+
+def estimate_max_time(pool: TimerPool, input_files: List[Input], *, tolerance: float = 0.25,
+                      batch: int = 0, sample_rate: float = 0.05, min_samples: int = 3,
+                      seed: int = 0) -> Estimate:
+    """ Estimates maximum time of a solution, skipping runs which can not
+    change the time limit.
+
+    Inputs are measured from the largest one. The time of every remaining
+    input is predicted from the measured ones, assuming it is at most linear
+    in the input size plus a constant: the prediction for size s is
+    max(t_j * s / s_j) + min(t_j) over measured inputs j. Once predictions of
+    all remaining inputs (with `tolerance` added) are too small to raise the
+    rounded limit (see `time_limit`), they are skipped, except for a random
+    sample checking the predictions. If any sampled time exceeds its
+    prediction, all skipped inputs are measured after all.
+
+    :param pool: Pool to measure the times with.
+
+    :param input_files: Input files or sources.
+
+    :param tolerance: Relative error allowed in the predictions.
+
+    :param batch: Number of inputs measured at once, twice the number of the
+        pool threads by default.
+
+    :param sample_rate: Share of skipped inputs sampled.
+
+    :param min_samples: Minimum number of sampled inputs.
+
+    :param seed: Seed of the sample.
+
+    :return: The estimate, including the numbers of runs, skipped and sampled
+        inputs and, if no prediction failed, a 95% upper bound on the share of
+        skipped inputs with failed predictions (by the rule of three).
+    """
+    batch = batch or 2 * pool.threads
+    sizes = {f: max(input_source(f).size, 1) for f in input_files}
+    remaining = sorted(input_files, key=lambda f: -sizes[f])
+    times: Dict[Input, float] = {}
+    rate, overhead = 0.0, math.inf
+
+    def measure(files: List[Input]) -> None:
+        nonlocal rate, overhead
+        for f, t in zip(files, pool.measure(files)):
+            times[f] = t
+            rate = max(rate, t / sizes[f])
+            overhead = min(overhead, t)
+
+    def predict(f: Input) -> float:
+        return rate * sizes[f] + overhead
+
+    measure(remaining[:batch])
+    remaining = remaining[batch:]
+    # Predictions grow with size, so it is enough to check the largest remaining input
+    while remaining and (1 + tolerance) * predict(remaining[0]) > time_limit(max(times.values())) / 3:
+        measure(remaining[:batch])
+        remaining = remaining[batch:]
+
+    if not remaining:
+        return Estimate(max(times.values()), len(times), 0, 0, 0)
+    predictions = {f: predict(f) for f in remaining}
+    count = min(len(remaining), max(min_samples, math.ceil(sample_rate * len(remaining))))
+    sample = random.Random(seed).sample(remaining, count)
+    measure(sample)
+    failed = [f for f in sample if times[f] > (1 + tolerance) * predictions[f]]
+    if failed:
+        log.warning('Time of %s exceeds its prediction, measuring all inputs', ', '.join(map(str, failed)))
+        measure([f for f in remaining if f not in times])
+        return Estimate(max(times.values()), len(times), 0, count, 0)
+    skipped = len(remaining) - count
+    return Estimate(max(times.values()), len(times), skipped, count, min(1.0, 3 / count) if skipped else 0)
+
+
+def pick_limits(src_file: str, input_files: List[Input], *, threads: int = 1, budget=None,
+                compile_cache: CompileCache = None, measurement_cache: MeasurementCache = None,
+                pin: bool = False, reserve: int = 0, engine: str = 'threads',
+                adaptive: bool = False, expected_outputs: Optional[Dict[Input, Input]] = None) -> Limits:
+    """ Heuristically picks time and memory limits based on solution's performance.
 
     The solution is compiled and run on all input files.
     Maximum time is multiplied by 3 and rounded up to a multiply of 0.5s.
+    The memory limit is picked from peak memory of the same runs (see
+    `pick_memory_limits`), if the timer measures it.
 
     :param src_file: Solution source file.
 
-    :param input_files: Input files to test solution on.
+    :param input_files: Input files or sources (see `InputSource`) to test
+        solution on.
 
     :param threads: Number of parallel runs allowed.
 
-    :returns: Suggested time limit.
+    :param budget: Optional semaphore limiting parallel runs across processes.
+
+    :param compile_cache: Optional cache of compiled solutions.
+
+    :param measurement_cache: Optional cache of measurement results.
+
+    :param pin: If set, runs are pinned to dedicated CPUs.
+
+    :param reserve: Number of CPUs left free when pinning.
+
+    :param engine: Measurement engine, `threads` (see `TimerPool`) or `async`
+        (see `AsyncTimerPool`).
+
+    :param adaptive: If set, runs which can not change the limit are skipped
+        (see `estimate_max_time`).
+
+    :param expected_outputs: Optional expected outputs by input. Outputs of
+        the solution are verified against them while it is measured, wrong
+        answers are reported.
+
+    :returns: Suggested time limit and memory limit (None if peak memory
+        is not measured).
     """
     log.info(f'Picking time limits for {src_file}')
     with tempfile.TemporaryDirectory() as sandbox:
         src_ext = os.path.splitext(src_file)[1]
         sandboxed_src = os.path.join(sandbox, f'a{src_ext}')
         shutil.copy(src_file, sandboxed_src)
-        c = compiler(sandboxed_src, output_ext='.e')
+        c = compiler(sandboxed_src, output_ext='.e', cache=compile_cache)
         if not c.compile():
             log.info(c.log)
             die('Failed to compile model solution')
         log.debug(c.log)
         sandboxed_exe = os.path.join(sandbox, 'a.e')
-        times = TimerPool(PerfTimer(sandboxed_exe, timeout=20), threads=threads).measure(input_files)
-        max_time = max(times)
-        limit = 3 * max_time
-        return math.ceil(2*limit)/2
\ No newline at end of file
+        pool = (AsyncTimerPool if engine == 'async' else TimerPool)(
+            default_timer(sandboxed_exe, timeout=20), threads=threads, budget=budget,
+            cache=measurement_cache, pin=pin, reserve=reserve, expected_outputs=expected_outputs)
+        if adaptive:
+            estimate = estimate_max_time(pool, list(input_files))
+            log.info('Skipped %d of %d run(s), sampled %d, 95%% upper bound on mispredicted skipped inputs: %.0f%%',
+                     estimate.skipped, len(input_files), estimate.sampled, 100 * estimate.violation_bound)
+            max_time = estimate.max_time
+        else:
+            max_time = max(pool.measure(input_files))
+        memory = pick_memory_limits(pool.peak_memory.values())
+        if memory is None:
+            log.info('Peak memory of some runs is not measured (by %s or cached), no memory limit picked',
+                     pool.timer.kind())
+        return Limits(time_limit(max_time), memory)
+
+
+def pick_time_limits(src_file: str, input_files: List[Input], **kwargs) -> float:
+    """ Heuristically picks time limits based on solution's performance, see
+    `pick_limits` for the arguments.
+
+    :returns: Suggested time limit.
+    """
+    return pick_limits(src_file, input_files, **kwargs).time
@@ -0,0 +1,67 @@
+import contextlib
+import io
+import os
+import tempfile
+from typing import List, Tuple
+from unittest import TestCase
+
+from sinolify.benchmarks.generator import generate_package
+from sinolify.tools.batch import BatchConvertTool
+
+
+class TestBatchConvert(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sources = os.path.join(self.tmp.name, 'sources')
+        self.output = os.path.join(self.tmp.name, 'output')
+        os.mkdir(self.sources)
+        os.mkdir(self.output)
+        # Without a checker mapping, the package with a checker fails to convert
+        generate_package(os.path.join(self.sources, 'a.zip'), id='a', tests=2, input_size=16, checker=False)
+        generate_package(os.path.join(self.sources, 'b.zip'), id='b', tests=2, input_size=16)
+        super().setUp()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_tool(self, *args: str) -> Tuple[int, List[str]]:
+        """ Runs the tool on the sources, returning its exit status and output lines. """
+        stdout = io.StringIO()
+        code = 0
+        with contextlib.redirect_stdout(stdout):
+            try:
+                BatchConvertTool([self.sources, '-p', '2', '-v', 'error', *args]).main()
+            except SystemExit as e:
+                code = e.code
+        return code, stdout.getvalue().splitlines()
+
+    def test_summary(self):
+        code, lines = self.run_tool('-o', self.output)
+        self.assertEqual(1, code)
+        self.assertEqual(f'OK      {os.path.join(self.sources, "a.zip")}', lines[0])
+        self.assertTrue(lines[1].startswith(f'FAILED  {os.path.join(self.sources, "b.zip")}: '))
+        self.assertIn('no checker mapper', lines[1])
+        self.assertEqual('1 converted, 1 failed, 0 skipped', lines[2])
+        self.assertEqual(['a.zip'], os.listdir(self.output))
+
+    def test_skipped(self):
+        self.run_tool('-o', self.output)
+        code, lines = self.run_tool('-o', self.output)
+        self.assertEqual(1, code)
+        self.assertEqual('0 converted, 1 failed, 1 skipped', lines[-1])
+
+    def test_dry(self):
+        code, lines = self.run_tool('--dry')
+        self.assertEqual(1, code)
+        self.assertEqual('1 converted, 1 failed, 0 skipped', lines[-1])
+        self.assertEqual([], os.listdir(self.output))
+        with self.assertRaises(SystemExit):
+            BatchConvertTool([self.sources, '-v', 'error'])
+
+    def test_same_names(self):
+        other = os.path.join(self.tmp.name, 'other')
+        os.mkdir(other)
+        generate_package(os.path.join(other, 'a.zip'), id='a', tests=2, input_size=16, checker=False)
+        with self.assertRaises(SystemExit):
+            BatchConvertTool([self.sources, other, '-o', self.output, '-v', 'error']).main()
+        self.assertEqual([], os.listdir(self.output))
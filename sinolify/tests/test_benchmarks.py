@@ -0,0 +1,40 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from sinolify.benchmarks.generator import generate_mapping, generate_package
+from sinolify.benchmarks.suite import BenchmarkSuite, compare
+from sinolify.converters.sowa import SowaToSinolConverter
+from sinolify.utils.package import Package
+
+
+class TestBenchmarks(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_generated_package(self):
+        path = generate_package(os.path.join(self.tmp.name, 'syn.zip'), tests=7, input_size=1 << 10)
+        mapping = generate_mapping(os.path.join(self.tmp.name, 'mapping'), checkers=5)
+        source = Package(zip=path, lazy=True)
+        target = Package(id='syn')
+        converter = SowaToSinolConverter(source, target, auto_time_limits=False,
+                                         checkers=(os.path.join(mapping, 'find'), os.path.join(mapping, 'replace')))
+        converter.convert()
+        self.assertEqual(set(), converter.not_processed())
+        self.assertEqual(7, len(list(target.find(r'in/syn\d+[a-c]\.in'))))
+        self.assertEqual(['prog/synchk.cpp'], list(target.find('prog/synchk.*')))
+
+    def test_suite(self):
+        suite = BenchmarkSuite(self.tmp.name, tests=3, input_size=1 << 10, checkers=5, repeat=1)
+        results = suite.run(['package_find', 'mapping_lookup', 'timer_pool'])
+        self.assertEqual({'package_find', 'mapping_lookup', 'timer_pool'}, set(results))
+        self.assertGreater(results['package_find']['seconds'], 0)
+        self.assertTrue('seconds' in results['timer_pool'] or 'skipped' in results['timer_pool'])
+
+    def test_compare(self):
+        comparisons = compare({'a': {'seconds': 1.5}, 'b': {'seconds': 1.0}, 'c': {'skipped': 'no perf'}},
+                              {'a': {'seconds': 1.0}, 'b': {'seconds': 1.0}, 'c': {'seconds': 1.0}})
+        self.assertEqual([('a', True), ('b', False)], [(c.name, c.regression) for c in comparisons])
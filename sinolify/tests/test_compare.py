@@ -0,0 +1,64 @@
+from unittest import TestCase
+import io
+import os.path
+import random
+import tempfile
+
+from sinolify.executors.compare import TokenComparator, open_expected
+
+
+def compare(output: bytes, expected: bytes, chunk: int = 3) -> TokenComparator:
+    comparator = TokenComparator(io.BytesIO(expected))
+    for i in range(0, len(output), chunk):
+        comparator.feed(output[i:i + chunk])
+    comparator.finish()
+    return comparator
+
+
+class TestTokenComparator(TestCase):
+    def test_whitespace(self):
+        self.assertIsNone(compare(b'12 345\n6\n', b'  12\t345 6').mismatch)
+        self.assertIsNone(compare(b'', b'\n\n').mismatch)
+
+    def test_mismatch(self):
+        self.assertEqual("expected b'345', got b'34'", compare(b'12 34 5', b'12 345').mismatch)
+        self.assertEqual("expected b'1', got b'12'", compare(b'12', b'1 2').mismatch)
+        self.assertEqual("expected b'123', got b'12'", compare(b'12', b'123').mismatch)
+        self.assertEqual("expected b'12', got b'123'", compare(b'123', b'12').mismatch)
+        self.assertIn('shorter', compare(b'1 2', b'1 2 3').mismatch)
+        self.assertIn('longer', compare(b'1 2 3', b'1 2').mismatch)
+
+    def test_stops_at_mismatch(self):
+        comparator = TokenComparator(io.BytesIO(b'1 2 3'))
+        self.assertFalse(comparator.feed(b'1 5 '))
+        self.assertFalse(comparator.feed(b'3'))
+        self.assertFalse(comparator.finish())
+        self.assertEqual("expected b'2', got b'5'", comparator.mismatch)
+
+    def test_random_chunks(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            tokens = [str(rng.randrange(100)).encode() for _ in range(rng.randrange(30))]
+            expected = b''.join(t + rng.choice([b' ', b'\n', b'  ', b'\r\n']) for t in tokens)
+            output = bytearray(expected if rng.random() < 0.5 else b' '.join(tokens))
+            if output and rng.random() < 0.5:
+                output[rng.randrange(len(output))] = ord(rng.choice('0 x'))
+            comparator = compare(bytes(output), expected, rng.randrange(1, 8))
+            self.assertEqual(bytes(output).split() == expected.split(), comparator.mismatch is None)
+
+
+class TestOpenExpected(TestCase):
+    def test_open(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'a.out')
+            with open(path, 'wb') as f:
+                f.write(b'1 2\n' * 100000)
+            with open_expected(open(path, 'rb')) as expected:
+                comparator = TokenComparator(expected)
+                self.assertTrue(comparator.feed(b'1 2\n' * 50000))
+                self.assertTrue(comparator.feed(b'1 2\n' * 50000))
+                self.assertTrue(comparator.finish())
+            empty = os.path.join(tmp_dir, 'b.out')
+            open(empty, 'wb').close()
+            with open_expected(open(empty, 'rb')) as expected:
+                self.assertTrue(TokenComparator(expected).finish())
@@ -0,0 +1,36 @@
+from unittest import TestCase, skipUnless
+import os.path
+import shutil
+import tempfile
+
+from sinolify.executors.compilers import compiler, CompileCache
+
+
+@skipUnless(shutil.which('g++'), 'g++ is not installed')
+class TestCompileCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = CompileCache(os.path.join(self.tmp_dir.name, 'cache'))
+        self.src = os.path.join(self.tmp_dir.name, 'a.cpp')
+        with open(self.src, 'w') as f:
+            f.write('int main() { return 0; }\n')
+        super().setUp()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hit(self):
+        c = compiler(self.src, flags=['-O0'], cache=self.cache)
+        key = self.cache.key(c)
+        self.assertTrue(c.compile())
+        os.remove(c.exe_path)
+        c.cmd = lambda: ['false']  # Compiling again would fail
+        self.assertTrue(c.compile())
+        self.assertTrue(os.access(c.exe_path, os.X_OK))
+        self.assertNotEqual(key, self.cache.key(compiler(self.src, flags=['-O1'], cache=self.cache)))
+
+    def test_evict(self):
+        self.cache.max_size = 0
+        c = compiler(self.src, flags=['-O0'], cache=self.cache)
+        self.assertTrue(c.compile())
+        self.assertFalse(self.cache.get(self.cache.key(c), c.exe_path))
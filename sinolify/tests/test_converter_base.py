@@ -1,9 +1,11 @@
 from sinolify.utils.package import Package
-from sinolify.converters.base import ConverterBase
+from sinolify.converters.base import ConverterBase, Rule, dump_manifest, load_manifest
 from sinolify.utils.log import log
 
 import logging
 import os.path
+import tempfile
+import zipfile
 from unittest import TestCase
 
 
@@ -54,3 +56,36 @@ class TestConverterBase(TestCase):
         self.converter.ignore(r'main/.*')
         self.assertEqual({'other/file7'}, self.converter.not_processed())
 
+    def test_apply(self):
+        counts = self.converter.apply([
+            Rule(r'main/file1', Rule.IGNORE),
+            Rule(r'main/(.*)', rename=r'copied/\1', ignore_processed=True),
+            Rule(r'(main|other)/file[17]', rename=lambda p: p + '.all'),
+            Rule(r'main/.*', rename=r'never', ignore_processed=True),
+            Rule(r'other/.*', rename=r'never', condition=lambda p: False),
+        ])
+        self.assertEqual([1, 2, 2, 0, 0], counts)
+        self.assertEqual({'copied/file2c.c', 'copied/file3.txt', 'main/file1.all', 'other/file7.all'},
+                         set(self.target.find('.*')))
+        self.assertEqual(set(), self.converter.not_processed())
+        self.assertEqual([('main/file1', None), ('main/file2c.c', 'copied/file2c.c'),
+                          ('main/file3.txt', 'copied/file3.txt'), ('main/file1', 'main/file1.all'),
+                          ('other/file7', 'other/file7.all')],
+                         [(path, target) for path, _, target in self.converter.report])
+
+    def test_apply_backreference(self):
+        self.assertEqual([1, 1], self.converter.apply([Rule(r'(m)ain/file\d\1?', Rule.IGNORE),
+                                                        Rule(r'other/.*', Rule.IGNORE)]))
+
+    def test_manifest(self):
+        manifest = {'time_limits': {'digest': '0' * 64, 'config': 'time_limits:\n    1a: 1000'}}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'out.zip')
+            self.assertEqual({}, load_manifest(path))
+            with zipfile.ZipFile(path, 'w') as zip:
+                zip.writestr('a/config.yml', '')
+            self.assertEqual({}, load_manifest(path))
+            with zipfile.ZipFile(path, 'a') as zip:
+                zip.comment = dump_manifest(manifest)
+            self.assertEqual(manifest, load_manifest(path))
+        self.assertEqual(b'', dump_manifest({'long': 'x' * 0x10000}))
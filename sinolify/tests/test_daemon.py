@@ -0,0 +1,98 @@
+import os
+import random
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from sinolify.benchmarks.generator import checker_source, generate_mapping, generate_package
+from sinolify.tools.daemon import Admission, Daemon, submit
+from sinolify.utils.package import Package
+
+
+class TestAdmission(TestCase):
+    def test_admit(self):
+        admission = Admission(2)
+        order = []
+        waited = threading.Event()
+
+        def job(name, cpus):
+            with admission.admit(cpus, waited.set):
+                order.append(name)
+
+        with admission.admit(3):
+            self.assertEqual(0, admission.free)
+            with admission.admit(0):
+                pass
+            t = threading.Thread(target=job, args=('b', 1))
+            t.start()
+            self.assertTrue(waited.wait(5))
+            time.sleep(0.05)
+            self.assertEqual([], order)
+        t.join(5)
+        self.assertEqual(['b'], order)
+        self.assertEqual(2, admission.free)
+
+
+class TestDaemon(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = generate_package(os.path.join(self.tmp.name, 'syn.zip'), tests=3, input_size=1 << 10)
+        self.checkers = generate_mapping(os.path.join(self.tmp.name, 'mapping'), checkers=3)
+        self.socket = os.path.join(self.tmp.name, 'daemon.sock')
+        self.daemon = Daemon(self.socket, cpus=2, processes=1, checkers=self.checkers)
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.thread.join()
+        self.daemon.close()
+        self.tmp.cleanup()
+
+    def test_submit(self):
+        output = os.path.join(self.tmp.name, 'out.zip')
+        with self.assertLogs('sinolify.utils', 'INFO') as logs:
+            self.assertTrue(submit(self.socket, self.source, output, dict(time=False), checkers=self.checkers))
+        self.assertIn(f'INFO:sinolify.utils:Output saved to {output}', logs.output)
+        self.assertEqual(3, len(list(Package(zip=output).find(r'in/syn\d+[a-c]\.in'))))
+
+        # The output exists and overwriting it is not allowed
+        with self.assertLogs('sinolify.utils', 'ERROR'):
+            self.assertFalse(submit(self.socket, self.source, output, dict(time=False), checkers=self.checkers))
+
+    def test_checkers_changed(self):
+        source = generate_package(os.path.join(self.tmp.name, 'new.zip'), tests=1, input_size=16, seed=1)
+        output = os.path.join(self.tmp.name, 'out.zip')
+        with self.assertLogs('sinolify.utils', 'ERROR') as logs:
+            self.assertFalse(submit(self.socket, source, output, dict(time=False), checkers=self.checkers))
+        todo = [f for f in os.listdir(os.path.join(self.checkers, 'replace')) if f.endswith('.todo')]
+        self.assertEqual(1, len(todo))
+        self.assertIn(f'Putting the checker in mapper as {todo[0][:-5]}', logs.output[-1])
+
+        # Submitted again, the checker is found in the mapping and its copy being fixed is kept
+        with self.assertLogs('sinolify.utils', 'ERROR') as logs:
+            self.assertFalse(submit(self.socket, source, output, dict(time=False), checkers=self.checkers))
+        self.assertIn('Unable to find a replacement', logs.output[-1])
+        shutil.copy(os.path.join(self.checkers, 'replace', todo[0]),
+                    os.path.join(self.checkers, 'replace', todo[0][:-5]))
+        self.assertTrue(submit(self.socket, source, output, dict(time=False), checkers=self.checkers))
+
+        # A checker mapped while the daemon runs is found
+        source = generate_package(os.path.join(self.tmp.name, 'other.zip'), tests=1, input_size=16, seed=2)
+        for directory in ['find', 'replace']:
+            with open(os.path.join(self.checkers, directory, 'other.cpp'), 'w') as f:
+                f.write(checker_source(random.Random(2), 0))
+        output = os.path.join(self.tmp.name, 'other-out.zip')
+        self.assertTrue(submit(self.socket, source, output, dict(time=False), checkers=self.checkers))
+
+    def test_worker_died(self):
+        output = os.path.join(self.tmp.name, 'out.zip')
+        self.assertTrue(submit(self.socket, self.source, output, dict(time=False), checkers=self.checkers))
+        for pid in list(self.daemon._executor._processes):
+            os.kill(pid, signal.SIGKILL)
+        for name in ['out2.zip', 'out3.zip']:
+            output = os.path.join(self.tmp.name, name)
+            self.assertTrue(submit(self.socket, self.source, output, dict(time=False), checkers=self.checkers))
@@ -0,0 +1,68 @@
+from unittest import TestCase
+import os.path
+import tempfile
+
+from sinolify.executors.timer import TimerBase, TimerPool
+from sinolify.heuristics.limits import time_limit, estimate_max_time, memory_limit, pick_memory_limits
+
+
+class FakeTimer(TimerBase):
+    """ A fake timer with times given by a function of input size. """
+    def __init__(self, time):
+        super().__init__('/dev/null')
+        self.time = time
+        self.runs = 0
+
+    def measure(self, input_file: str) -> float:
+        self.runs += 1
+        return self.time(os.path.getsize(input_file))
+
+
+class TestLimits(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.inputs = []
+        for i, size in enumerate([100000] * 3 + [10] * 200):
+            path = os.path.join(self.tmp_dir.name, f'{i}.in')
+            with open(path, 'w') as f:
+                f.write('x' * size)
+            self.inputs.append(path)
+        super().setUp()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_time_limit(self):
+        self.assertEqual(0.5, time_limit(0.01))
+        self.assertEqual(1.0, time_limit(0.2))
+        self.assertEqual(1.5, time_limit(0.34))
+
+    def test_memory_limit(self):
+        self.assertEqual(16384, memory_limit(3000))
+        self.assertEqual(32768, memory_limit(8200))
+        self.assertEqual(32768, pick_memory_limits([3000, 16384, 1000]))
+        self.assertIsNone(pick_memory_limits([]))
+        self.assertIsNone(pick_memory_limits([3000, None]))
+
+    def test_skip(self):
+        timer = FakeTimer(lambda size: size * 1e-6)
+        estimate = estimate_max_time(TimerPool(timer, threads=2), self.inputs)
+        self.assertAlmostEqual(0.1, estimate.max_time)
+        self.assertEqual(timer.runs, estimate.runs)
+        self.assertEqual(203, estimate.runs + estimate.skipped)
+        self.assertEqual(10, estimate.sampled)
+        self.assertLess(estimate.runs, 20)
+        self.assertAlmostEqual(0.3, estimate.violation_bound)
+
+    def test_misprediction(self):
+        timer = FakeTimer(lambda size: size * 1e-6 if size > 10 else 0.15)
+        estimate = estimate_max_time(TimerPool(timer, threads=2), self.inputs)
+        self.assertEqual(0.15, estimate.max_time)
+        self.assertEqual(0, estimate.skipped)
+        self.assertEqual(203, timer.runs)
+
+    def test_close_to_limit(self):
+        timer = FakeTimer(lambda size: size * 1.6e-6 if size > 10 else 0.15)
+        estimate = estimate_max_time(TimerPool(timer, threads=2), self.inputs)
+        self.assertAlmostEqual(0.16, estimate.max_time)
+        self.assertEqual(0, estimate.skipped)
@@ -0,0 +1,126 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from sinolify.converters.mapping import ConversionMapping
+
+
+class CountingMapping(ConversionMapping):
+    hashed = []
+
+    @staticmethod
+    def hash(file_path):
+        CountingMapping.hashed.append(os.path.basename(file_path))
+        return ConversionMapping.hash(file_path)
+
+
+class TestConversionMapping(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.find = os.path.join(self.tmp.name, 'find')
+        self.replace = os.path.join(self.tmp.name, 'replace')
+        os.mkdir(self.find)
+        os.mkdir(self.replace)
+        for name, contents in [('a.cpp', 'int a;'), ('b.cpp', 'int bb;'), ('c.cpp.ignore', 'int c;')]:
+            with open(os.path.join(self.find, name), 'w') as f:
+                f.write(contents)
+        with open(os.path.join(self.replace, 'a.cpp'), 'w') as f:
+            f.write('int A;')
+        CountingMapping.hashed = []
+        super().setUp()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, contents):
+        path = os.path.join(self.tmp.name, 'checker.cpp')
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_find(self):
+        mapping = ConversionMapping(self.find, self.replace)
+        self.assertEqual(os.path.join(self.replace, 'a.cpp'), mapping.find(self.write('int a;')))
+        self.assertIsNone(mapping.find(self.write('int c;')))
+        with self.assertRaises(ConversionMapping.ReplaceError):
+            mapping.find(self.write('int bb;'))
+        with self.assertRaises(ConversionMapping.FindError):
+            mapping.find(self.write('int d;'))
+
+    def test_size_prefilter(self):
+        mapping = CountingMapping(self.find, self.replace)
+        CountingMapping.hashed = []
+        with self.assertRaises(ConversionMapping.FindError):
+            mapping.find(self.write('int dddd;'))
+        self.assertEqual([], CountingMapping.hashed)
+
+    def test_index(self):
+        CountingMapping(self.find, self.replace)
+        self.assertEqual(['a.cpp', 'b.cpp', 'c.cpp.ignore'], sorted(CountingMapping.hashed))
+        self.assertTrue(os.path.isfile(self.find + '.index.json'))
+
+        CountingMapping.hashed = []
+        with open(os.path.join(self.find, 'b.cpp'), 'w') as f:
+            f.write('int b22;')
+        os.remove(os.path.join(self.find, 'c.cpp.ignore'))
+        mapping = CountingMapping(self.find, self.replace)
+        self.assertEqual(['b.cpp'], CountingMapping.hashed)
+        self.assertEqual(['a.cpp', 'b.cpp'], sorted(os.path.basename(p) for p in mapping.map.values()))
+        with self.assertRaises(ConversionMapping.FindError):
+            mapping.find(self.write('int bb;'))
+
+    def test_normalized(self):
+        mapping = ConversionMapping(self.find, self.replace)
+        checker = self.write('/* checker */\nint   a ; // the only variable\n')
+        self.assertEqual(os.path.join(self.replace, 'a.cpp'), mapping.find(checker))
+        self.assertEqual([(os.path.join(self.find, 'a.cpp'), 1.0)], mapping.similar(checker))
+
+    def test_normalized_spacing(self):
+        with open(os.path.join(self.find, 'plus.cpp'), 'w') as f:
+            f.write('int f(int a, int b) { return a+ +b; }')
+        with open(os.path.join(self.replace, 'plus.cpp'), 'w') as f:
+            f.write('int f(int a, int b) { return a + b; }')
+        mapping = ConversionMapping(self.find, self.replace)
+        replacement = os.path.join(self.replace, 'plus.cpp')
+        self.assertEqual(replacement, mapping.find(self.write('int f(int a,int b){return a + /* b */+b;}\n')))
+        with self.assertRaises(ConversionMapping.FindError):
+            mapping.find(self.write('int f(int a, int b) { return a++b; }'))
+
+    def test_similar(self):
+        program = '\n'.join(f'int v{i} = {i} * {i};' for i in range(100))
+        with open(os.path.join(self.find, 'long.cpp'), 'w') as f:
+            f.write(program)
+        mapping = ConversionMapping(self.find, self.replace)
+        checker = self.write(program.replace('v50 = 50', 'v50 = 51'))
+        with self.assertRaises(ConversionMapping.FindError):
+            mapping.find(checker)
+        similar = mapping.similar(checker)
+        self.assertEqual([os.path.join(self.find, 'long.cpp')], [path for path, _ in similar])
+        self.assertGreater(similar[0][1], 0.8)
+        self.assertEqual([], mapping.similar(self.write('while (true) { x++; }')))
+
+    def test_todo(self):
+        mapping = ConversionMapping(self.find, self.replace)
+        checker = self.write('int e;')
+        filename = mapping.todo(checker)
+        self.assertTrue(os.path.isfile(os.path.join(self.replace, filename + '.todo')))
+        with self.assertRaises(ConversionMapping.ReplaceError):
+            mapping.find(checker)
+
+    def test_refresh(self):
+        mapping = ConversionMapping(self.find, self.replace)
+        self.assertFalse(mapping.refresh())
+        with open(os.path.join(self.find, 'e.cpp'), 'w') as f:
+            f.write('int e;')
+        with open(os.path.join(self.replace, 'e.cpp'), 'w') as f:
+            f.write('int E;')
+        self.assertTrue(mapping.refresh())
+        self.assertEqual(os.path.join(self.replace, 'e.cpp'), mapping.find(self.write('int e;')))
+
+        # Modified in place, without changing the directory
+        with open(os.path.join(self.find, 'e.cpp'), 'w') as f:
+            f.write('int ee;')
+        self.assertTrue(mapping.refresh())
+        self.assertEqual(os.path.join(self.replace, 'e.cpp'), mapping.find(self.write('int ee;')))
+        mapping.todo(self.write('int f;'))
+        self.assertFalse(mapping.refresh())
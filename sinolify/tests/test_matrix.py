@@ -0,0 +1,90 @@
+from unittest import TestCase, skipUnless
+import os.path
+import shutil
+import tempfile
+import time
+
+from sinolify.executors.matrix import Cell, run_matrix
+from sinolify.executors.timer import InputSource, Measurement
+from sinolify.tests.test_timer import TaskClockTimer, use_cache
+from sinolify.tools.matrix import read_time_limits
+
+SOURCES = {
+    'ok': 'int main() { return 0; }\n',
+    'loop': '#include <cstdio>\n'
+            'int main() { long long n, s = 0; scanf("%lld", &n);'
+            ' for (long long i = 0; i < n; i++) s += i * i % 7; printf("%lld\\n", s); }\n',
+    're': 'int main() { return 1; }\n',
+    'ce': 'int main() { return }\n',
+}
+
+
+class TestReadTimeLimits(TestCase):
+    def test_read(self):
+        config = 'title: Test\ntime_limits:\n    1a: 1000\n    1b: 1500\nmemory_limits:\n    1a: 256\n'
+        self.assertEqual({'1a': 1.0, '1b': 1.5}, read_time_limits(config))
+        self.assertEqual({}, read_time_limits('title: Test\n'))
+
+
+@skipUnless(shutil.which('g++') and TaskClockTimer.available(), 'g++ or perf_event_open is not available')
+class TestMatrix(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        use_cache(cls)
+        super().setUpClass()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.solutions = {}
+        for name, source in SOURCES.items():
+            self.solutions[name] = os.path.join(self.tmp_dir.name, f'{name}.cpp')
+            with open(self.solutions[name], 'w') as f:
+                f.write(source)
+        super().setUp()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_matrix(self):
+        inputs = {'1': InputSource.bytes('1', b'1000'), '2': InputSource.bytes('2', b'100000000000')}
+        outputs = {'1': InputSource.bytes('1', str(sum(i * i % 7 for i in range(1000))).encode())}
+        matrix = run_matrix(self.solutions, inputs, {'1': 0.1, '2': 0.1}, outputs=outputs, threads=3,
+                            timer=lambda exe, timeout: TaskClockTimer(exe, timeout=timeout, ghz=1))
+        self.assertEqual(Cell.WRONG_ANSWER, matrix.cells['ok', '1'].verdict)
+        self.assertEqual(Cell.OK, matrix.cells['ok', '2'].verdict)
+        self.assertEqual(Cell.OK, matrix.cells['loop', '1'].verdict)
+        self.assertGreater(matrix.cells['loop', '1'].instructions, 0)
+        self.assertEqual(Cell.TIME_LIMIT_EXCEEDED, matrix.cells['loop', '2'].verdict)
+        self.assertEqual(Cell.RUNTIME_ERROR, matrix.cells['re', '2'].verdict)
+        self.assertEqual({Cell.COMPILATION_ERROR: 2}, matrix.verdicts('ce'))
+        table = matrix.table().splitlines()
+        self.assertEqual(['test', 'limit', 'ok', 'loop', 're', 'ce'], table[0].split())
+        self.assertEqual(['2', '0.1s', 'TLE', 'RE', 'CE'], table[2].split()[:2] + table[2].split()[3:])
+
+
+@skipUnless(shutil.which('g++'), 'g++ is not available')
+class TestMatrixTimers(TestCase):
+    def test_timers_created_once(self):
+        created = []
+
+        class Timer:
+            def __init__(self, exe, timeout):
+                created.append((exe, timeout))
+                # Widens the window in which concurrent runs could instantiate the same timer
+                time.sleep(0.05)
+
+            def run(self, *args):
+                return Measurement(Measurement.OK, 0.01)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            solutions = {}
+            for name in ('ok', 'ce'):
+                solutions[name] = os.path.join(tmp, f'{name}.cpp')
+                with open(solutions[name], 'w') as f:
+                    f.write(SOURCES[name])
+            inputs = {str(i): InputSource.bytes(str(i), b'1') for i in range(8)}
+            matrix = run_matrix(solutions, inputs, {test: 0.1 if int(test) % 2 else 0.2 for test in inputs},
+                                threads=4, timer=Timer)
+        self.assertEqual(2, len(created))
+        self.assertEqual(2, len(set(created)))
+        self.assertEqual({Cell.OK: 8}, matrix.verdicts('ok'))
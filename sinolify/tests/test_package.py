@@ -1,7 +1,14 @@
 from unittest import TestCase
 import os.path
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import zipfile
 
-from sinolify.utils.package import Package
+from sinolify.utils import stats
+from sinolify.utils.package import Package, _cached_digest
 
 
 class TestPackage(TestCase):
@@ -25,3 +32,232 @@ class TestPackage(TestCase):
         self.assertEqual(len(list(self.package.find(rf'file'))), 0)
         self.assertEqual(len(list(self.package.find(rf'.*file'))), 1)
         self.assertEqual(len(list(self.package.find(rf'.*fil'))), 0)
+
+    def test_find_prefix(self):
+        self.package.add(self.dummy_file, 'dir1/file2')
+        self.package.add(self.dummy_file, 'dir3/file')
+        self.assertEqual(['dir1/dir2/file', 'dir1/file2'], list(self.package.find(r'dir1/.*')))
+        self.assertEqual(['dir1/file2', 'dir3/file'], list(self.package.find(r'dir1/file2|dir3/file')))
+        self.assertEqual(['dir1/dir2/file'], list(self.package.find(r'dir1?/dir2/file')))
+        self.assertEqual(['dir3/file'], list(self.package.find(r'dir\d/file')))
+
+    def test_find_abspath_written(self):
+        with open(self.package.abspath('config.yml'), 'w') as f:
+            f.write('title: Test\n')
+        self.assertEqual(['config.yml'], list(self.package.find(r'config\.yml')))
+
+    def test_add_duplicate(self):
+        self.package.add(self.dummy_file, 'dir3/copy')
+        original = os.path.join(self.package.root, 'dir1/dir2/file')
+        copy = os.path.join(self.package.root, 'dir3/copy')
+        self.assertTrue(os.path.samefile(original, copy))
+        with open(self.package.abspath('dir3/copy', write=True), 'a') as f:
+            f.write('# modified')
+        self.assertFalse(os.path.samefile(original, copy))
+        with open(self.dummy_file) as f, open(original) as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_add_hashes_same_sizes(self):
+        calls = lambda: sum(_cached_digest.cache_info()[:2])
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for name, contents in [('a', 'x' * 10), ('b', 'y' * 11), ('c', 'z' * 10), ('d', 'x' * 10)]:
+                paths.append(os.path.join(tmp, name))
+                with open(paths[-1], 'w') as f:
+                    f.write(contents)
+            before = calls()
+            self.package.add(paths[0], 'a')
+            self.package.add(paths[1], 'b')
+            self.assertEqual(before, calls())
+            self.package.add(paths[2], 'c')
+            self.assertEqual(before + 2, calls())
+            self.package.add(paths[3], 'd')
+        root = self.package.root
+        self.assertFalse(os.path.samefile(os.path.join(root, 'a'), os.path.join(root, 'c')))
+        self.assertTrue(os.path.samefile(os.path.join(root, 'a'), os.path.join(root, 'd')))
+
+    def test_add_from(self):
+        target = Package(id='test2')
+        target.add_from(self.package, 'dir1/dir2/file', 'file')
+        copy = os.path.join(target.root, 'file')
+        self.assertTrue(os.path.samefile(os.path.join(self.package.root, 'dir1/dir2/file'), copy))
+        self.assertFalse(os.path.samefile(self.package.abspath('dir1/dir2/file', write=True), copy))
+
+    def test_add_from_read(self):
+        target = Package(id='test2')
+        target.add_from(self.package, 'dir1/dir2/file', 'file')
+        copy = os.path.join(target.root, 'file')
+        self.assertTrue(os.path.samefile(self.package.abspath('dir1/dir2/file'), copy))
+        self.assertTrue(os.path.samefile(target.abspath('file'), copy))
+
+    def test_add_from_both_ways(self):
+        packages = [Package(id='test2'), Package(id='test3')]
+        with tempfile.TemporaryDirectory() as tmp:
+            for package in packages:
+                for i in range(300):
+                    path = os.path.join(tmp, f'{package.id}.{i}')
+                    with open(path, 'w') as f:
+                        f.write(path)
+                    package.add(path, f'file{i}')
+
+        # Files of distinct contents are hardlinked to the other package, whose index lock is taken too
+        def add(source, target):
+            for i in range(300):
+                target.add_from(source, f'file{i}', f'copy{i}')
+
+        threads = [threading.Thread(target=add, args=packages, daemon=True),
+                   threading.Thread(target=add, args=packages[::-1], daemon=True)]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(30)
+                self.assertFalse(t.is_alive())
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+    def test_save_duplicates(self):
+        self.package.add(self.dummy_file, 'dir3/copy')
+        self.package.add(self.dummy_file, 'dir3/copy.png')
+        with tempfile.TemporaryDirectory() as tmp:
+            self.package.save(os.path.join(tmp, 'out.zip'))
+            with zipfile.ZipFile(os.path.join(tmp, 'out.zip')) as z, open(self.dummy_file, 'rb') as f:
+                contents = f.read()
+                self.assertEqual(['test1/dir1/dir2/file', 'test1/dir3/copy', 'test1/dir3/copy.png'], z.namelist())
+                for name in z.namelist():
+                    self.assertEqual(contents, z.read(name))
+                self.assertEqual(zipfile.ZIP_STORED, z.getinfo('test1/dir3/copy.png').compress_type)
+
+
+class TestLazyPackage(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp_dir.name, 'abc.zip')
+        with zipfile.ZipFile(self.zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zip:
+            zip.writestr('abc/in/abc1.in', '1 2\n')
+            zip.writestr('abc/in/abc2.in', '3 4\n')
+            zip.writestr('abc/doc/abc.pdf', 'pdf')
+        self.package = Package(zip=self.zip_path, lazy=True)
+        super().setUp()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_id(self):
+        self.assertEqual(self.package.id, 'abc')
+
+    def test_not_extracted(self):
+        self.assertEqual(['doc/abc.pdf', 'in/abc1.in', 'in/abc2.in'], list(self.package.find('.*')))
+        self.assertEqual([], os.listdir(self.package.root))
+
+    def test_abspath(self):
+        self.assertEqual('3 4\n', open(self.package.abspath('in/abc2.in')).read())
+        self.assertFalse(os.path.exists(os.path.join(self.package.root, 'in/abc1.in')))
+
+    def test_materialize(self):
+        paths = self.package.materialize(['in/abc1.in', 'in/abc2.in'], threads=2)
+        self.assertEqual(['1 2\n', '3 4\n'], [open(p).read() for p in paths])
+
+    def test_materialize_parallel(self):
+        zip_path = os.path.join(self.tmp_dir.name, 'many.zip')
+        with zipfile.ZipFile(zip_path, 'w') as zip:
+            for i in range(64):
+                zip.writestr(f'abc/in/deep/abc{i}.in', str(i))
+                zip.writestr(f'abc/out/deep/abc{i}.out', str(i))
+        for _ in range(50):
+            package = Package(zip=zip_path, lazy=True)
+            paths = package.materialize(package.find('.*'), threads=16)
+            self.assertEqual(128, sum(os.path.isfile(p) for p in paths))
+
+    def test_size(self):
+        target = Package(id='abc')
+        target.add_from(self.package, 'in/abc1.in', 'in/abc1.in')
+        self.assertEqual([3, 4, 4], [self.package.size(p) for p in self.package.find('.*')])
+        self.assertEqual(4, target.size('in/abc1.in'))
+        self.assertEqual([], os.listdir(self.package.root))
+
+    def test_add_from(self):
+        target = Package(id='abc')
+        target.add_from(self.package, 'in/abc1.in', 'in/abc1.in')
+        target.add_from(self.package, 'doc/abc.pdf', 'doc/abczad.pdf')
+        self.assertEqual(['doc/abczad.pdf', 'in/abc1.in'], list(target.find('.*')))
+        self.assertEqual(b'pdf', target.open('doc/abczad.pdf').read())
+        output = os.path.join(self.tmp_dir.name, 'out.zip')
+        target.save(output)
+        with zipfile.ZipFile(output) as zip:
+            self.assertEqual(['abc/doc/abczad.pdf', 'abc/in/abc1.in'], sorted(zip.namelist()))
+            self.assertEqual(b'1 2\n', zip.read('abc/in/abc1.in'))
+
+    def test_add_from_directories(self):
+        target = Package(id='abc')
+        target.add_from(self.package, 'in/abc1.in', 'prog/abc1.in')
+        shutil.copy(self.zip_path, target.abspath('prog/abc.zip'))
+        self.assertEqual(['prog/abc.zip', 'prog/abc1.in'], list(target.find('.*')))
+        self.assertFalse(os.path.exists(os.path.join(target.root, 'prog/abc1.in')))
+
+    def test_save_raw(self):
+        target = Package(id='abc')
+        target.add_from(self.package, 'in/abc1.in', 'in/abc1.in')
+        self.package.materialize(['in/abc2.in'])
+        target.add_from(self.package, 'in/abc2.in', 'in/abc2.in')
+        with open(target.abspath('in/abc2.in', write=True), 'w') as f:
+            f.write('modified\n')
+        target.add_from(self.package, 'doc/abc.pdf', 'doc/abc.pdf')
+        output = os.path.join(self.tmp_dir.name, 'out.zip')
+        with stats.recording() as recorder:
+            target.save(output)
+        # Only the input is compressed as in the source, the statement is stored
+        self.assertEqual(1, recorder.counters['save.files_raw'])
+        with zipfile.ZipFile(output) as zip:
+            self.assertIsNone(zip.testzip())
+            self.assertEqual(zipfile.ZIP_DEFLATED, zip.getinfo('abc/in/abc1.in').compress_type)
+            self.assertEqual(zipfile.ZIP_STORED, zip.getinfo('abc/doc/abc.pdf').compress_type)
+            self.assertEqual(stat.S_IFREG | 0o644, zip.getinfo('abc/in/abc1.in').external_attr >> 16)
+            self.assertEqual(b'1 2\n', zip.read('abc/in/abc1.in'))
+            self.assertEqual(b'modified\n', zip.read('abc/in/abc2.in'))
+            self.assertEqual(b'pdf', zip.read('abc/doc/abc.pdf'))
+        target.save(output, overwrite=True, compresslevel=0)
+        with zipfile.ZipFile(output) as zip:
+            self.assertIsNone(zip.testzip())
+            self.assertEqual([zipfile.ZIP_STORED] * 3, [i.compress_type for i in zip.infolist()])
+            # Recompressed members and files on disk are regular files
+            self.assertTrue(all(stat.S_ISREG(i.external_attr >> 16) for i in zip.infolist()))
+            self.assertEqual(b'1 2\n', zip.read('abc/in/abc1.in'))
+
+    def test_save_compression(self):
+        target = Package(id='abc')
+        with open(target.abspath('config.yml'), 'w') as f:
+            f.write('title: Test\n' * 100)
+        target.add(self.package.abspath('doc/abc.pdf'), 'doc/abczad.pdf')
+        output = os.path.join(self.tmp_dir.name, 'out.zip')
+        target.save(output, threads=2, compresslevel=9)
+        with zipfile.ZipFile(output) as zip:
+            self.assertIsNone(zip.testzip())
+            self.assertEqual(['abc/config.yml', 'abc/doc/abczad.pdf'], zip.namelist())
+            self.assertEqual(zipfile.ZIP_DEFLATED, zip.getinfo('abc/config.yml').compress_type)
+            self.assertEqual(zipfile.ZIP_STORED, zip.getinfo('abc/doc/abczad.pdf').compress_type)
+            self.assertEqual(b'title: Test\n' * 100, zip.read('abc/config.yml'))
+
+    def test_save_reuse(self):
+        target = Package(id='abc')
+        with open(target.abspath('config.yml'), 'w') as f:
+            f.write('title: Test\n')
+        with open(target.abspath('notes.txt'), 'w') as f:
+            f.write('notes\n')
+        output = os.path.join(self.tmp_dir.name, 'out.zip')
+        target.save(output)
+        with open(target.abspath('config.yml'), 'w') as f:
+            f.write('title: Changed\n')
+        with stats.recording() as recorder:
+            target.save(output, overwrite=True, reuse=output, comment=b'updated')
+        self.assertEqual(1, recorder.counters['save.files_reused'])
+        with zipfile.ZipFile(output) as zip:
+            self.assertIsNone(zip.testzip())
+            self.assertEqual(b'updated', zip.comment)
+            self.assertEqual(b'title: Changed\n', zip.read('abc/config.yml'))
+            self.assertEqual(b'notes\n', zip.read('abc/notes.txt'))
+        self.assertEqual(['abc.zip', 'out.zip'], sorted(os.listdir(self.tmp_dir.name)))
+        with self.assertRaises(FileExistsError):
+            target.save(output, reuse=output)
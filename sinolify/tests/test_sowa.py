@@ -0,0 +1,40 @@
+from unittest import TestCase, mock
+import os
+import tempfile
+
+from sinolify.benchmarks.generator import generate_package
+from sinolify.converters.sowa import SowaToSinolConverter
+from sinolify.heuristics.limits import Limits
+from sinolify.utils.package import Package
+
+
+class TestTimeLimits(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = Package(zip=generate_package(os.path.join(self.tmp.name, 'a.zip'), tests=2, input_size=16,
+                                                   checker=False), lazy=True)
+        super().setUp()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def convert(self, previous=None, **kwargs):
+        """ Returns the manifest entry of time limits and the number of measurements. """
+        converter = SowaToSinolConverter(self.source, Package(id=self.source.id), cache=False,
+                                         previous=previous, **kwargs)
+        with mock.patch('sinolify.heuristics.limits.pick_limits', return_value=Limits(1.0, None)) as pick:
+            converter.make_time_limits_config()
+        return converter.manifest, pick.call_count
+
+    def test_reuse(self):
+        manifest, measured = self.convert()
+        self.assertEqual(1, measured)
+        self.assertEqual((manifest, 0), self.convert(previous=manifest))
+
+    def test_settings_changed(self):
+        manifest, _ = self.convert()
+        for settings in [dict(adaptive=True), dict(engine='async'), dict(pin=True)]:
+            with self.subTest(**settings):
+                changed, measured = self.convert(previous=manifest, **settings)
+                self.assertEqual(1, measured)
+                self.assertNotEqual(manifest['time_limits']['digest'], changed['time_limits']['digest'])
@@ -0,0 +1,74 @@
+from unittest import TestCase
+import os
+import tempfile
+import threading
+import time
+
+from sinolify.benchmarks.generator import generate_mapping, generate_package
+from sinolify.converters.sowa import SowaToSinolConverter
+from sinolify.utils.package import Package
+from sinolify.utils.stages import Stage, run_stages
+
+
+class TestStages(TestCase):
+    def test_inputs(self):
+        outputs, times = run_stages([
+            Stage('sum', lambda a, b: a + b, inputs=('a', 'b')),
+            Stage('a', lambda: 1),
+            Stage('b', lambda: 2),
+        ])
+        self.assertEqual(outputs, {'a': 1, 'b': 2, 'sum': 3})
+        self.assertEqual(set(times), {'a', 'b', 'sum'})
+
+    def test_serial_order(self):
+        order = []
+        run_stages([
+            Stage('last', lambda: order.append('last'), after=('first',)),
+            Stage('first', lambda: order.append('first')),
+            Stage('second', lambda: order.append('second')),
+        ], threads=1)
+        self.assertEqual(order, ['first', 'last', 'second'])
+
+    def test_parallel(self):
+        barrier = threading.Barrier(2, timeout=5)
+        outputs, _ = run_stages([Stage('a', barrier.wait), Stage('b', barrier.wait)])
+        self.assertEqual(set(outputs.values()), {0, 1})
+
+    def test_failure(self):
+        started = []
+
+        def fail():
+            time.sleep(0.05)
+            raise RuntimeError('failed')
+
+        with self.assertRaises(RuntimeError):
+            run_stages([Stage('fail', fail), Stage('next', lambda: started.append(1), after=('fail',)),
+                        Stage('slow', lambda: time.sleep(0.1))])
+        self.assertEqual(started, [])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            run_stages([Stage('a', lambda: 0, after=('missing',))])
+        with self.assertRaises(ValueError):
+            run_stages([Stage('a', lambda: 0, after=('b',)), Stage('b', lambda: 0, after=('a',))])
+
+
+class TestSowaStages(TestCase):
+    def test_checker_before_time_limits(self):
+        measured = []
+
+        class Converter(SowaToSinolConverter):
+            def make_time_limits_config(self):
+                measured.append(True)
+                return ''
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # The checker of a package generated with another seed is not in the mapping
+            source = Package(zip=generate_package(os.path.join(tmp, 'a.zip'), tests=1, input_size=16, seed=1),
+                             lazy=True)
+            mapping = generate_mapping(os.path.join(tmp, 'mapping'), checkers=1)
+            converter = Converter(source, Package(id=source.id), cache=False,
+                                  checkers=(os.path.join(mapping, 'find'), os.path.join(mapping, 'replace')))
+            with self.assertRaises(SystemExit):
+                converter.convert()
+        self.assertEqual([], measured)
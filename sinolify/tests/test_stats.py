@@ -0,0 +1,53 @@
+import json
+import threading
+from unittest import TestCase
+
+from sinolify.executors.timer import Measurement, TimerBase, TimerPool
+from sinolify.utils import stats
+
+
+class FixedTimer(TimerBase):
+    ghz = 2
+
+    def run(self, input_file):
+        return Measurement(Measurement.OK, 0.5)
+
+
+class TestStats(TestCase):
+    def test_disabled(self):
+        with stats.span('nothing', a=1) as attrs:
+            attrs['b'] = 2
+        stats.count('nothing')
+        stats.record('nothing', value=1)
+
+    def test_recording(self):
+        with stats.recording() as recorder:
+            with stats.span('outer', kind='test') as attrs:
+                attrs['extra'] = True
+                thread = threading.Thread(target=lambda: stats.count('bytes', 10))
+                thread.start()
+                thread.join()
+                stats.count('bytes', 5)
+            with stats.span('outer'):
+                pass
+            stats.record('event', value=1)
+        stats.count('bytes', 100)
+        report = json.loads(json.dumps(recorder.report()))
+        self.assertEqual(['outer', 'outer'], [s['name'] for s in report['spans']])
+        self.assertEqual('test', report['spans'][0]['kind'])
+        self.assertTrue(report['spans'][0]['extra'])
+        self.assertEqual(2, report['totals']['outer']['count'])
+        self.assertEqual({'bytes': 15}, report['counters'])
+        self.assertEqual({'event': [{'value': 1}]}, report['records'])
+        self.assertGreater(report['resources']['peak_rss_kb'], 0)
+
+    def test_measurements(self):
+        pool = TimerPool(FixedTimer('solution'), threads=2)
+        with stats.recording() as recorder:
+            pool.run([__file__, __file__])
+        report = recorder.report()
+        self.assertEqual(1, report['totals']['measure']['count'])
+        measurements = report['records']['measurement']
+        self.assertEqual(2, len(measurements))
+        self.assertEqual({10**9}, {m['instructions'] for m in measurements})
+        self.assertEqual({Measurement.OK}, {m['status'] for m in measurements})
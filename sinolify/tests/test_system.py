@@ -0,0 +1,36 @@
+import subprocess
+import sys
+from unittest import TestCase
+
+from sinolify.utils.system import NotInstalledError, where
+
+
+class TestWhere(TestCase):
+    def test_where(self):
+        self.assertTrue(where('sh').endswith('/sh'))
+        hits = where.cache_info().hits
+        where('sh')
+        self.assertEqual(hits + 1, where.cache_info().hits)
+        with self.assertRaises(NotInstalledError):
+            where('sinolify-not-installed')
+
+
+class TestStartup(TestCase):
+    threshold = 0.25
+    """ Maximum import time of the convert tool in seconds, a few times its usual time. """
+
+    heavy = ['distutils', 'asyncio', 'sinolify.executors.timer', 'sinolify.heuristics.limits',
+             'sinolify.converters.sowa', 'sinolify.utils.package']
+    """ Modules which should be imported only when a conversion needs them. """
+
+    def test_convert_importtime(self):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import sinolify.tools.convert'],
+                                stderr=subprocess.PIPE, check=True, universal_newlines=True)
+        # Lines are "import time: self [us] | cumulative | imported package", nested ones are indented
+        times = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and '|' in line and not line.endswith('imported package'):
+                _, cumulative, module = line.split('|')
+                times[module.strip()] = int(cumulative) / 10**6
+        self.assertLess(times['sinolify.tools.convert'], self.threshold)
+        self.assertEqual([], [m for m in self.heavy if m in times])
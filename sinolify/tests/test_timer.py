@@ -0,0 +1,309 @@
+from unittest import TestCase, skipUnless
+import asyncio
+import os.path
+import resource
+import time
+import shutil
+import subprocess
+import tempfile
+import zipfile
+from unittest import mock
+
+from sinolify.executors import perf_event
+from sinolify.executors.compilers import compiler
+from sinolify.executors.spawn import spawn_helper
+from sinolify.executors.timer import TimerBase, TimerPool, AsyncTimerPool, MeasurementCache, NativeTimer, \
+    PerfTimer, Measurement, InputSource, file_hash
+
+LOOP = ('#include <cstdio>\n'
+        'int main() { long long n, s = 0; scanf("%lld", &n);'
+        ' for (long long i = 0; i < n; i++) s += i * i % 7;'
+        ' printf("%lld\\n", s); return n < 0; }\n')
+""" A solution looping as many times as the input says, failing on negative numbers. """
+
+
+def use_cache(test_class: type) -> None:
+    """ Keeps persistent caches of the tests of a class, including the spawn
+    helper compiled up front, in a temporary directory. """
+    directory = tempfile.TemporaryDirectory()
+    test_class.addClassCleanup(directory.cleanup)
+    environ = mock.patch.dict(os.environ, SINOLIFY_CACHE=directory.name)
+    environ.start()
+    test_class.addClassCleanup(environ.stop)
+    spawn_helper.cache_clear()
+    test_class.addClassCleanup(spawn_helper.cache_clear)
+    spawn_helper()
+
+
+class CountingTimer(TimerBase):
+    """ A fake timer returning input sizes as times. """
+    def __init__(self, exe_file):
+        super().__init__(exe_file)
+        self.runs = 0
+        self.order = []
+        self.affinities = []
+
+    def measure(self, input_file: str) -> float:
+        self.runs += 1
+        self.order.append(os.path.basename(input_file))
+        self.affinities.append(os.sched_getaffinity(0))
+        return os.path.getsize(input_file) / 10
+
+
+class SleepingTimer(TimerBase):
+    """ A fake asynchronous timer sleeping for a tenth of input size seconds
+    and timing out on inputs longer than 3. """
+    def __init__(self, exe_file):
+        super().__init__(exe_file)
+        self.running = 0
+        self.max_running = 0
+
+    async def run_async(self, input_file: str) -> Measurement:
+        size = os.path.getsize(input_file)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(size / 10)
+        finally:
+            self.running -= 1
+        if size > 3:
+            return Measurement(Measurement.TIME_LIMIT_EXCEEDED)
+        return Measurement(Measurement.OK, size / 10)
+
+
+class TestTimerPool(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.inputs = []
+        for i in range(1, 6):
+            path = os.path.join(self.tmp_dir.name, f'{i}.in')
+            with open(path, 'w') as f:
+                f.write('x' * i)
+            self.inputs.append(path)
+        self.exe = os.path.abspath(__file__)
+        super().setUp()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_measure(self):
+        self.assertEqual([0.1, 0.2, 0.3, 0.4, 0.5],
+                         TimerPool(CountingTimer(self.exe), threads=3).measure(self.inputs))
+
+    def test_longest_first(self):
+        timer = CountingTimer(self.exe)
+        self.assertEqual([0.1, 0.2, 0.3, 0.4, 0.5], TimerPool(timer).measure(self.inputs))
+        self.assertEqual(['5.in', '4.in', '3.in', '2.in', '1.in'], timer.order)
+
+    def test_pin(self):
+        timer = CountingTimer(self.exe)
+        cpus = os.sched_getaffinity(0)
+        self.assertEqual([0.1, 0.2, 0.3, 0.4, 0.5], TimerPool(timer, threads=2, pin=True).measure(self.inputs))
+        for affinity in timer.affinities:
+            self.assertEqual(1, len(affinity))
+            self.assertLessEqual(affinity, cpus)
+
+    def test_stop(self):
+        timer = CountingTimer(self.exe)
+        results = TimerPool(timer).run(self.inputs, stop=lambda m: m.time < 0.45)
+        self.assertEqual([Measurement.CANCELLED] * 3 + [Measurement.OK] * 2, [m.status for m in results])
+        self.assertEqual(['5.in', '4.in'], timer.order)
+
+    def test_async(self):
+        timer = SleepingTimer(self.exe)
+        self.assertEqual([0.1, 0.2, 0.3], AsyncTimerPool(timer, threads=2).measure(self.inputs[:3]))
+        self.assertEqual(2, timer.max_running)
+
+    def test_async_stop(self):
+        timer = SleepingTimer(self.exe)
+        start = time.perf_counter()
+        results = AsyncTimerPool(timer, threads=5).run(
+            self.inputs, stop=lambda m: m.status == Measurement.TIME_LIMIT_EXCEEDED)
+        self.assertLess(time.perf_counter() - start, 0.48)
+        self.assertEqual([Measurement.OK] * 3 + [Measurement.TIME_LIMIT_EXCEEDED, Measurement.CANCELLED],
+                         [m.status for m in results])
+        with self.assertRaises(SystemExit):
+            AsyncTimerPool(timer, threads=5).measure(self.inputs)
+
+    def test_cache(self):
+        cache = MeasurementCache(os.path.join(self.tmp_dir.name, 'cache.sqlite'))
+        timer = CountingTimer(self.exe)
+        self.assertEqual([0.1, 0.2, 0.3, 0.4, 0.5], TimerPool(timer, threads=2, cache=cache).measure(self.inputs))
+        self.assertEqual(5, timer.runs)
+        self.assertEqual([0.1, 0.2, 0.3, 0.4, 0.5], TimerPool(timer, threads=2, cache=cache).measure(self.inputs))
+        self.assertEqual(5, timer.runs)
+        self.assertEqual(5, cache.hits)
+        self.assertEqual(5, cache.stats()['results'])
+        self.assertEqual(5, cache.invalidate(file_hash(self.exe)))
+        TimerPool(timer, cache=cache).measure(self.inputs[:1])
+        self.assertEqual(6, timer.runs)
+        # Peak memory is not cached
+        pool = TimerPool(timer, cache=cache)
+        pool.measure(self.inputs[:1])
+        self.assertEqual(6, timer.runs)
+        self.assertEqual({self.inputs[0]: None}, pool.peak_memory)
+
+
+class TestSpawnHelper(TestCase):
+    def setUp(self):
+        spawn_helper.cache_clear()
+        self.addCleanup(spawn_helper.cache_clear)
+        super().setUp()
+
+    def test_compile_timeout(self):
+        compiler = mock.Mock()
+        compiler.return_value.compile.side_effect = subprocess.TimeoutExpired('g++', 1)
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(os.environ, SINOLIFY_CACHE=tmp), \
+                mock.patch('sinolify.executors.spawn.compiler', compiler), self.assertLogs('sinolify.utils', 'WARNING'):
+            self.assertIsNone(spawn_helper())
+
+
+class TaskClockTimer(NativeTimer):
+    """ A native timer counting nanoseconds instead of instructions, which
+    are not available on every machine. """
+    event = (perf_event.PERF_TYPE_SOFTWARE, perf_event.PERF_COUNT_SW_TASK_CLOCK)
+
+
+@skipUnless(shutil.which('g++') and TaskClockTimer.available(), 'g++ or perf_event_open is not available')
+class TestNativeTimer(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        use_cache(cls)
+        super().setUpClass()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        src = os.path.join(self.tmp_dir.name, 'a.cpp')
+        with open(src, 'w') as f:
+            f.write(LOOP)
+        c = compiler(src, flags=['-O0'])
+        self.assertTrue(c.compile(), c.log)
+        self.exe = c.exe_path
+        super().setUp()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def input(self, content: str) -> str:
+        path = os.path.join(self.tmp_dir.name, f'{content}.in')
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_measure(self):
+        timer = TaskClockTimer(self.exe, ghz=1)
+        small, big = timer.measure(self.input('1000')), timer.measure(self.input('100000000'))
+        self.assertGreater(small, 0)
+        self.assertGreater(big, 10 * small)
+
+    def test_sources(self):
+        timer = TaskClockTimer(self.exe, ghz=1)
+        self.assertEqual(Measurement.OK, timer.run(InputSource.bytes('small', b'1000')).status)
+        zip_path = os.path.join(self.tmp_dir.name, 'in.zip')
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zip:
+            zip.writestr('big.in', '100000000')
+        with zipfile.ZipFile(zip_path) as zip:
+            big = InputSource('big.in', zip.getinfo('big.in').file_size, lambda: zip.open('big.in'))
+            self.assertEqual(file_hash(self.input('100000000')), big.hash())
+            self.assertGreater(timer.measure(big), 10 * timer.measure(InputSource.bytes('small', b'1000')))
+
+    def test_expected_output(self):
+        timer = TaskClockTimer(self.exe)
+        expected = str(sum(i * i % 7 for i in range(1000))).encode()
+        self.assertEqual(Measurement.OK, timer.run(self.input('1000'), InputSource.bytes('out', expected)).status)
+        path = os.path.join(self.tmp_dir.name, '1000.out')
+        with open(path, 'wb') as f:
+            f.write(b'\n' + expected + b'\n\n')
+        self.assertEqual(Measurement.OK, timer.run(self.input('1000'), path).status)
+        result = timer.run(self.input('1000'), InputSource.bytes('out', expected + b' 1'))
+        self.assertEqual(Measurement.WRONG_ANSWER, result.status)
+        self.assertGreater(result.time, 0)
+        self.assertEqual(Measurement.RUNTIME_ERROR, timer.run(self.input('-1'), path).status)
+
+    def test_peak_memory(self):
+        src = os.path.join(self.tmp_dir.name, 'm.cpp')
+        with open(src, 'w') as f:
+            f.write('#include <cstdio>\n#include <cstdlib>\n#include <cstring>\n'
+                    'int main() { int n; scanf("%d", &n); char *p = (char *) malloc(n << 20);'
+                    ' memset(p, 1, n << 20); return p[n] != 1; }\n')
+        c = compiler(src)
+        self.assertTrue(c.compile(), c.log)
+        small, big = self.input('1'), self.input('64')
+        # Memory of this process does not count towards the peak memory of the solution
+        ballast = bytearray(256 << 20)
+        for i in range(0, len(ballast), 4096):
+            ballast[i] = 1
+        self.assertGreater(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 256 << 10)
+        pool = TimerPool(TaskClockTimer(c.exe_path), threads=2)
+        pool.measure([small, big])
+        self.assertGreater(pool.peak_memory[big], 64 << 10)
+        self.assertLess(pool.peak_memory[big], 80 << 10)
+        self.assertLess(pool.peak_memory[small], 8 << 10)
+        del ballast
+
+    def test_unread_input(self):
+        # The solution reads a single number and exits, leaving most of the pipe unread
+        source = InputSource.bytes('long', b'1000 ' + b'1' * (16 << 20))
+        self.assertEqual(Measurement.OK, TaskClockTimer(self.exe).run(source).status)
+        self.assertEqual(Measurement.RUNTIME_ERROR, TaskClockTimer(self.exe).run(InputSource.bytes('-1', b'-1')).status)
+
+    def test_nonzero_exit(self):
+        self.assertEqual(0, TaskClockTimer(self.exe).measure(self.input('-1')))
+
+    def test_timeout(self):
+        with self.assertRaises(SystemExit):
+            TaskClockTimer(self.exe, timeout=0.1).measure(self.input('100000000000'))
+        self.assertEqual(Measurement.TIME_LIMIT_EXCEEDED,
+                         TaskClockTimer(self.exe, timeout=0.1).run(self.input('100000000000')).status)
+
+    def test_kill(self):
+        inputs = [self.input('100000000000'), self.input('100000000001'), self.input('-1')]
+        start = time.perf_counter()
+        results = AsyncTimerPool(TaskClockTimer(self.exe, timeout=10), threads=3).run(
+            inputs, stop=lambda m: m.status == Measurement.RUNTIME_ERROR)
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertEqual([Measurement.CANCELLED, Measurement.CANCELLED, Measurement.RUNTIME_ERROR],
+                         [m.status for m in results])
+
+
+class ShellTimer(PerfTimer):
+    """ A perf timer running the executable without `perf`, which is not
+    available on every machine, and measuring no time. """
+    def command(self, perf_output):
+        return ['bash', '-c', f'{self.exe_file}; exit $?']
+
+    def parse(self, perf_output):
+        return 0
+
+
+@skipUnless(shutil.which('g++'), 'g++ is not available')
+class TestPerfTimer(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        src = os.path.join(self.tmp_dir.name, 'a.cpp')
+        with open(src, 'w') as f:
+            f.write(LOOP)
+        c = compiler(src, flags=['-O0'])
+        self.assertTrue(c.compile(), c.log)
+        self.exe = c.exe_path
+        self.inputs = []
+        for content in ['100000000000', '100000000001', '-1']:
+            self.inputs.append(os.path.join(self.tmp_dir.name, f'{content}.in'))
+            with open(self.inputs[-1], 'w') as f:
+                f.write(content)
+        super().setUp()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_timeout(self):
+        self.assertEqual(Measurement.TIME_LIMIT_EXCEEDED, ShellTimer(self.exe, timeout=0.1).run(self.inputs[0]).status)
+
+    def test_kill(self):
+        for pool in [TimerPool, AsyncTimerPool]:
+            start = time.perf_counter()
+            results = pool(ShellTimer(self.exe, timeout=10), threads=3).run(
+                self.inputs, stop=lambda m: m.status == Measurement.RUNTIME_ERROR)
+            self.assertLess(time.perf_counter() - start, 5)
+            self.assertEqual([Measurement.CANCELLED, Measurement.CANCELLED, Measurement.RUNTIME_ERROR],
+                             [m.status for m in results])
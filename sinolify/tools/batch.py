@@ -0,0 +1,168 @@
+import collections
+import glob
+import logging
+import multiprocessing
+import os.path
+import sys
+from concurrent.futures.process import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from sinolify.converters.mapping import ConversionMapping
+from sinolify.tools.base import ToolBase
+from sinolify.tools.convert import convert
+from sinolify.utils.log import log, error_assert
+
+_worker = {}
+""" State shared by all conversions in a worker process, set by `_init_worker`. """
+
+
+class _ErrorCollector(logging.Handler):
+    """ Collects error messages logged during a conversion. """
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def _init_worker(level: int, checkers: Optional[ConversionMapping], budget) -> None:
+    """ Sets up a worker process with the state shared by its conversions. """
+    log.setLevel(level)
+    _worker['checkers'] = checkers
+    _worker['budget'] = budget
+
+
+def _convert(source: str, output: str, options: dict) -> Tuple[str, bool, str]:
+    """ Converts a single package in a worker process.
+
+    :return: Source path, success flag and error message.
+    """
+    errors = _ErrorCollector()
+    log.addHandler(errors)
+    try:
+        convert(source, output, checkers=_worker['checkers'], budget=_worker['budget'], **options)
+        return source, True, ''
+    except KeyboardInterrupt:
+        raise
+    except BaseException as e:
+        message = '; '.join(errors.messages) or repr(e)
+        return source, False, message
+    finally:
+        log.removeHandler(errors)
+
+
+class BatchConvertTool(ToolBase):
+    description = 'Sowa to Sinol batch converter.'
+
+    def make_parser(self):
+        parser = super().make_parser()
+
+        parser.add_argument('sources', type=str, nargs='+',
+                            help='Directories containing Sowa .zip packages or glob patterns matching them')
+
+        parser.add_argument('-o', '--output', type=str,
+                            help='Output directory, packages are saved under their source names. Required unless --dry')
+
+        parser.add_argument('-f', '--force', action='store_true',
+                            help='Allow overwrite of output files')
+
+        parser.add_argument('-i', '--incremental', action='store_true',
+                            help='Update existing outputs, see sinolify-convert')
+
+        parser.add_argument('--time', action='store_true',
+                            help='Auto adjust time limits')
+
+        parser.add_argument('--verify', action='store_true',
+                            help='Verify outputs of the main solutions, see sinolify-convert')
+
+        parser.add_argument('--checkers', type=str,
+                            help='Checker mapping directory, see sinolify-convert')
+
+        parser.add_argument('--dry', action='store_true',
+                            help='Dry run, do not save the results, but populate checkers mapper')
+
+        parser.add_argument('-j', '--threads', type=int, default=1,
+                            help='Number of solutions measured in parallel across all packages')
+
+        parser.add_argument('-p', '--processes', type=int, default=os.cpu_count(),
+                            help='Number of packages converted in parallel')
+
+        parser.add_argument('--adaptive', action='store_true',
+                            help='Skip runs on inputs too small to change the time limit, see sinolify-convert')
+
+        parser.add_argument('--engine', choices=['threads', 'async'], default='threads',
+                            help='Measurement engine, see sinolify-convert')
+
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Do not use persistent caches of compiled solutions and measurement results')
+
+        parser.add_argument('--compression-level', type=int, choices=range(10), metavar='{0..9}',
+                            help="Deflate compression level of the outputs, zlib's default level (6) by default")
+        return parser
+
+    def validate_args(self, args):
+        error_assert(args.dry or (args.output and os.path.isdir(args.output)), 'Output directory does not exist.')
+        error_assert(not args.checkers or (os.path.isdir(os.path.join(args.checkers, 'find'))
+                     and os.path.isdir(os.path.join(args.checkers, 'replace'))),
+                     'Checker mapping directory must contain find/ and replace/ subdirectories.')
+
+    def find_sources(self) -> List[str]:
+        """ Expands source arguments into a sorted list of packages. """
+        sources = set()
+        for source in self.args.sources:
+            if os.path.isdir(source):
+                sources |= set(glob.glob(os.path.join(source, '*.zip')))
+            else:
+                sources |= set(glob.glob(source))
+        return sorted(sources)
+
+    def main(self):
+        sources = self.find_sources()
+        error_assert(sources, 'No packages found.')
+        outputs = [os.path.join(self.args.output or '', os.path.basename(s)) for s in sources]
+        duplicates = sorted(o for o, n in collections.Counter(outputs).items() if n > 1)
+        error_assert(self.args.dry or not duplicates,
+                     'Sources with the same name would be saved as ' + ', '.join(duplicates))
+        skipped = [s for s, o in zip(sources, outputs)
+                   if not self.args.force and not self.args.incremental and not self.args.dry and os.path.exists(o)]
+        for s in skipped:
+            log.warning('Skipping %s, output exists. Use -f to overwrite or -i to update it.', s)
+
+        if self.args.checkers:
+            log.info('Setting up checker mapping %s', self.args.checkers)
+            checkers = ConversionMapping(os.path.join(self.args.checkers, 'find'),
+                                         os.path.join(self.args.checkers, 'replace'))
+        else:
+            checkers = None
+        budget = multiprocessing.BoundedSemaphore(self.args.threads)
+        options = dict(force=self.args.force, dry=self.args.dry, time=self.args.time,
+                       threads=self.args.threads, compresslevel=self.args.compression_level,
+                       cache=not self.args.no_cache, engine=self.args.engine,
+                       adaptive=self.args.adaptive, incremental=self.args.incremental,
+                       verify=self.args.verify)
+
+        failed = 0
+        with ProcessPoolExecutor(max_workers=self.args.processes, initializer=_init_worker,
+                                 initargs=(log.level, checkers, budget)) as executor:
+            futures = [executor.submit(_convert, s, o, options)
+                       for s, o in zip(sources, outputs) if s not in skipped]
+            for future in futures:
+                source, ok, message = future.result()
+                if ok:
+                    print(f'OK      {source}')
+                else:
+                    failed += 1
+                    print(f'FAILED  {source}: {message}')
+        print(f'{len(futures) - failed} converted, {failed} failed, {len(skipped)} skipped')
+        if failed:
+            sys.exit(1)
+
+
+def main():
+    BatchConvertTool(sys.argv[1:]).main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import json
+import platform
+import sys
+import tempfile
+
+from sinolify.benchmarks.suite import BenchmarkSuite, compare
+from sinolify.tools.base import ToolBase
+from sinolify.utils.log import error_assert
+
+
+class BenchTool(ToolBase):
+    description = 'Benchmarks sinolify on synthetic packages.'
+
+    def make_parser(self):
+        parser = super().make_parser()
+
+        parser.add_argument('benchmarks', type=str, nargs='*',
+                            help='Names of benchmarks to run, all by default')
+
+        parser.add_argument('-o', '--output', type=str,
+                            help='Save results as JSON to this file')
+
+        parser.add_argument('--baseline', type=str,
+                            help='Compare results with a JSON file saved with -o')
+
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Relative slowdown reported as a regression')
+
+        parser.add_argument('--tests', type=int, default=30,
+                            help='Number of tests of the synthetic package')
+
+        parser.add_argument('--input-size', type=int, default=64,
+                            help='Average input size in KB')
+
+        parser.add_argument('--checkers', type=int, default=1000,
+                            help='Number of checkers in the synthetic mapping')
+
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Number of runs of every benchmark, the best one is reported')
+
+        parser.add_argument('-j', '--threads', type=int, default=1,
+                            help='Number of threads saving packages and running solutions')
+        return parser
+
+    def validate_args(self, args):
+        known = BenchmarkSuite('').benchmarks()
+        for name in args.benchmarks:
+            error_assert(name in known, f'Unknown benchmark {name}, expected one of: {", ".join(known)}')
+
+    def main(self):
+        def progress(name, result):
+            if 'skipped' in result:
+                print(f'{name:24} skipped: {result["skipped"]}')
+            else:
+                extra = ', '.join(f'{k} {v:.4g}' for k, v in result.items() if k != 'seconds')
+                print(f'{name:24} {result["seconds"]:9.4f}s  {extra}')
+
+        with tempfile.TemporaryDirectory() as directory:
+            suite = BenchmarkSuite(directory, tests=self.args.tests, input_size=self.args.input_size << 10,
+                                   checkers=self.args.checkers, repeat=self.args.repeat,
+                                   threads=self.args.threads)
+            results = suite.run(self.args.benchmarks, progress)
+
+        if self.args.output:
+            with open(self.args.output, 'w') as f:
+                json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                           'options': suite.options(), 'results': results}, f, indent=2)
+
+        if self.args.baseline:
+            with open(self.args.baseline) as f:
+                baseline = json.load(f)
+            if baseline.get('options') != suite.options():
+                print('Warning: baseline was measured with different options')
+            comparisons = compare(results, baseline['results'], self.args.threshold)
+            print()
+            for c in comparisons:
+                print(f'{c.name:24} {c.seconds:9.4f}s vs {c.baseline:9.4f}s  {c.ratio:5.2f}x'
+                      f'{"  REGRESSION" if c.regression else ""}')
+            if any(c.regression for c in comparisons):
+                sys.exit(1)
+
+
+def main():
+    BenchTool(sys.argv[1:]).main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import sys
+
+from sinolify.executors.compilers import CompileCache
+from sinolify.executors.timer import MeasurementCache, file_hash
+from sinolify.tools.base import ToolBase
+
+
+class CacheTool(ToolBase):
+    description = 'Persistent cache management.'
+
+    def make_parser(self):
+        parser = super().make_parser()
+        commands = parser.add_subparsers(dest='command', required=True)
+
+        commands.add_parser('stats', help='Show cache statistics')
+
+        clear = commands.add_parser('clear', help='Remove all cached compilations and measurement results')
+        clear.add_argument('--compile', action='store_true', help='Only clear the compile cache')
+        clear.add_argument('--measurements', action='store_true', help='Only clear the measurement cache')
+
+        invalidate = commands.add_parser('invalidate', help='Remove measurement results of executables')
+        invalidate.add_argument('executables', type=str, nargs='+', help='Executable files')
+        return parser
+
+    def main(self):
+        if self.args.command == 'stats':
+            compile_cache = CompileCache()
+            entries = list(compile_cache.entries())
+            print(f'Compile cache: {compile_cache.directory}')
+            print(f'    {len(entries)} executable(s), {sum(size for _, size, _ in entries) / 2**20:.1f} MB')
+            measurement_cache = MeasurementCache()
+            stats = measurement_cache.stats()
+            print(f'Measurement cache: {measurement_cache.path}')
+            print(f'    {stats["results"]} result(s) of {stats["executables"]} executable(s) '
+                  f'on {stats["inputs"]} input(s), {stats["size"] / 2**20:.1f} MB')
+        elif self.args.command == 'clear':
+            both = not self.args.compile and not self.args.measurements
+            if self.args.compile or both:
+                CompileCache().clear()
+            if self.args.measurements or both:
+                print(f'Removed {MeasurementCache().invalidate()} measurement result(s)')
+        elif self.args.command == 'invalidate':
+            cache = MeasurementCache()
+            removed = sum(cache.invalidate(file_hash(e)) for e in self.args.executables)
+            print(f'Removed {removed} measurement result(s)')
+
+
+def main():
+    CacheTool(sys.argv[1:]).main()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,92 @@
+import contextlib
+import json
 import os.path
 import sys
+from typing import Optional
 
-from sinolify.utils.package import Package
-from sinolify.converters.sowa import SowaToSinolConverter
+from sinolify.utils import stats
 from sinolify.utils.log import log, error_assert
 from sinolify.tools.base import ToolBase
 
 
+def convert(source: str, output: str, *, force: bool = False, dry: bool = False,
+            time: bool = False, threads: Optional[int] = None, checkers=None,
+            compresslevel: Optional[int] = None, budget=None, cache: bool = True,
+            pin: bool = False, reserve: int = 0, engine: str = 'threads', adaptive: bool = False,
+            stats_file: Optional[str] = None, incremental: bool = False, verify: bool = False) -> None:
+    """ Converts a single Sowa package to a Sinol package.
+
+    :param source: Sowa .zip package path.
+
+    :param output: Output .zip file path.
+
+    :param force: If true, allows to overwrite the output.
+
+    :param dry: If true, the result is not saved.
+
+    :param time: If true, time limits are adjusted automatically.
+
+    :param threads: Number of threads for adjusting time limits and saving.
+        By default time limits are adjusted on one thread and the output is
+        saved on all CPUs.
+
+    :param checkers: Checker mapping, see `SowaToSinolConverter`.
+
+    :param compresslevel: Deflate compression level of the output, zlib's
+        default level (6) by default.
+
+    :param budget: Optional semaphore limiting parallel runs of solutions.
+
+    :param cache: If false, persistent caches are not used.
+
+    :param pin: If true, runs of solutions are pinned to dedicated CPUs.
+
+    :param reserve: Number of CPUs left free when pinning.
+
+    :param engine: Measurement engine, `threads` or `async`.
+
+    :param adaptive: If true, runs which can not change time limits are skipped.
+
+    :param stats_file: If set, a JSON report of stage times, I/O, measurements
+        and resource usage is written to this file (see `sinolify.utils.stats`),
+        also if the conversion fails.
+
+    :param incremental: If true and the output exists, it is updated: time
+        limits are reused if the main solution, the inputs and the measurement
+        settings are unchanged, and unchanged files are copied from it without recompression.
+
+    :param verify: If true, outputs of the main solution are verified while
+        time limits are adjusted.
+    """
+    # Imported here, so that parsing arguments and submitting to a daemon do not pay for them
+    from sinolify.utils.package import Package
+    from sinolify.converters.base import dump_manifest, load_manifest
+    from sinolify.converters.sowa import SowaToSinolConverter
+
+    with (stats.recording() if stats_file else contextlib.nullcontext()) as recorder:
+        try:
+            with stats.span('load', source=source):
+                sowa = Package(zip=source, lazy=True)
+            sinol = Package(id=sowa.id)
+            incremental = incremental and os.path.exists(output)
+            converter = SowaToSinolConverter(sowa, sinol, auto_time_limits=time, threads=threads or 1,
+                                             checkers=checkers, budget=budget, cache=cache,
+                                             pin=pin, reserve=reserve, engine=engine, adaptive=adaptive,
+                                             verify=verify, previous=load_manifest(output) if incremental else None)
+            with stats.span('convert'):
+                converter.convert()
+            if not dry:
+                with stats.span('save', output=output):
+                    sinol.save(output, overwrite=force or incremental, threads=threads,
+                               compresslevel=compresslevel, reuse=output if incremental else None,
+                               comment=dump_manifest(converter.manifest))
+                log.info('Output saved to %s', output)
+        finally:
+            if recorder:
+                with open(stats_file, 'w') as f:
+                    json.dump(dict(source=source, output=None if dry else output, **recorder.report()), f, indent=2)
+
+
 class ConvertTool(ToolBase):
     description = 'Sowa to Sinol converter.'
 
@@ -22,9 +102,19 @@ class ConvertTool(ToolBase):
         parser.add_argument('-f', '--force', action='store_true',
                             help='Allow overwrite of output file')
 
+        parser.add_argument('-i', '--incremental', action='store_true',
+                            help='''Update an existing output, reusing its time limits if
+                                    the main solution, inputs and measurement settings
+                                    are unchanged and
+                                    copying its unchanged files''')
+
         parser.add_argument('--time', action='store_true',
                             help='Auto adjust time limits')
 
+        parser.add_argument('--verify', action='store_true',
+                            help='''Compare outputs of the main solution with out/ files,
+                                    ignoring whitespace, while adjusting time limits''')
+
         parser.add_argument('--checkers', type=str,
                             help='''Checker mapping directory. Should contain find/
                                     and replace/ subdirectories with checkers and
@@ -38,13 +128,47 @@ class ConvertTool(ToolBase):
                             help='''Dry run, do not save the result, but populate 
                                     checkers mapper''')
 
-        parser.add_argument('-j', '--threads', type=int, default=1,
-                            help='Number of threads for adjusting time limits')
+        parser.add_argument('-j', '--threads', type=int,
+                            help='''Number of threads for adjusting time limits and saving the output.
+                                    By default time limits are adjusted on one thread and the output
+                                    is saved on all CPUs''')
+
+        parser.add_argument('--adaptive', action='store_true',
+                            help='''Skip runs on inputs too small to change the time
+                                    limit, checking a random sample of them''')
+
+        parser.add_argument('--pin', action='store_true',
+                            help='Pin each run of a solution to a dedicated CPU when adjusting time limits')
+
+        parser.add_argument('--reserve', type=int, default=0, metavar='N',
+                            help='Number of CPUs left free for other work when pinning')
+
+        parser.add_argument('--engine', choices=['threads', 'async'], default='threads',
+                            help='''Measurement engine. async runs solutions as asyncio
+                                    subprocesses instead of a thread each''')
+
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Do not use persistent caches of compiled solutions and measurement results')
+
+        parser.add_argument('--stats', type=str, metavar='FILE',
+                            help='Write a JSON report of stage times, I/O, measurements and resource usage to FILE')
+
+        parser.add_argument('--compression-level', type=int, choices=range(10), metavar='{0..9}',
+                            help='''Deflate compression level of the output, zlib's default
+                                    level (6) by default. 0 stores files without compression.
+                                    Already compressed files (PDFs, images) are always stored.''')
+
+        parser.add_argument('--daemon', action='store_true',
+                            help='Submit the conversion to a running sinolify-daemon')
+
+        parser.add_argument('--socket', type=str,
+                            help='Socket path of the daemon, see sinolify-daemon')
         return parser
 
     def validate_args(self, args):
         error_assert(args.output.endswith('.zip'), 'Output must end with .zip')
-        error_assert(args.force or not os.path.exists(args.output), 'Output exists. Use -f to overwrite.')
+        error_assert(args.force or args.incremental or not os.path.exists(args.output),
+                     'Output exists. Use -f to overwrite or -i to update it.')
         error_assert(not args.checkers or os.path.exists(args.checkers), 'Checker mapping directory does not exist.')
         error_assert(not args.checkers or (os.path.isdir(os.path.join(args.checkers, 'find'))
                      and os.path.isdir(os.path.join(args.checkers, 'replace'))),
@@ -52,18 +176,23 @@ class ConvertTool(ToolBase):
 
 
     def main(self):
-        sowa = Package(zip=self.args.source)
-        sinol = Package(id=sowa.id)
+        options = dict(force=self.args.force, dry=self.args.dry, time=self.args.time, threads=self.args.threads,
+                       compresslevel=self.args.compression_level, cache=not self.args.no_cache,
+                       pin=self.args.pin, reserve=self.args.reserve, engine=self.args.engine,
+                       adaptive=self.args.adaptive, stats_file=self.args.stats, incremental=self.args.incremental,
+                       verify=self.args.verify)
+        if self.args.daemon:
+            # Imported here, as the daemon module imports this one
+            from sinolify.tools.daemon import default_socket, submit
+            if not submit(self.args.socket or default_socket(), self.args.source, self.args.output, options,
+                          checkers=self.args.checkers):
+                sys.exit(1)
+            return
         if self.args.checkers:
             checkers = (os.path.join(self.args.checkers, 'find'), os.path.join(self.args.checkers, 'replace'))
         else:
             checkers = None
-        converter = SowaToSinolConverter(sowa, sinol, auto_time_limits=self.args.time, threads=self.args.threads,
-                                         checkers=checkers)
-        converter.convert()
-        if not self.args.dry:
-            sinol.save(self.args.output, overwrite=self.args.force)
-            log.info('Output saved to %s', self.args.output)
+        convert(self.args.source, self.args.output, checkers=checkers, **options)
 
 
 def main():
@@ -0,0 +1,344 @@
+import collections
+import contextlib
+import json
+import logging.handlers
+import multiprocessing
+import os.path
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool, ProcessPoolExecutor
+from multiprocessing.managers import SyncManager
+from typing import BinaryIO, Callable, Dict, Optional
+
+from sinolify.converters.mapping import ConversionMapping
+from sinolify.tools.base import ToolBase
+from sinolify.tools.batch import _convert, _init_worker, _worker
+from sinolify.utils.log import log, error_assert
+
+_mappings: Dict[str, Optional[ConversionMapping]] = {}
+""" Checker mappings of a worker process by directory, built at first use and
+rebuilt when the directory changes. """
+
+
+def default_socket() -> str:
+    """ Returns the default path of the daemon socket, in the user's runtime
+    directory if there is one. """
+    return os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), 'sinolify.sock')
+
+
+def _send(stream: BinaryIO, message: dict) -> None:
+    """ Sends a message as a line of JSON. """
+    stream.write(json.dumps(message).encode() + b'\n')
+    stream.flush()
+
+
+def _ignore_interrupts() -> None:
+    """ Leaves interrupts to the daemon, which stops its processes itself. """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _init_daemon_worker(level: int, checkers_dir: Optional[str], checkers: Optional[ConversionMapping],
+                        budget) -> None:
+    """ Sets up a worker process, with the checker mapping of the daemon
+    already built. """
+    _ignore_interrupts()
+    _init_worker(level, None, budget)
+    if checkers_dir:
+        _mappings[checkers_dir] = checkers
+
+
+def _job(source: str, output: str, options: dict, checkers_dir: Optional[str], level: int, records):
+    """ Runs a conversion job in a worker process, putting its log records
+    into the `records` queue.
+
+    :return: See `sinolify.tools.batch._convert`.
+    """
+    handler = logging.handlers.QueueHandler(records)
+    log.setLevel(level)
+    log.addHandler(handler)
+    try:
+        if checkers_dir and checkers_dir not in _mappings:
+            log.info('Setting up checker mapping %s', checkers_dir)
+            _mappings[checkers_dir] = ConversionMapping(os.path.join(checkers_dir, 'find'),
+                                                        os.path.join(checkers_dir, 'replace'))
+        elif checkers_dir and _mappings[checkers_dir].refresh():
+            log.info('Checker mapping %s changed, rebuilt it', checkers_dir)
+        _worker['checkers'] = _mappings.get(checkers_dir)
+        return _convert(source, output, options)
+    finally:
+        log.removeHandler(handler)
+
+
+class Admission:
+    """ Admits jobs in the order they arrive, as long as the CPUs of the
+    admitted jobs do not exceed the total. """
+
+    def __init__(self, cpus: int):
+        self.cpus = cpus
+        self.free = cpus
+        self._waiting = collections.deque()
+        self._condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def admit(self, cpus: int, waiting: Callable[[], None] = lambda: None):
+        """ Waits until a job can be admitted and holds its CPUs in the context.
+
+        :param cpus: CPUs the job needs, at most the total are held. Jobs
+            needing no CPUs are admitted at once.
+
+        :param waiting: Called before waiting, if the job can not be admitted
+            at once.
+        """
+        cpus = min(cpus, self.cpus)
+        if cpus:
+            ticket = object()
+            with self._condition:
+                self._waiting.append(ticket)
+                admitted = lambda: self._waiting[0] is ticket and self.free >= cpus
+                if not admitted():
+                    waiting()
+                    self._condition.wait_for(admitted)
+                self._waiting.popleft()
+                self.free -= cpus
+                self._condition.notify_all()
+        try:
+            yield
+        finally:
+            if cpus:
+                with self._condition:
+                    self.free += cpus
+                    self._condition.notify_all()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.daemon.handle(self.rfile, self.wfile)
+
+
+class Daemon:
+    """ Converts packages submitted over a Unix socket, keeping the state
+    shared by conversions warm between them: worker processes with modules
+    imported and checker mappings built, and the semaphore limiting parallel
+    runs of solutions across all jobs.
+
+    A job is a line of JSON with `source` and `output` paths, `options` of
+    `sinolify.tools.convert.convert`, the `checkers` directory and the log
+    `level`. Log records of the job are sent back as lines of JSON with
+    `level` and `message`, followed by the result with `ok` and an error
+    `message`.
+
+    Jobs adjusting time limits are admitted only while the sum of their
+    threads does not exceed the number of CPUs (see `Admission`), so that
+    their pools, possibly pinning runs, do not compete for CPUs.
+
+    If a worker process dies (e.g. killed for using too much memory), the
+    worker processes are replaced and the jobs they were running are
+    retried once.
+    """
+
+    def __init__(self, path: str, *, cpus: int = os.cpu_count(), processes: int = os.cpu_count(),
+                 checkers: Optional[str] = None):
+        """ Starts worker processes and binds the socket.
+
+        :param path: Socket path. A stale socket is removed.
+
+        :param cpus: Number of CPUs for running solutions across all jobs.
+
+        :param processes: Number of jobs converted in parallel.
+
+        :param checkers: Optional checker mapping directory, built upfront.
+        """
+        if os.path.exists(path):
+            with socket.socket(socket.AF_UNIX) as s:
+                error_assert(s.connect_ex(path) != 0, f'A daemon is already listening on {path}')
+            os.unlink(path)
+        self.path = path
+        self.cpus = cpus
+        self.processes = processes
+        self.admission = Admission(cpus)
+        mapping = None
+        if checkers:
+            checkers = os.path.abspath(checkers)
+            log.info('Setting up checker mapping %s', checkers)
+            mapping = ConversionMapping(os.path.join(checkers, 'find'), os.path.join(checkers, 'replace'))
+        self.checkers = checkers
+        self._mapping = mapping
+        self._manager = SyncManager()
+        self._manager.start(_ignore_interrupts)
+        self._executor_lock = threading.Lock()
+        self._executor = self._start_workers()
+        self._server = socketserver.ThreadingUnixStreamServer(path, _Handler)
+        self._server.daemon_threads = True
+        self._server.daemon = self
+
+    def _start_workers(self) -> ProcessPoolExecutor:
+        """ Starts worker processes, with a new semaphore limiting parallel
+        runs, as the permits of killed workers are never released. """
+        return ProcessPoolExecutor(max_workers=self.processes, initializer=_init_daemon_worker,
+                                   initargs=(log.level, self.checkers, self._mapping,
+                                             multiprocessing.BoundedSemaphore(self.cpus)))
+
+    def _submit(self, *args) -> Future:
+        """ Submits a job to the worker processes, replacing them if they
+        are broken. """
+        with self._executor_lock:
+            try:
+                return self._executor.submit(_job, *args)
+            except BrokenProcessPool:
+                log.warning('A worker process died, starting new ones')
+                self._executor.shutdown(wait=False)
+                self._executor = self._start_workers()
+                return self._executor.submit(_job, *args)
+
+    def serve_forever(self) -> None:
+        """ Handles jobs until `shutdown` is called. """
+        log.info('Listening on %s', self.path)
+        self._server.serve_forever()
+
+    def shutdown(self) -> None:
+        """ Stops `serve_forever`, called from another thread. """
+        self._server.shutdown()
+
+    def close(self) -> None:
+        """ Removes the socket and stops the worker processes. """
+        self._server.server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        with self._executor_lock:
+            self._executor.shutdown()
+        self._manager.shutdown()
+
+    def handle(self, rfile: BinaryIO, wfile: BinaryIO) -> None:
+        """ Runs a job received from a client, sending back its log records
+        and result. The job runs to the end even if the client disconnects. """
+        connected = True
+
+        def send(message: dict) -> None:
+            nonlocal connected
+            if connected:
+                try:
+                    _send(wfile, message)
+                except OSError:
+                    connected = False
+
+        job = json.loads(rfile.readline())
+        options = job['options']
+        cpus = (options.get('threads') or 1) if options.get('time') else 0
+        records = self._manager.Queue()
+        with self.admission.admit(cpus, lambda: send(dict(level=logging.INFO,
+                                                           message=f'Waiting for {cpus} CPU(s) used by other jobs'))):
+            for retry in [True, False]:
+                future = self._submit(job['source'], job['output'], options, job.get('checkers'),
+                                      job.get('level', logging.WARNING), records)
+                while True:
+                    # Records are put before the job returns, so none is left once it is done and the queue is empty
+                    done = future.done()
+                    try:
+                        record = records.get(not done, 0.1)
+                    except queue.Empty:
+                        if done:
+                            break
+                        continue
+                    send(dict(level=record.levelno, message=record.getMessage()))
+                try:
+                    _, ok, message = future.result()
+                except BrokenProcessPool as e:
+                    ok, message = False, repr(e)
+                    if retry:
+                        send(dict(level=logging.WARNING, message='A worker process died, retrying the job'))
+                        continue
+                except Exception as e:
+                    ok, message = False, repr(e)
+                break
+        log.info('%s %s', 'Converted' if ok else 'Failed to convert', job['source'])
+        send(dict(ok=ok, message=message))
+
+
+def submit(path: str, source: str, output: str, options: dict, *, checkers: Optional[str] = None) -> bool:
+    """ Submits a conversion job to a daemon, logging its records as they
+    arrive.
+
+    :param path: Socket path of the daemon.
+
+    :param source: Sowa .zip package path.
+
+    :param output: Output .zip file path.
+
+    :param options: Options of `sinolify.tools.convert.convert`, except
+        `checkers` and `budget`. Paths are relative to the client.
+
+    :param checkers: Optional checker mapping directory.
+
+    :return: True if the conversion succeeded.
+    """
+    if options.get('stats_file'):
+        options = dict(options, stats_file=os.path.abspath(options['stats_file']))
+    job = dict(source=os.path.abspath(source), output=os.path.abspath(output), options=options,
+               checkers=os.path.abspath(checkers) if checkers else None, level=log.getEffectiveLevel())
+    errors = False
+    with socket.socket(socket.AF_UNIX) as s:
+        try:
+            s.connect(path)
+        except OSError as e:
+            error_assert(False, f'Can not connect to a daemon on {path}: {e}')
+        with s.makefile('rwb') as stream:
+            _send(stream, job)
+            for line in stream:
+                message = json.loads(line)
+                if 'ok' in message:
+                    if not message['ok'] and not errors:
+                        log.error(message['message'])
+                    return message['ok']
+                log.log(message['level'], '%s', message['message'])
+                errors = errors or message['level'] >= logging.ERROR
+    error_assert(False, 'The daemon closed the connection')
+
+
+class DaemonTool(ToolBase):
+    description = 'Sowa to Sinol conversion daemon, see sinolify-convert --daemon.'
+
+    def make_parser(self):
+        parser = super().make_parser()
+
+        parser.add_argument('--socket', type=str, default=default_socket(),
+                            help='Socket path, %(default)s by default')
+
+        parser.add_argument('--checkers', type=str,
+                            help='Checker mapping directory set up upfront, see sinolify-convert')
+
+        parser.add_argument('-j', '--threads', type=int, default=os.cpu_count(),
+                            help='''Number of CPUs for measuring solutions across all jobs.
+                                    Jobs adjusting time limits wait until their threads are free''')
+
+        parser.add_argument('-p', '--processes', type=int, default=os.cpu_count(),
+                            help='Number of jobs converted in parallel')
+        return parser
+
+    def validate_args(self, args):
+        error_assert(not args.checkers or (os.path.isdir(os.path.join(args.checkers, 'find'))
+                     and os.path.isdir(os.path.join(args.checkers, 'replace'))),
+                     'Checker mapping directory must contain find/ and replace/ subdirectories.')
+
+    def main(self):
+        daemon = Daemon(self.args.socket, cpus=self.args.threads, processes=self.args.processes,
+                        checkers=self.args.checkers)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            daemon.close()
+
+
+def main():
+    DaemonTool(sys.argv[1:]).main()
+
+
+if __name__ == '__main__':
+    main()
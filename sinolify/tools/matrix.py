@@ -0,0 +1,100 @@
+import os.path
+import re
+import sys
+from typing import Dict
+
+from sinolify.executors.compilers import CompileCache
+from sinolify.executors.matrix import run_matrix
+from sinolify.executors.timer import InputSource
+from sinolify.utils.log import error_assert
+from sinolify.utils.package import Package
+from sinolify.tools.base import ToolBase
+
+
+def read_time_limits(config: str) -> Dict[str, float]:
+    """ Reads the `time_limits` entry of a Sinol config, as written by sinolify.
+
+    :return: Time limits in seconds by test name.
+    """
+    entry = re.search(r'^time_limits:\n((?:[ \t]+\S+:[ \t]*\d+[ \t]*\n?)*)', config, re.MULTILINE)
+    if not entry:
+        return {}
+    return {test: int(limit) / 1000 for test, limit in re.findall(r'(\S+):[ \t]*(\d+)', entry.group(1))}
+
+
+class MatrixTool(ToolBase):
+    description = 'Runs all solutions of a Sinol package on all tests.'
+
+    def make_parser(self):
+        parser = super().make_parser()
+
+        parser.add_argument('package', type=str,
+                            help='Sinol .zip package path, e.g. an output of sinolify-convert')
+
+        parser.add_argument('-j', '--threads', type=int, default=1,
+                            help='Number of parallel compilations and runs')
+
+        parser.add_argument('--solutions', type=str, default='.*', metavar='REGEX',
+                            help='Only run solutions which names match REGEX')
+
+        parser.add_argument('--time-limit', type=float, metavar='SECONDS',
+                            help='Time limit of all tests, instead of the limits in config.yml')
+
+        parser.add_argument('--timeout-factor', type=float, default=2,
+                            help='Runs are killed after this many time limits of wall time')
+
+        parser.add_argument('--no-verify', action='store_true',
+                            help='Do not compare outputs with out/ files')
+
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Do not use the persistent cache of compiled solutions')
+        return parser
+
+    def validate_args(self, args):
+        error_assert(os.path.isfile(args.package), 'Package does not exist.')
+        error_assert(args.threads > 0, 'Number of threads must be positive.')
+
+    def main(self):
+        package = Package(zip=self.args.package, lazy=True)
+        id = package.id
+        solutions = {}
+        for p in package.find(rf'prog/{id}[^/]*\.(?:cpp|cc|c|pas)'):
+            name = os.path.splitext(os.path.basename(p))[0]
+            if not name.endswith(('chk', 'ingen', 'inwer')) and re.fullmatch(self.args.solutions, name):
+                solutions[name] = package.abspath(p)
+        error_assert(solutions, 'No solutions found.')
+        solutions = dict(sorted(solutions.items(), key=lambda s: (len(s[0]), s[0])))
+
+        inputs, outputs = {}, {}
+        output_paths = set(package.find(r'out/.*'))
+        for p in package.find(rf'in/{id}[^/]*\.in'):
+            test = os.path.basename(p)[len(id):-len('.in')]
+            inputs[test] = InputSource(p, package.size(p), lambda p=p: package.open(p))
+            output = f'out/{id}{test}.out'
+            if not self.args.no_verify and output in output_paths:
+                outputs[test] = InputSource(output, package.size(output), lambda p=output: package.open(p))
+        error_assert(inputs, 'No tests found.')
+        # Tests are ordered by group number, not lexicographically
+        inputs = dict(sorted(inputs.items(), key=lambda t: (int(re.match(r'\d*', t[0]).group() or 0), t[0])))
+
+        if self.args.time_limit:
+            limits = {test: self.args.time_limit for test in inputs}
+        else:
+            config = list(package.find('config.yml'))
+            limits = read_time_limits(package.open('config.yml').read().decode('utf-8')) if config else {}
+            missing = sorted(set(inputs) - set(limits))
+            error_assert(not missing, f'No time limits of test(s) {", ".join(missing)} in config.yml. '
+                                      f'Use --time-limit to set them.')
+
+        matrix = run_matrix(solutions, inputs, limits, outputs=outputs, threads=self.args.threads,
+                            timeout_factor=self.args.timeout_factor,
+                            compile_cache=None if self.args.no_cache else CompileCache())
+        print(matrix.table())
+
+
+def main():
+    MatrixTool(sys.argv[1:]).main()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,188 @@
+import collections
+import contextlib
+import fcntl
+import hashlib
 import re
 import shutil
+import struct
+import threading
+import time
+import zlib
 import zipfile
 import tempfile
 import os
-from typing import Generator
+import bisect
+import functools
+from concurrent.futures import Future
+from concurrent.futures.thread import ThreadPoolExecutor
+from stat import S_IFREG
+from typing import Generator, List, Set, Dict, Tuple, Iterable, Optional, BinaryIO
+
+from sinolify.utils import stats
+from sinolify.utils.log import log
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(regex: str) -> 're.Pattern':
+    """ Compiles `regex`, caching the result. """
+    return re.compile(regex)
+
+
+@functools.lru_cache(maxsize=256)
+def _literal_prefix(regex: str) -> str:
+    """ Returns a literal string every path fully matching `regex` starts with.
+
+    The prefix is only used to prune the searched paths, so it is fine for it
+    to be shorter than possible (an empty prefix disables pruning).
+    """
+    depth = 0
+    escaped = False
+    in_class = False
+    for c in regex:
+        if escaped:
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif in_class:
+            in_class = c != ']'
+        elif c == '[':
+            in_class = True
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            return ''
+
+    prefix = ''
+    i = 0
+    while i < len(regex):
+        c = regex[i]
+        if c == '\\':
+            if i + 1 < len(regex) and not regex[i + 1].isalnum():
+                c = regex[i + 1]
+                i += 1
+            else:
+                break
+        elif c in '.^$*+?{}[]|()':
+            break
+        i += 1
+        if i < len(regex) and regex[i] in '*?{':
+            # The last literal is optional
+            break
+        prefix += c
+    return prefix
+
+
+_STORED_EXTENSIONS = {'.pdf', '.png', '.jpg', '.jpeg', '.gif', '.odg', '.zip', '.gz', '.bz2', '.xz', '.7z'}
+""" Extensions of already compressed files, which are stored without compression. """
+
+_SPOOL_SIZE = 8 << 20
+""" Compressed members larger than this are spooled to disk while saving. """
+
+
+_FICLONE = 0x40049409
+""" Linux ioctl sharing all blocks of a file with another one (reflink). """
+
+
+def _clone(src: str, dst: str) -> None:
+    """ Copies a file, sharing its blocks if the filesystem supports reflinks. """
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_digest(path: str, dev: int, ino: int, size: int, mtime_ns: int) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def _digest(path: str) -> bytes:
+    """ Returns a digest of file contents, cached until the file changes. """
+    stat = os.stat(path)
+    return _cached_digest(path, stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+@contextlib.contextmanager
+def _index_locks(packages: List['Package']) -> Generator[None, None, None]:
+    """ Holds index locks of packages, taken in a fixed order, so that
+    threads adding files between two packages in both directions do not
+    deadlock. """
+    with contextlib.ExitStack() as stack:
+        for package in sorted(set(packages), key=id):
+            stack.enter_context(package._index_lock)
+        yield
+
+
+def _renamed(info: zipfile.ZipInfo, arcname: str) -> zipfile.ZipInfo:
+    """ Returns a copy of the info of a compressed member under another name. """
+    copy = zipfile.ZipInfo(arcname, info.date_time)
+    for attr in ('compress_type', 'external_attr', 'flag_bits', 'CRC', 'compress_size', 'file_size'):
+        setattr(copy, attr, getattr(info, attr))
+    return copy
+
+
+def _raw_member(source: BinaryIO, source_info: zipfile.ZipInfo, arcname: str) -> zipfile.ZipInfo:
+    """ Prepares a copy of a .zip member without recompressing it.
+
+    Seeks `source` to the compressed bytes of the member and returns the info
+    of the copy, with the CRC and sizes taken as they are from `source_info`.
+
+    :param source: Source .zip file opened for binary reading.
+
+    :param source_info: Info of the copied member of `source`.
+
+    :param arcname: Name of the copy.
+
+    :return: Info of the copy.
+    """
+    source.seek(source_info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, source.read(zipfile.sizeFileHeader))
+    if header[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f'Bad local header of {source_info.filename}')
+    source.seek(header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH], os.SEEK_CUR)
+
+    info = zipfile.ZipInfo(arcname, source_info.date_time)
+    info.external_attr = (S_IFREG | 0o644) << 16
+    info.compress_type = source_info.compress_type
+    info.extract_version = source_info.extract_version
+    # Keep only the compression option bits, the sizes are known up front
+    info.flag_bits = source_info.flag_bits & 0x6
+    info.CRC = source_info.CRC
+    info.compress_size = source_info.compress_size
+    info.file_size = source_info.file_size
+    return info
+
+
+def _write_member(zip: zipfile.ZipFile, info: zipfile.ZipInfo, data: BinaryIO) -> None:
+    """ Appends an already compressed member to a .zip file.
+
+    :param zip: Output .zip file opened for writing.
+
+    :param info: Info of the member with CRC and sizes set.
+
+    :param data: File positioned at `info.compress_size` compressed bytes.
+    """
+    zip64 = max(info.file_size, info.compress_size) > zipfile.ZIP64_LIMIT
+    info.header_offset = zip.fp.tell()
+    zip.fp.write(info.FileHeader(zip64))
+    remaining = info.compress_size
+    while remaining:
+        chunk = data.read(min(remaining, 1 << 20))
+        if not chunk:
+            raise zipfile.BadZipFile(f'Truncated member {info.filename}')
+        zip.fp.write(chunk)
+        remaining -= len(chunk)
+    zip.filelist.append(info)
+    zip.NameToInfo[info.filename] = info
+    zip.start_dir = zip.fp.tell()
+    zip._didModify = True
 
 
 class Package:
@@ -11,13 +190,25 @@ class Package:
 
     Package has a short string `ID`.
     Files inside the package can be referred to by package-root-relative
-    *local paths*.
+    *local paths*. Files may be added and looked up from multiple threads.
+
+    Files with identical contents are stored once. Files added from other
+    packages and duplicates are hardlinked, and the sharing is broken
+    before a path of a shared file is handed out for writing by `abspath`.
     """
     _source: str
     _tmp_dir: tempfile.TemporaryDirectory
     _id: str
+    _index: List[str]
+    _pending: Set[str]
+    _members: Dict[str, zipfile.ZipInfo]
+    _extracted: Dict[str, Tuple[int, int]]
+    _refs: Dict[str, Tuple['Package', str]]
+    _shared: Set[str]
+    _contents: Dict[str, int]
+    _sizes: Dict[int, Set[str]]
 
-    def __init__(self, *, zip: str = None, id: str = None):
+    def __init__(self, *, zip: str = None, id: str = None, lazy: bool = False):
         """ Creates or loads a package.
 
         The only requirement on the loaded task package is that the .zip file
@@ -30,24 +221,61 @@ class Package:
 
         :param id: If `id` is specified and `zip` is not, a new package with
             specified ID is created.
+
+        :param lazy: If set, the .zip file is not extracted up front. Members
+            are listed from the central directory and extracted only when
+            a filesystem path is requested (see `abspath` and `materialize`).
         """
 
         assert zip or id
         self._tmp_dir = tempfile.TemporaryDirectory()
-        if zip:
+        self._index = []
+        self._pending = set()
+        self._members = {}
+        self._extracted = {}
+        self._refs = {}
+        self._shared = set()
+        self._contents = {}
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._index_lock = threading.RLock()
+        self._zips = threading.local()
+        if zip and lazy:
+            self._source = zip
+            infos = [i for i in zipfile.ZipFile(zip, mode='r').infolist() if not i.is_dir()]
+            dirs = {i.filename.split('/', 1)[0] for i in infos}
+            assert len(dirs) == 1, 'One package directory expected'
+            self._id = dirs.pop()
+            assert not id or self.id == id, 'Wrong task ID'
+            self._members = {i.filename[len(self.id) + 1:]: i for i in infos}
+            os.mkdir(self.root, mode=0o755)
+            self._index = sorted(self._members)
+            stats.count('load.files', len(self._index))
+            stats.count('load.bytes_read', os.path.getsize(zip))
+            return
+        elif zip:
             self._source = zip
             zipfile.ZipFile(zip, mode='r').extractall(self._tmp_dir.name)
             dirs = os.listdir(self._tmp_dir.name)
             assert len(dirs) == 1, 'One package directory expected'
             self._id = dirs[0]
             assert not id or self.id == id, 'Wrong task ID'
+            stats.count('load.bytes_read', os.path.getsize(zip))
         elif id:
             self._id = id
             os.mkdir(os.path.join(self._tmp_dir.name, id), mode=0o755)
+        self._build_index()
+        if zip:
+            stats.count('load.files', len(self._index))
 
     def __del__(self):
         self._tmp_dir.cleanup()
 
+    @property
+    def lazy(self) -> bool:
+        """ Returns true if the package is backed by a lazily extracted .zip file. """
+        return bool(self._members)
+
     @property
     def id(self) -> str:
         """ Returns task ID. """
@@ -58,40 +286,489 @@ class Package:
         """ Returns path of package's root directory. """
         return os.path.join(self._tmp_dir.name, self.id)
 
-    def abspath(self, local_path: str) -> str:
-        """ Converts a local path to an absolute path. """
+    def abspath(self, local_path: str, *, write: bool = False) -> str:
+        """ Converts a local path to an absolute path.
+
+        The returned path may be used to create a file, so unindexed paths
+        are remembered and checked for existence by the next `find`.
+        Members of a lazy package and files added with `add_from` are
+        materialized on disk first.
+
+        :param write: Must be set if an existing file may be modified through
+            the returned path, so that a file sharing contents with other
+            files gets a private copy. Creating a new file needs no flag.
+        """
+        with self._index_lock:
+            indexed = self._indexed(local_path)
+            if not indexed:
+                self._pending.add(local_path)
+        if indexed and (local_path in self._refs or local_path in self._members):
+            with self._lock:
+                self._materialize(local_path)
+        if write and indexed and local_path in self._shared:
+            self._unshare(local_path)
         return os.path.join(self.root, local_path)
 
+    def _unshare(self, local_path: str) -> None:
+        """ Replaces a hardlinked file with a private copy. """
+        with self._index_lock:
+            if local_path not in self._shared:
+                return
+            path = os.path.join(self.root, local_path)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            os.close(fd)
+            _clone(path, tmp_path)
+            shutil.copystat(path, tmp_path)
+            os.replace(tmp_path, path)
+            self._shared.discard(local_path)
+        self._forget(local_path)
+
+    def _forget(self, local_path: str) -> None:
+        """ Stops offering a file which may change as a duplicate of added files. """
+        with self._index_lock:
+            size = self._contents.pop(local_path, None)
+            if size is not None:
+                self._sizes[size].discard(local_path)
+
+    def _duplicate(self, path: str, size: int, target: str) -> Optional[str]:
+        """ Finds an added file with the contents of `path`.
+
+        Files are hashed only if an added file has the same size.
+
+        :return: Local path of the file or None.
+        """
+        with self._index_lock:
+            candidates = sorted(self._sizes.get(size, set()) - {target})
+        if not candidates:
+            return None
+        digest = _digest(path)
+        for candidate in candidates:
+            try:
+                if _digest(os.path.join(self.root, candidate)) == digest:
+                    return candidate
+            except FileNotFoundError:
+                pass
+        return None
+
+    def _zip(self) -> zipfile.ZipFile:
+        """ Returns the source .zip file opened for the calling thread. """
+        if not hasattr(self._zips, 'zip'):
+            self._zips.zip = zipfile.ZipFile(self._source, mode='r')
+        return self._zips.zip
+
+    def _materialize(self, local_path: str) -> None:
+        """ Writes a lazy member or a referenced file to disk, if necessary. """
+        if local_path in self._refs:
+            package, source_path = self._refs[local_path]
+            target_path = os.path.join(self.root, local_path)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True, mode=0o755)
+            with package.open(source_path) as src, open(target_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            del self._refs[local_path]
+        elif local_path in self._members and local_path not in self._extracted:
+            # ZipFile.extract creates missing directories without exist_ok, which races between threads
+            os.makedirs(os.path.dirname(os.path.join(self.root, local_path)), exist_ok=True, mode=0o755)
+            path = self._zip().extract(self._members[local_path], self._tmp_dir.name)
+            stat = os.stat(path)
+            self._extracted[local_path] = (stat.st_size, stat.st_mtime_ns)
+            stats.count('extract.files')
+            stats.count('extract.bytes_written', stat.st_size)
+
+    def materialize(self, local_paths: Iterable[str], *, threads: Optional[int] = None) -> List[str]:
+        """ Makes sure that files are present on disk and returns their paths
+        for reading (see `abspath`).
+
+        Lazy members are extracted in parallel.
+
+        :param local_paths: Local paths of the files.
+
+        :param threads: Number of threads used for extraction.
+
+        :return: Absolute paths of the files, in order of `local_paths`.
+        """
+        local_paths = list(local_paths)
+        missing = [p for p in local_paths
+                   if p in self._refs or (p in self._members and p not in self._extracted)]
+        if missing:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(self._materialize, missing))
+        return [self.abspath(p) for p in local_paths]
+
+    def _origin(self, local_path: str) -> Optional[Tuple['Package', zipfile.ZipInfo]]:
+        """ Finds the unmodified .zip member a file comes from.
+
+        :return: The lazy package and the member info, or None if the file
+            is not backed by a member or might have been modified on disk.
+        """
+        if local_path in self._refs:
+            package, source_path = self._refs[local_path]
+            return package._origin(source_path)
+        if local_path not in self._members:
+            return None
+        if local_path in self._extracted:
+            try:
+                stat = os.stat(os.path.join(self.root, local_path))
+            except FileNotFoundError:
+                return None
+            if self._extracted[local_path] != (stat.st_size, stat.st_mtime_ns):
+                return None
+        return self, self._members[local_path]
+
+    def open(self, local_path: str) -> BinaryIO:
+        """ Opens a file in the package for binary reading.
+
+        Unlike `abspath`, does not require the file to be present on disk.
+        """
+        if local_path in self._refs:
+            package, source_path = self._refs[local_path]
+            return package.open(source_path)
+        if local_path in self._members and local_path not in self._extracted:
+            return self._zip().open(self._members[local_path])
+        return open(os.path.join(self.root, local_path), 'rb')
+
+    def size(self, local_path: str) -> int:
+        """ Returns the size of a file in bytes, without extracting it. """
+        if local_path in self._refs:
+            package, source_path = self._refs[local_path]
+            return package.size(source_path)
+        if local_path in self._members and local_path not in self._extracted:
+            return self._members[local_path].file_size
+        return os.path.getsize(os.path.join(self.root, local_path))
+
+    def crc(self, local_path: str) -> Tuple[int, int]:
+        """ Returns the CRC-32 and the size of a file.
+
+        Both are taken from the central directory for unmodified members of
+        lazy packages, other files are read.
+        """
+        origin = self._origin(local_path)
+        if origin:
+            return origin[1].CRC, origin[1].file_size
+        crc, size = 0, 0
+        with self.open(local_path) as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+        return crc, size
+
+    def _build_index(self) -> None:
+        """ Builds the sorted index of local paths by walking the package. """
+        self._index = sorted(os.path.relpath(os.path.join(root, name), self.root)
+                             for root, dirs, files in os.walk(self.root)
+                             for name in files)
+        self._pending.clear()
+
+    def _indexed(self, local_path: str) -> bool:
+        """ Checks if `local_path` is in the index. """
+        i = bisect.bisect_left(self._index, local_path)
+        return i < len(self._index) and self._index[i] == local_path
+
+    def _insert(self, local_path: str) -> None:
+        """ Inserts `local_path` into the index unless already present. """
+        with self._index_lock:
+            i = bisect.bisect_left(self._index, local_path)
+            if i == len(self._index) or self._index[i] != local_path:
+                self._index.insert(i, local_path)
+
+    def _flush_pending(self) -> None:
+        """ Indexes files created through paths returned by `abspath`. """
+        with self._index_lock:
+            for local_path in self._pending:
+                if os.path.isfile(os.path.join(self.root, local_path)):
+                    self._insert(local_path)
+            self._pending.clear()
+
     def find(self, regex: str) -> Generator[str, None, None]:
         """ Yields all files which local paths match `regex`.
 
+        Only the indexed paths sharing the literal prefix of `regex` are
+        matched, in sorted order.
+
         :param regex: Regular expression to match paths with.
             Note that local paths contain no leading slash.
         """
-        for root, dirs, files in os.walk(self.root):
-            for name in files:
-                path = os.path.relpath(os.path.join(root, name), self.root)
-                if re.fullmatch(regex, path):
-                    yield path
+        pattern = _compile(regex)
+        prefix = _literal_prefix(regex)
+        with self._index_lock:
+            self._flush_pending()
+            lo = bisect.bisect_left(self._index, prefix)
+            hi = bisect.bisect_left(self._index, prefix + '\U0010ffff') if prefix else len(self._index)
+            paths = self._index[lo:hi]
+        for path in paths:
+            if pattern.fullmatch(path):
+                yield path
 
     def add(self, path: str, target: str) -> None:
         """ Adds a file to the package.
 
+        If the package already has a file with identical contents, the file
+        is hardlinked to it. Otherwise it is copied, sharing the blocks with
+        `path` if the filesystem supports reflinks.
+
         :param path: Path of a file to add to the package.
 
         :param target: Local path for the target.
         """
-        target_path = self.abspath(target)
+        self._add(path, target)
+
+    def _add(self, path: str, target: str, owner: Optional[Tuple['Package', str]] = None) -> None:
+        """ Adds a file to the package, see `add`.
+
+        :param owner: Package and local path of `path` if it is a file of
+            another package, which is then hardlinked instead of copied.
+        """
+        target_path = os.path.join(self.root, target)
         os.makedirs(os.path.dirname(target_path), exist_ok=True, mode=0o755)
-        shutil.copyfile(path, target_path)
+        size = os.path.getsize(path)
+        self._forget(target)
+        duplicate = self._duplicate(path, size, target)
+        with _index_locks([self, owner[0]] if owner else [self]):
+            self._shared.discard(target)
+            if os.path.lexists(target_path):
+                os.remove(target_path)
+            if duplicate not in self._sizes.get(size, set()):
+                # Forgotten while hashing, so it may have changed
+                duplicate = None
+            linked = (self, duplicate) if duplicate else owner
+            try:
+                if linked:
+                    os.link(os.path.join(linked[0].root, linked[1]), target_path)
+            except OSError:
+                linked = None
+            if linked:
+                self._shared.add(target)
+                linked[0]._shared.add(linked[1])
+                stats.count('add.files_linked')
+            else:
+                _clone(path, target_path)
+                stats.count('add.files_copied')
+                stats.count('add.bytes_written', size)
+            self._contents[target] = size
+            self._sizes.setdefault(size, set()).add(target)
+            self._refs.pop(target, None)
+            self._insert(target)
+
+    def add_from(self, package: 'Package', local_path: str, target: str) -> None:
+        """ Adds a file from another package to the package.
 
-    def save(self, path: str, overwrite: bool = False) -> None:
+        Unmodified members of lazy packages are not copied, but referenced
+        until a path on disk is requested or the package is saved. Saving
+        copies them without recompression.
+
+        :param package: Package containing the file.
+
+        :param local_path: Local path of the file in `package`.
+
+        :param target: Local path for the target.
+        """
+        if local_path in package._refs:
+            ref = package._refs[local_path]
+        elif package._origin(local_path):
+            ref = (package, local_path)
+        else:
+            self._add(os.path.join(package.root, local_path), target, owner=(package, local_path))
+            return
+        target_path = os.path.join(self.root, target)
+        # The directory is created as for a copied file, other files may be created next to the target
+        os.makedirs(os.path.dirname(target_path), exist_ok=True, mode=0o755)
+        self._forget(target)
+        with self._index_lock:
+            self._shared.discard(target)
+            if os.path.lexists(target_path):
+                os.remove(target_path)
+            self._refs[target] = ref
+            self._insert(target)
+
+    @staticmethod
+    def _stored(local_path: str, compresslevel: Optional[int]) -> bool:
+        """ Checks if a file is saved without compression. """
+        return compresslevel == 0 or os.path.splitext(local_path)[1].lower() in _STORED_EXTENSIONS
+
+    def _unchanged(self, local_path: str, info: zipfile.ZipInfo, compresslevel: Optional[int]) -> bool:
+        """ Checks if a member of another .zip file has the contents of a file
+        and the compression method `save` would use for it. """
+        method = zipfile.ZIP_STORED if self._stored(local_path, compresslevel) else zipfile.ZIP_DEFLATED
+        if info.flag_bits & 0x1 or info.compress_type != method or info.file_size != self.size(local_path):
+            return False
+        return self.crc(local_path) == (info.CRC, info.file_size)
+
+    def _compress(self, local_path: str, compresslevel: Optional[int]) -> Tuple[zipfile.ZipInfo, BinaryIO]:
+        """ Compresses a file for `save`.
+
+        Already compressed file types and all files when `compresslevel`
+        is 0 are stored without compression.
+
+        :return: Info of the member and a file positioned at its compressed bytes.
+        """
+        info = zipfile.ZipInfo(os.path.join(self.id, local_path), self.date_time(local_path))
+        info.external_attr = (S_IFREG | 0o644) << 16
+        if local_path not in self._refs and local_path not in self._members:
+            info.external_attr = (os.stat(os.path.join(self.root, local_path)).st_mode & 0xFFFF) << 16
+        if self._stored(local_path, compresslevel):
+            info.compress_type = zipfile.ZIP_STORED
+            compressor = None
+        else:
+            info.compress_type = zipfile.ZIP_DEFLATED
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel,
+                                          zlib.DEFLATED, -15)
+        info.CRC = 0
+        data = tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+        with self.open(local_path) as src:
+            for chunk in iter(lambda: src.read(1 << 20), b''):
+                info.CRC = zlib.crc32(chunk, info.CRC)
+                info.file_size += len(chunk)
+                data.write(compressor.compress(chunk) if compressor else chunk)
+        if compressor:
+            data.write(compressor.flush())
+        info.compress_size = data.tell()
+        data.seek(0)
+        return info, data
+
+    def save(self, path: str, overwrite: bool = False, *,
+             threads: Optional[int] = None, compresslevel: Optional[int] = None,
+             reuse: Optional[str] = None, comment: bytes = b'') -> None:
         """ Exports a Package to a .zip file.
 
+        Files are compressed in parallel and written in order of their local
+        paths. Unmodified members of lazy packages compressed with the method
+        chosen for them are copied without recompression, and hardlinked
+        files are compressed once.
+
         :param path: Output .zip file.
 
         :param overwrite: If true, allows to overwrite output file.
+
+        :param threads: Number of threads compressing the files.
+
+        :param compresslevel: Deflate compression level, from 0 (no
+            compression) to 9. Defaults to zlib's default level.
+
+        :param reuse: An optional previous output, e.g. `path` itself. Its
+            members with the same names, contents (judging by CRC-32 and
+            size) and compression methods as the saved files are copied
+            without recompression. If it is `path`, the output is written
+            to a temporary file replacing `path` once complete.
+
+        :param comment: Comment of the .zip file, at most 65535 bytes.
         """
-        zip = zipfile.ZipFile(path, mode=('x' if not overwrite else 'w'))
+        start = time.perf_counter()
+        threads = threads or os.cpu_count() or 1
+        previous = zipfile.ZipFile(reuse) if reuse and os.path.exists(reuse) else None
+        members = []
+        reused = 0
+        # Hardlinked files with the same compression are compressed once
+        copies = collections.Counter()
         for p in self.find('.*'):
-            zip.write(self.abspath(p), os.path.join(self.id, p))
\ No newline at end of file
+            origin = self._origin(p)
+            info = previous and previous.NameToInfo.get(os.path.join(self.id, p))
+            if origin and self._unchanged(p, origin[1], compresslevel):
+                members.append((p, (origin[0]._source, origin[1]), None))
+            elif info and self._unchanged(p, info, compresslevel):
+                members.append((p, (reuse, info), None))
+                reused += 1
+            elif origin:
+                # Members compressed with another method are recompressed, once for all their references
+                key = (origin[0]._source, origin[1].filename, self._stored(p, compresslevel))
+                copies[key] += 1
+                members.append((p, None, key))
+            else:
+                stat = os.stat(os.path.join(self.root, p))
+                key = (stat.st_dev, stat.st_ino, self._stored(p, compresslevel))
+                copies[key] += 1
+                members.append((p, None, key))
+        duplicates = sum(copies.values()) - len(copies)
+        if previous:
+            previous.close()
+
+        output = path
+        if reuse and os.path.exists(path) and os.path.samefile(reuse, path):
+            if not overwrite:
+                raise FileExistsError(path)
+            fd, output = tempfile.mkstemp(suffix='.zip', dir=os.path.dirname(os.path.abspath(path)))
+            os.close(fd)
+            os.chmod(output, os.stat(path).st_mode & 0o777)
+        try:
+            written = self._write(output, overwrite or output != path, members, copies, threads,
+                                  compresslevel, comment)
+            if output != path:
+                os.replace(output, path)
+        finally:
+            if output != path and os.path.exists(output):
+                os.remove(output)
+        elapsed = time.perf_counter() - start
+        stats.count('save.files', len(members))
+        stats.count('save.files_raw', sum(raw is not None for _, raw, _ in members))
+        stats.count('save.files_reused', reused)
+        stats.count('save.bytes_read', written)
+        stats.count('save.bytes_written', os.path.getsize(path))
+        log.info('Saved %.1f MB to %s in %.2fs (%.1f MB/s)', written / 2**20, path, elapsed,
+                 written / 2**20 / max(elapsed, 1e-9))
+        if duplicates:
+            log.debug('Compressed %d duplicate file(s) once', duplicates)
+        if reused:
+            log.info('Reused %d unchanged file(s) of %s', reused, reuse)
+
+    def _write(self, path: str, overwrite: bool, members: List[tuple], copies: collections.Counter,
+               threads: int, compresslevel: Optional[int], comment: bytes) -> int:
+        """ Writes the members planned by `save` to a .zip file.
+
+        :param members: Local paths with either a .zip file and a member
+            copied raw, or a key of the hardlinked files compressed once.
+
+        :param copies: Numbers of members sharing each key.
+
+        :return: Total size of the written files, uncompressed.
+        """
+        sources = {}
+        compressed = {}
+        pending = collections.deque()
+        written = 0
+        with zipfile.ZipFile(path, mode=('x' if not overwrite else 'w')) as zip, \
+                ThreadPoolExecutor(max_workers=threads) as executor:
+            zip.comment = comment
+
+            def write_next() -> int:
+                arcname, job, key = pending.popleft()
+                if isinstance(job, Future):
+                    info, data = job.result()
+                    if info.filename != arcname:
+                        info = _renamed(info, arcname)
+                        data.seek(0)
+                    _write_member(zip, info, data)
+                    copies[key] -= 1
+                    if not copies[key]:
+                        data.close()
+                else:
+                    source, source_info = job
+                    info = _raw_member(source, source_info, arcname)
+                    _write_member(zip, info, source)
+                return info.file_size
+
+            for p, raw, key in members:
+                arcname = os.path.join(self.id, p)
+                if raw:
+                    source, source_info = raw
+                    if source not in sources:
+                        sources[source] = open(source, 'rb')
+                    pending.append((arcname, (sources[source], source_info), None))
+                else:
+                    if key not in compressed:
+                        compressed[key] = executor.submit(self._compress, p, compresslevel)
+                    pending.append((arcname, compressed[key], key))
+                # Bounds the memory used by compressed files waiting to be written
+                while len(pending) > 2 * threads:
+                    written += write_next()
+            while pending:
+                written += write_next()
+        for f in sources.values():
+            f.close()
+        return written
+
+    def date_time(self, local_path: str) -> Tuple[int, int, int, int, int, int]:
+        """ Returns modification time of a file as used by .zip files. """
+        if local_path in self._refs:
+            package, source_path = self._refs[local_path]
+            return package.date_time(source_path)
+        if local_path in self._members:
+            return self._members[local_path].date_time
+        return zipfile.ZipInfo.from_file(os.path.join(self.root, local_path)).date_time
@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sinolify.utils import stats
+
+
+class Stage(NamedTuple):
+    """ A step of a job run by `run_stages`.
+
+    The output of a stage is the value returned by `run`, named after the
+    stage. `run` is called with the outputs of `inputs` as positional
+    arguments, after these and the `after` stages are finished.
+    """
+    name: str
+    run: Callable[..., Any]
+    inputs: Tuple[str, ...] = ()
+    after: Tuple[str, ...] = ()
+
+
+def _order(stages: Sequence[Stage]) -> List[Stage]:
+    """ Sorts stages topologically, keeping the given order where possible.
+
+    :raises ValueError: If a dependency is unknown or cyclic.
+    """
+    names = {s.name for s in stages}
+    for s in stages:
+        for d in s.inputs + s.after:
+            if d not in names:
+                raise ValueError(f'Stage {s.name} depends on unknown stage {d}')
+    ordered, done, left = [], set(), list(stages)
+    while left:
+        ready = [s for s in left if set(s.inputs + s.after) <= done]
+        if not ready:
+            raise ValueError('Cyclic dependencies between stages ' + ', '.join(s.name for s in left))
+        ordered.append(ready[0])
+        done.add(ready[0].name)
+        left.remove(ready[0])
+    return ordered
+
+
+def run_stages(stages: Sequence[Stage], *, threads: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """ Runs stages in parallel, respecting their dependencies.
+
+    If a stage fails, no more stages are started and, once the running
+    ones finish, the exception is raised.
+
+    :param stages: Stages to run.
+
+    :param threads: Maximal number of stages run at once. Defaults to the
+        number of stages. With 1, stages run serially in topological order.
+
+    :return: Outputs and wall times in seconds of the stages, by name.
+    """
+    ordered = _order(stages)
+    outputs, times = {}, {}
+
+    def run(stage: Stage) -> Any:
+        start = time.perf_counter()
+        try:
+            with stats.span(f'stage.{stage.name}'):
+                return stage.run(*[outputs[i] for i in stage.inputs])
+        finally:
+            times[stage.name] = time.perf_counter() - start
+
+    if threads == 1:
+        for stage in ordered:
+            outputs[stage.name] = run(stage)
+        return outputs, times
+
+    left = list(ordered)
+    running: Dict[Future, Stage] = {}
+    failed = None
+    with ThreadPoolExecutor(max_workers=threads or max(len(stages), 1)) as executor:
+        while left or running:
+            if not failed:
+                for stage in [s for s in left if set(s.inputs + s.after) <= outputs.keys()]:
+                    running[executor.submit(run, stage)] = stage
+                    left.remove(stage)
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                if future.exception() is not None:
+                    failed = failed or future
+                else:
+                    outputs[stage.name] = future.result()
+    if failed:
+        failed.result()
+    return outputs, times
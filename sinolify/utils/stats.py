@@ -0,0 +1,117 @@
+import contextlib
+import os
+import resource
+import threading
+import time
+from typing import Any, Dict, Generator, List, Optional
+
+
+class Recorder:
+    """ Collects spans, counters and records of a run, see `recording`.
+
+    A *span* is a named section of code with its wall time and the CPU
+    time of the thread running it. *Counters* sum numbers, e.g. bytes
+    written. *Records* are lists of events, e.g. measurements of tests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._times = os.times()
+        self.spans: List[Dict[str, Any]] = []
+        self.counters: Dict[str, float] = {}
+        self.records: Dict[str, List[Dict[str, Any]]] = {}
+
+    def add_span(self, name: str, start: float, wall: float, cpu: float, attrs: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(dict(name=name, start=start - self._start, wall=wall, cpu=cpu,
+                                   thread=threading.current_thread().name, **attrs))
+
+    def count(self, name: str, value: float) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name: str, values: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records.setdefault(name, []).append(values)
+
+    def report(self) -> Dict[str, Any]:
+        """ Returns the report as a JSON serializable dictionary.
+
+        Besides the collected data, the report contains totals of the spans
+        by name and resource usage of the process and its children: CPU
+        times since the recording started and peak RSS in kilobytes.
+        """
+        times = os.times()
+        with self._lock:
+            totals = {}
+            for span in self.spans:
+                total = totals.setdefault(span['name'], {'count': 0, 'wall': 0.0, 'cpu': 0.0})
+                total['count'] += 1
+                total['wall'] += span['wall']
+                total['cpu'] += span['cpu']
+            return {
+                'spans': list(self.spans),
+                'totals': totals,
+                'counters': dict(self.counters),
+                'records': {name: list(records) for name, records in self.records.items()},
+                'resources': {
+                    'wall': time.perf_counter() - self._start,
+                    'cpu_user': times.user - self._times.user,
+                    'cpu_system': times.system - self._times.system,
+                    'children_cpu_user': times.children_user - self._times.children_user,
+                    'children_cpu_system': times.children_system - self._times.children_system,
+                    'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                    'children_peak_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+                },
+            }
+
+
+_recorder: Optional[Recorder] = None
+""" The active recorder, shared by all threads. """
+
+
+@contextlib.contextmanager
+def recording() -> Generator[Recorder, None, None]:
+    """ Collects spans, counters and records within the block.
+
+    Without an active recorder, `span`, `count` and `record` do nothing.
+    """
+    global _recorder
+    previous, _recorder = _recorder, Recorder()
+    try:
+        yield _recorder
+    finally:
+        _recorder = previous
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs) -> Generator[Dict[str, Any], None, None]:
+    """ Measures wall and CPU time of the block.
+
+    :param name: Name of the span, e.g. `compile`.
+
+    :param attrs: Attributes stored with the span. The block may add more
+        to the yielded dictionary.
+    """
+    recorder = _recorder
+    if recorder is None:
+        yield attrs
+        return
+    start, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield attrs
+    finally:
+        recorder.add_span(name, start, time.perf_counter() - start, time.thread_time() - cpu, attrs)
+
+
+def count(name: str, value: float = 1) -> None:
+    """ Adds `value` to a counter, e.g. `save.bytes_written`. """
+    if _recorder is not None:
+        _recorder.count(name, value)
+
+
+def record(name: str, **values) -> None:
+    """ Appends an event to a list of records, e.g. `measurement`. """
+    if _recorder is not None:
+        _recorder.record(name, values)
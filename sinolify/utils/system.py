@@ -1,12 +1,34 @@
-from distutils.spawn import find_executable
+import functools
+import os
+import shutil
 
 
 class NotInstalledError(FileNotFoundError):
     pass
 
 
+@functools.lru_cache(maxsize=None)
 def where(name: str) -> str:
-    path = find_executable(name)
+    """ Returns the path of an executable found in $PATH.
+
+    Successful lookups are cached for the lifetime of the process.
+
+    :raises NotInstalledError: If the executable is not found.
+    """
+    path = shutil.which(name)
     if not path:
         raise NotInstalledError(name)
     return path
+
+
+def cache_dir(name: str) -> str:
+    """ Returns a directory for persistent cache `name`, creating it if needed.
+
+    The caches are kept in $SINOLIFY_CACHE, or in sinolify/ subdirectory of
+    $XDG_CACHE_HOME (~/.cache by default).
+    """
+    root = os.environ.get('SINOLIFY_CACHE') or \
+        os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'sinolify')
+    path = os.path.join(root, name)
+    os.makedirs(path, exist_ok=True)
+    return path